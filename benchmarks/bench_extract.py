@@ -0,0 +1,82 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+import preprocessing.get_data as get_data
+import preprocessing.extract as extract
+import main_process
+from benchmarks.synthetic import synthetic_logs
+
+SIZE = 5000
+
+
+def read_only(files):
+    '''
+    Reads the lines of the log files 'files' without extracting them (bound
+    of the extraction set by the disk).
+    '''
+    for file in files:
+        with open(file, encoding='utf-8', errors='replace') as f:
+            for line in f:
+                pass
+
+
+def sequential_count(file):
+    '''
+    Extraction of main_extract.go: the substitutions applied one after the
+    other on the whole content of the log.
+    '''
+    with open(file, encoding='utf-8', errors='replace') as f:
+        txt = f.read().replace('\n', ' ')
+    for regex, replacement in extract.SUBSTITUTIONS:
+        txt = regex.sub(replacement, txt)
+    words = [extract.stem(w) for w in txt.lower().split()]
+    words = [w for w in words if len(w) > 2 and w not in extract.STOP_WORDS]
+
+    dic = [{} for n in range(get_data.MAX_NGRAM)]
+    for n in range(1, get_data.MAX_NGRAM + 1):
+        for i in range(len(words) - n + 1):
+            w = '_'.join(words[i:i + n])
+            dic[n - 1][w] = dic[n - 1].get(w, 0) + 1
+    return dic
+
+
+def timed(fun, *args, **kwargs):
+    start_time = time.time()
+    res = fun(*args, **kwargs)
+    return res, time.time() - start_time
+
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else SIZE
+    path = tempfile.mkdtemp() + '/'
+    try:
+        nbr_bytes = synthetic_logs(path, size)
+        files = [path + f for f in sorted(os.listdir(path))]
+        print('Synthetic raw logs:', size, 'jobs,', round(nbr_bytes / 2**20, 1), 'MB,',
+              os.cpu_count(), 'cores')
+
+        _, read_time = timed(read_only, files)
+        REF, seq_time = timed(lambda: [sequential_count(f) for f in files])
+        runs = [('read only', read_time), ('sequential', seq_time)]
+        for workers in sorted({1, os.cpu_count()}):
+            extract.chunk_words.cache_clear()
+            extract.stem.cache_clear()
+            P = main_process.Experiment(path, raw_logs=True, workers=workers)
+            DATA, run_time = timed(get_data.get_data, P)
+            COUNTS = [[DATA["word_count_ngram_" + str(n + 1)][i]
+                       for n in range(get_data.MAX_NGRAM)] for i in range(DATA.shape[0])]
+            assert COUNTS == REF, 'different word counts'
+            runs.append(('extract %d proc' % workers, run_time))
+
+        list = ['Extraction', 'time (s)', 'MB/s', 'jobs/s']
+        print('{:16s} | {:10s} {:10s} {:10s} |'.format(*list))
+        print('-' * 52)
+        for name, run_time in runs:
+            list = [name, str(round(run_time, 2)), str(round(nbr_bytes / 2**20 / run_time, 1)),
+                    str(round(size / run_time))]
+            print('{:16s} | {:10s} {:10s} {:10s} |'.format(*list))
+    finally:
+        shutil.rmtree(path)
@@ -0,0 +1,51 @@
+import time
+import pandas as pd
+
+import preprocessing.get_data as get_data
+from benchmarks.synthetic import synthetic_data
+
+SIZES = [10000, 100000, 1000000]
+MAX_SIZE_LEGACY = 10000  # the legacy implementation is quadratic
+
+
+def flaky_state_all_legacy(res):
+    '''
+    Previous implementation of get_data.flaky_state_all, mapping each row to its
+    group with a search in the list of groups (O(rows x groups)).
+    '''
+    list_aggr = ["commitID", "jobName"]
+    COMJOB_mean_status = res.groupby(list_aggr)["status"].mean()
+    COMJOB_flaky_state = get_data.flaky_state(COMJOB_mean_status.to_numpy()).tolist()
+
+    indexes = [a for a in COMJOB_mean_status.index]
+
+    all_flaky_state_res = [COMJOB_flaky_state[indexes.index((a, b))] for a, b in zip(
+        res["commitID"].tolist(), res["jobName"].tolist())]
+
+    res["flaky"] = pd.Series(all_flaky_state_res, index=res.index)
+    return res
+
+
+def timed(fun, res):
+    start_time = time.time()
+    res = fun(res)
+    return res, time.time() - start_time
+
+
+if __name__ == "__main__":
+    list = ['Jobs', 'Groups', 'groupby (s)', 'legacy (s)']
+    print('{:10s} | {:10s} {:12s} {:12s} |'.format(*list))
+    print('-' * 51)
+    for size in SIZES:
+        res = synthetic_data(size).drop(columns="flaky")
+        n_groups = res.groupby(["commitID", "jobName"]).ngroups
+
+        new, new_time = timed(get_data.flaky_state_all, res.copy())
+        legacy_time = '-'
+        if size <= MAX_SIZE_LEGACY:
+            legacy, legacy_time = timed(flaky_state_all_legacy, res.copy())
+            assert legacy["flaky"].tolist() == new["flaky"].tolist()
+            legacy_time = str(round(legacy_time, 3))
+
+        list = [str(size), str(n_groups), str(round(new_time, 3)), legacy_time]
+        print('{:10s} | {:10s} {:12s} {:12s} |'.format(*list))
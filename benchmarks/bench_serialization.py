@@ -0,0 +1,85 @@
+import os
+import sys
+import time
+import pickle
+import shutil
+import tempfile
+
+import preprocessing.sub_sets as sub_sets
+import preprocessing.vectorization as vectorization
+import preprocessing.word_counts as word_counts
+import tools.pick_call as pick_call
+import main_process
+from benchmarks.synthetic import synthetic_data
+
+SIZE = 20000
+N_WORDS = 100
+
+# (name, extension, compression, mmap at loading)
+FORMATS = [('pickle (legacy)', None, None, False),
+           ('pickle', '.p', None, False),
+           ('feather', '.feather', None, False),
+           ('feather mmap', '.feather', None, True),
+           ('feather lz4', '.feather', 'lz4', False),
+           ('feather zstd', '.feather', 'zstd', False),
+           ('parquet', '.parquet', None, False),
+           ('parquet zstd', '.parquet', 'zstd', False)]
+
+
+def pickle_dump_legacy(data, filename):
+    '''
+    Previous implementation of pick_call.pickle_dump (default protocol).
+    '''
+    with open(filename, "wb") as f:
+        pickle.dump(data, f)
+
+
+def timed(fun, *args, **kwargs):
+    start_time = time.time()
+    res = fun(*args, **kwargs)
+    return res, time.time() - start_time
+
+
+def stages(size):
+    '''
+    Computes the results of the stages data, sets and vectors of a run on a
+    synthetic dataset of 'size' jobs, with the word counts in the dataset and
+    in a word count store (sparse_counts, stages jobs and sets_sc).
+    '''
+    P = main_process.Experiment('', ngram=[1], seed=0)
+    data = synthetic_data(size, n_words=N_WORDS)
+    sets = sub_sets.sub_sets(P, data.copy())
+    vectors = vectorization.vectorization(P, sets)
+
+    jobs, _ = word_counts.split_counts(data)
+    sets_sc = sub_sets.sub_sets(P, jobs.copy())
+    return {'data': data, 'sets': sets, 'vectors': vectors, 'jobs': jobs, 'sets_sc': sets_sc}
+
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else SIZE
+    print('Synthetic dataset:', size, 'jobs with', N_WORDS, 'words')
+    STAGES = stages(size)
+    path = tempfile.mkdtemp()
+
+    list = ['Stage', 'Format', 'save (s)', 'load (s)', 'size (MB)']
+    print('{:8s} | {:16s} {:10s} {:10s} {:10s} |'.format(*list))
+    print('-' * 62)
+    try:
+        for stage in STAGES:
+            for name, ext, compression, mmap in FORMATS:
+                filename = os.path.join(path, stage + (ext or '.legacy.p'))
+                if ext is None:
+                    _, save_time = timed(pickle_dump_legacy, STAGES[stage], filename)
+                    _, load_time = timed(pick_call.pickle_load, filename)
+                else:
+                    _, save_time = timed(pick_call.stage_dump, STAGES[stage], filename,
+                                         compression=compression)
+                    _, load_time = timed(pick_call.stage_load, filename, mmap=mmap)
+                size_mb = pick_call.cache_size(filename) / 2**20
+
+                list = [stage, name, str(round(save_time, 3)), str(round(load_time, 3)),
+                        str(round(size_mb, 1))]
+                print('{:8s} | {:16s} {:10s} {:10s} {:10s} |'.format(*list))
+    finally:
+        shutil.rmtree(path)
@@ -0,0 +1,53 @@
+import sys
+import time
+import numpy as np
+
+import preprocessing.sub_sets as sub_sets
+import preprocessing.vectorization as vectorization
+import classification.classification_XGboost as classification_XGBoost
+import main_process
+from benchmarks.synthetic import synthetic_data
+
+SIZE = 20000
+N_WORDS = 100
+# maximum difference of the metrics of the grid with the reference mode
+TOLERANCE = 0.05
+
+
+def run(P, VECTORS, shap_mode):
+    '''
+    Classifies the vectors 'VECTORS' with 'shap_mode'. Returns the metrics of
+    all the alpha/beta of the grid, the time of the classification and the
+    probabilities of the experiment alpha/beta.
+    '''
+    P.shap_mode = shap_mode
+    start_time = time.time()
+    BIG = classification_XGBoost.classify_XGBoost(P, VECTORS)
+    run_time = time.time() - start_time
+    pred = np.array(BIG['%.1fvar_%dtresh' % (float(P.beta), P.alpha)]['pred'])
+    return {k: BIG[k]['result'] for k in BIG}, run_time, pred
+
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else SIZE
+    print('Synthetic dataset:', size, 'jobs with', N_WORDS, 'words')
+    P = main_process.Experiment('', ngram=[1], seed=0)
+    VECTORS = vectorization.vectorization(P, sub_sets.sub_sets(P, synthetic_data(size, N_WORDS)))
+
+    REF = None
+    list = ['Mode', 'time (s)', 'F1', 'max diff F1', 'max diff prob']
+    print('{:10s} | {:10s} {:8s} {:12s} {:14s} |'.format(*list))
+    print('-' * 62)
+    for shap_mode in classification_XGBoost.SHAP_MODES:
+        RESULT, run_time, pred = run(P, VECTORS, shap_mode)
+        if REF is None:
+            REF = (RESULT, pred)
+        diff_f1 = max(abs(RESULT[k]['f1'] - REF[0][k]['f1']) for k in RESULT)
+        diff_prob = np.abs(pred - REF[1]).max()
+
+        f1 = RESULT['%.1fvar_%dtresh' % (float(P.beta), P.alpha)]['f1']
+        list = [shap_mode, str(round(run_time, 2)), str(round(100 * f1, 1)),
+                str(round(100 * diff_f1, 1)), '%.2g' % diff_prob]
+        print('{:10s} | {:10s} {:8s} {:12s} {:14s} |'.format(*list))
+        if shap_mode == 'contribs':
+            assert diff_f1 <= TOLERANCE, 'F1 of contribs out of tolerance'
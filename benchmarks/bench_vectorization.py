@@ -0,0 +1,83 @@
+import os
+import sys
+import time
+import random
+import tracemalloc
+
+import preprocessing.sub_sets as sub_sets
+import preprocessing.vectorization as vectorization
+import main_process
+from benchmarks.synthetic import synthetic_data
+
+SIZE = 10000
+N_WORDS = 100
+VOCAB_SIZE = 50000
+
+# vectorization set-up of the reference (see main_process.Experiment)
+SETUP = {'ngram': [1, 2], 'seed': 0, 'kbest_thresh': 300, 'kbest_chunk_size': 1000}
+# (name, changes of the vectorization set-up)
+CONFIGS = [('chunks', {}),
+           ('chunks 2^16', {'hash_bits': 16}),
+           ('chunks 2^18', {'hash_bits': 18}),
+           ('chunks 2^20', {'hash_bits': 20}),
+           ('stats', {'kbest_mode': 'stats'}),
+           ('stats 2^18', {'kbest_mode': 'stats', 'hash_bits': 18}),
+           ('stats 2^20', {'kbest_mode': 'stats', 'hash_bits': 20})]
+
+
+def exact_kbest(P, sets):
+    '''
+    Reference selection: the Kbest features of the tfidf matrix of the whole
+    training set, with its whole vocabulary.
+    '''
+    sub_set = {'train': sets['train']}
+    M_tfidf, target, _ = vectorization.tf_idf(sub_set, only_train=True)
+    return vectorization.kbest(P, M_tfidf['train'], target,
+                               vectorization.y_values(P, sub_set)['train'],
+                               vectorization.train_weight(sub_set))
+
+
+def traced(fun, *args, **kwargs):
+    '''
+    Runs fun(*args, **kwargs) twice, returns its result, its time (first run)
+    and the peak of the memory allocated by Python and numpy during the second
+    run (in MB, traced apart as tracing slows down the run).
+    '''
+    start_time = time.time()
+    res = fun(*args, **kwargs)
+    run_time = time.time() - start_time
+    tracemalloc.start()
+    fun(*args, **kwargs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return res, run_time, peak / 2**20
+
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else SIZE
+    print('Synthetic dataset:', size, 'jobs with', N_WORDS, 'words from', VOCAB_SIZE,
+          'words, 1-2 grams,', os.cpu_count(), 'cores')
+    random.seed(0)
+    P = main_process.Experiment('', **SETUP)
+    SETS = sub_sets.sub_sets(P, synthetic_data(size, N_WORDS, vocab_size=VOCAB_SIZE))
+
+    REF = set(exact_kbest(P, SETS))
+
+    list = ['Selection', 'time (s)', 'peak (MB)', 'candidates', 'as exact']
+    print('{:12s} | {:10s} {:10s} {:10s} {:10s} |'.format(*list))
+    print('-' * 62)
+    for name, config in CONFIGS:
+        P_config = main_process.Experiment('', **dict(SETUP, **config))
+        candidates = []
+        bucket_words = vectorization.bucket_words
+        if P_config.hash_bits is not None:  # count the words given to the final selection
+            vectorization.bucket_words = lambda *args: candidates.append(bucket_words(*args)) \
+                or candidates[-1]
+        try:
+            (M_tfidf, feat, idf), run_time, peak = traced(vectorization.X_values, P_config, SETS)
+        finally:
+            vectorization.bucket_words = bucket_words
+        list = [name, str(round(run_time, 2)), str(round(peak, 1)),
+                str(len(candidates[0])) if len(candidates) > 0 else '-',
+                str(round(100 * len(REF & set(feat)) / len(REF), 1)) + '%']
+        print('{:12s} | {:10s} {:10s} {:10s} {:10s} |'.format(*list))
@@ -0,0 +1,62 @@
+import os
+import sys
+import random
+import time
+import xgboost as xgb
+
+import preprocessing.sub_sets as sub_sets
+import preprocessing.vectorization as vectorization
+import classification.classification_XGboost as classification_XGBoost
+import main_process
+from benchmarks.synthetic import synthetic_data
+
+SIZE = 20000
+N_WORDS = 100
+
+# set-up of the runs (see main_process.Experiment)
+SETUP = {'ngram': [1], 'seed': 0, 'shap_mode': 'contribs'}
+# (name, changes of the training configuration, see XGB_CONFIG)
+CONFIGS = [('exact (default)', {}),
+           ('exact 1 thread', {'nthread': 1}),
+           ('approx', {'tree_method': 'approx'}),
+           ('hist', {'tree_method': 'hist'}),
+           ('hist 1 thread', {'tree_method': 'hist', 'nthread': 1}),
+           ('hist depth 6', {'tree_method': 'hist', 'max_depth': 6, 'eta': 0.3,
+                             'rounds': 200, 'early_stopping': 10})]
+XGB_TRAIN = xgb.train
+TRAIN_TIME = [0.]
+
+
+def timed_train(*args, **kwargs):
+    '''
+    xgb.train, adding its time to TRAIN_TIME.
+    '''
+    start_time = time.time()
+    bst = XGB_TRAIN(*args, **kwargs)
+    TRAIN_TIME[0] += time.time() - start_time
+    return bst
+
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else SIZE
+    print('Synthetic dataset:', size, 'jobs with', N_WORDS, 'words,', os.cpu_count(), 'cores')
+    random.seed(0)
+    xgb.train = timed_train
+    P = main_process.Experiment('', **SETUP)
+    VECTORS = vectorization.vectorization(P, sub_sets.sub_sets(P, synthetic_data(size, N_WORDS)))
+
+    list = ['Config', 'train (s)', 'total (s)', 'F1', 'best F1']
+    print('{:16s} | {:10s} {:10s} {:8s} {:8s} |'.format(*list))
+    print('-' * 60)
+    for name, config in CONFIGS:
+        P_config = main_process.Experiment('', **dict(SETUP, **config))
+        TRAIN_TIME[0] = 0.
+        start_time = time.time()
+        BIG = classification_XGBoost.classify_XGBoost(P_config, VECTORS)
+        run_time = time.time() - start_time
+
+        f1 = BIG['%.1fvar_%dtresh' % (float(P.beta), P.alpha)]['result']['f1']
+        best_f1 = max(BIG[k]['result']['f1'] for k in BIG)
+        list = [name, str(round(TRAIN_TIME[0], 2)), str(round(run_time, 2)),
+                str(round(100 * f1, 1)), str(round(100 * best_f1, 1))]
+        print('{:16s} | {:10s} {:10s} {:8s} {:8s} |'.format(*list))
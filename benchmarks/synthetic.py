@@ -0,0 +1,121 @@
+import os
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+
+import preprocessing.get_data as get_data
+
+JOB_NAMES = ["linux_build", "linux_test", "windows_build", "windows_test",
+             "macos_build", "macos_test", "doc", "package"]
+
+
+def synthetic_data(n_jobs, n_words=0, vocab_size=5000, flaky_rate=0.15, seed=0):
+    '''
+    Generates a synthetic dataset with the format of get_data.get_data.
+    Jobs are grouped by commitID and jobName, a (commitID, jobName) being 
+    rerun when it fails. The reruns of a flaky (commitID, jobName) have unsteady
+    results, and their failures contain a few 'brown' words.
+
+    Parameters:
+    - n_jobs    : int. Number of jobs (rows) to generate.
+    - n_words   : int. Number of distinct words per job. If 0, the word count 
+                  columns are left empty (default=0).
+    - vocab_size: int. Size of the vocabulary the words are drawn from 
+                  (default=5000).
+    - flaky_rate: float. Ratio of flaky (commitID, jobName) (default=0.15).
+    - seed      : int. Random seed (default=0).
+    Output:
+    - res       : dataset in a pandas dataframe format.
+    '''
+    rng = np.random.default_rng(seed)
+
+    # (commitID, jobName) groups with their reruns
+    n_groups = n_jobs
+    is_flaky = rng.random(n_groups) < flaky_rate
+    fails = rng.random(n_groups) < 0.2
+    runs = np.where(is_flaky, rng.integers(2, 4, n_groups), 1 + fails)
+    group = np.repeat(np.arange(n_groups), runs)[:n_jobs]
+    rank = np.arange(len(group)) - np.searchsorted(group, group)
+
+    status = np.where(is_flaky[group], (rank == 0) | (rng.random(len(group)) < 0.3),
+                      fails[group]).astype(int)
+    # a flaky group always has both results
+    last_flaky = is_flaky[group] & (rank == runs[group] - 1)
+    status[last_flaky] = 0
+
+    commit = group // len(JOB_NAMES)
+    job = group % len(JOB_NAMES)
+    start = datetime(2019, 1, 1)
+    date = [start + timedelta(hours=3 * int(c), minutes=20 * int(r))
+            for c, r in zip(commit, rank)]
+
+    res = pd.DataFrame({
+        "date": date,
+        "jobID": [str(i) for i in range(len(group))],
+        "commitID": ["%08x" % c for c in commit],
+        "status": status,
+        "jobName": [JOB_NAMES[j] for j in job]})
+    res["filename"] = ["%s_%s_%s_%d_%s-processed.csv" % (d.strftime(get_data.date_regex), i, c, s, j)
+                       for d, i, c, s, j in zip(res["date"], res["jobID"], res["commitID"],
+                                                res["status"], res["jobName"])]
+
+    word_count = [[{} for i in range(len(group))] for n in range(get_data.MAX_NGRAM)]
+    if n_words > 0:
+        vocab = np.array(["word%d" % i for i in range(vocab_size)])
+        brown = vocab[-20:]
+        zipf = 1. / np.arange(1, vocab_size + 1)
+        zipf /= zipf.sum()
+        for row, (s, f) in enumerate(zip(status, is_flaky[group])):
+            words = vocab[rng.choice(vocab_size, n_words, p=zipf)].tolist()
+            if s == 1 and f:
+                words += rng.choice(brown, 3).tolist()
+            counts = rng.integers(1, 5, len(words)).tolist()
+            word_count[0][row] = dict(zip(words, counts))
+            word_count[1][row] = {a + "_" + b: 1 for a, b in zip(words, words[1:])}
+    for n in range(get_data.MAX_NGRAM):
+        res["word_count_ngram_" + str(n + 1)] = word_count[n]
+
+    res = get_data.flaky_state_all(res)
+    return res
+
+
+# lines of the synthetic raw logs, with the urls, paths, numbers and mixed case
+# words replaced by main_extract.go
+LOG_LINES = ["[%02d:%02d:%02d] Step %d/%d : Running build for x86_64 (config Release)",
+             "Compiling src/module%d/file%d.cpp with -O2 -Wall",
+             "Downloading https://ci.example.com/artifacts/%d/build_%d.zip",
+             "warning: unused variable 'tmp%d' in function HttpServer::handle (line %d)",
+             "Test suite %d: %d tests passed in 0.%02ds",
+             "Linking libcore.so.%d.%d ... done"]
+
+
+def synthetic_logs(path, n_jobs, n_lines=200, seed=0):
+    '''
+    Writes the raw log files of a synthetic dataset (see synthetic_data) in
+    the folder 'path', with the filenames expected by main_extract.go and
+    get_data.raw_file_regex. The failures of the flaky jobs contain a few
+    'brown' lines.
+
+    Parameters:
+    - path   : folder of the log files (created if needed).
+    - n_jobs : int. Number of jobs (log files) to generate.
+    - n_lines: int. Number of lines per log (default=200).
+    - seed   : int. Random seed (default=0).
+    Output:
+    - size   : total size of the log files in bytes.
+    '''
+    os.makedirs(path, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    res = synthetic_data(n_jobs, seed=seed)
+    size = 0
+    for filename, status, flaky in zip(res["filename"], res["status"], res["flaky"]):
+        lines = []
+        for i in rng.integers(0, len(LOG_LINES), n_lines):
+            lines.append(LOG_LINES[i] % tuple(rng.integers(0, 60, LOG_LINES[i].count('%'))))
+        if status == 1 and flaky == "flaky":
+            lines += ["ERROR: Connection timed out while contacting the agent"] * 3
+        txt = "\n".join(lines) + "\n"
+        with open(os.path.join(path, filename.replace("-processed.csv", ".log")), "w") as f:
+            f.write(txt)
+        size += len(txt)
+    return size
@@ -0,0 +1,155 @@
+import numpy as np
+import xgboost as xgb
+from scipy.sparse import csr_matrix
+from sklearn.preprocessing import normalize
+
+import classification.classification_XGboost as classification_XGBoost
+import tools.pick_call as pick_call
+
+BUNDLE_NAME = 'model_bundle.p'
+
+
+def make_bundle(P, VECTORS, MODELS):
+    '''
+    Gathers everything needed to classify new jobs with the models trained in
+    a run: the tfidf vocabulary and idf, the two XGBoost models, the way the
+    SHAP values given to the second model are computed, the alpha and beta
+    of the experiment and the extraction of the logs of its dataset.
+
+    Parameters:
+    - P      : Experiment object representing the current experiment set-up
+    - VECTORS: vectors of the run (see vectorization.vectorization).
+    - MODELS : models of the run (see classification_XGBoost.classify_XGBoost).
+    Output:
+    - bundle : dictionary with keys:
+                - raw_logs: if the words come from raw logs (extracted by 
+                  preprocessing/extract.py) or from processed logs 
+                  (main_extract.go), see check_logs
+                - ngram: list of the N values considered
+                - feat: list of the features (words) of the tfidf matrices
+                - idf: array of the idf of the features
+                - model1, model2, select_col: see classify_XGBoost
+                - shap_mode: computation of the SHAP values of model1 on 
+                  which model2 is trained (see classify_XGBoost.pred_xgboost)
+                - info_features: metrics of the jobs added to the second model
+                - alpha: threshold on the probability (in %)
+                - beta: weight of the second model in the probability (in %)
+    '''
+    return {'raw_logs': bool(P.raw_logs),
+            'ngram': list(P.ngram),
+            'feat': list(VECTORS['train']['feat']),
+            'idf': np.asarray(VECTORS['train']['idf']),
+            'model1': MODELS['model1'],
+            'model2': MODELS['model2'],
+            'select_col': list(MODELS['select_col']),
+            'shap_mode': P.shap_mode,
+            'info_features': list(classification_XGBoost.INFO_FEATURES),
+            'alpha': P.alpha,
+            'beta': P.beta}
+
+
+def check_logs(bundle, raw_logs):
+    '''
+    Raises a ValueError if the logs to classify with 'bundle' (raw logs if 
+    raw_logs = True, else processed logs) are not the kind of logs the models
+    were trained on. preprocessing/extract.py gives the words of 
+    main_extract.go, but the processed logs may come from another version of
+    the Go extraction. The bundles saved without 'raw_logs' were trained on 
+    processed logs.
+    '''
+    if bundle.get('raw_logs', False) != raw_logs:
+        raise ValueError('the model was trained on %s logs, it can not classify %s logs' %
+                         (('processed', 'raw')[bundle.get('raw_logs', False)],
+                          ('processed', 'raw')[raw_logs]))
+
+
+def save_bundle(bundle, filename):
+    pick_call.pickle_dump({k: v for k, v in bundle.items() if k != 'explainer'}, filename)
+
+
+def load_bundle(filename):
+    '''
+    Loads the model bundle saved in 'filename'. With shap_mode='shap', the 
+    shap.TreeExplainer of the first model is built once here (key 'explainer',
+    not saved) instead of at each prediction (see predict).
+    '''
+    bundle = pick_call.pickle_load(filename)
+    if bundle.get('shap_mode', 'contribs') == 'shap':
+        bundle['explainer'] = classification_XGBoost.tree_explainer(bundle['model1'])
+    return bundle
+
+
+def tfidf_matrix(bundle, counts):
+    '''
+    Computes the tfidf matrix of new jobs on the features of 'bundle', as
+    vectorization.tf_idf does for the valid/test sets.
+
+    Parameters:
+    - bundle: model bundle (see make_bundle).
+    - counts: list of the word counts of the jobs (see get_data.text_count).
+    Output:
+    - X     : tfidf matrix (csr format, size: nbr_jobs x len(bundle['feat'])).
+
+    Ex: bundle['feat'] = ['a', 'b'], bundle['idf'] = [1., 2.], bundle['ngram'] = [1]
+        counts = [[{'a':3, 'c':1}, {}]]
+
+        out = [[1., 0.]]
+    '''
+    vocabulary = {w: j for j, w in enumerate(bundle['feat'])}
+    indptr = [0]
+    indices = []
+    data = []
+    for dic in counts:
+        # as in sub_sets.get_word_count, the count of the last N is kept
+        loc = {}
+        for n in bundle['ngram']:
+            loc.update(dic[n - 1])
+        for w, c in loc.items():
+            j = vocabulary.get(w)
+            if j is not None:
+                indices.append(j)
+                data.append(c)
+        indptr.append(len(indices))
+
+    X = csr_matrix((np.array(data, dtype=np.float64), np.array(indices, dtype=np.int32),
+                    np.array(indptr, dtype=np.int64)),
+                   shape=(len(counts), len(vocabulary)))
+    X.sort_indices()
+    return normalize(X.multiply(bundle['idf']).tocsr())
+
+
+def predict(bundle, counts, info):
+    '''
+    Classifies new jobs with the two models of 'bundle'. The SHAP values of
+    the first model are computed as in the training of the second model 
+    (bundle['shap_mode'], 'contribs' for the bundles saved without it), with
+    the explainer of the bundle if any (see load_bundle).
+
+    Parameters:
+    - bundle: model bundle (see make_bundle).
+    - counts: list of the word counts of the jobs (see get_data.text_count).
+    - info  : array of the metrics of the jobs (columns: bundle['info_features'],
+              size: nbr_jobs x 2).
+    Output:
+    - PRED  : dictionary with keys=model1/model2/probability/brown and
+              values=arrays (size: nbr_jobs), the probability being the
+              combination of the two models with beta, and brown the
+              probability thresholded with alpha.
+    '''
+    X = tfidf_matrix(bundle, counts)
+    dmatrix = xgb.DMatrix(X)
+    pred_1 = bundle['model1'].predict(dmatrix)
+    shap_val = classification_XGBoost.shap_values(bundle['model1'], X,
+                                                  bundle.get('shap_mode', 'contribs'), dmatrix,
+                                                  bundle.get('explainer'))
+
+    # input of model2, filled in place: SHAP values of select_col, then info
+    nbr_col = len(bundle['select_col'])
+    X2 = np.empty((len(counts), nbr_col + len(bundle['info_features'])), dtype=np.float64)
+    X2[:, :nbr_col] = shap_val[:, bundle['select_col']]
+    X2[:, nbr_col:] = np.asarray(info, dtype=np.float64).reshape(len(counts), -1)
+    pred_2 = bundle['model2'].predict(xgb.DMatrix(X2))
+
+    prob = (pred_1 * (100. - bundle['beta']) + pred_2 * bundle['beta']) / 100.0
+    return {'model1': pred_1, 'model2': pred_2, 'probability': prob,
+            'brown': prob >= bundle['alpha'] / 100.0}
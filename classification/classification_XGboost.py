@@ -1,47 +1,129 @@
 import xgboost as xgb
-import shap
 import pandas as pd
 import numpy as np
 import classification.metrics as metrics
 
+try:  # optional, only needed for shap_mode='shap'
+    import shap
+except ImportError:
+    shap = None
 
-def pred_xgboost(sets):
+# metrics of the jobs (see sub_sets.INFO_COLUMNS) added to the second model
+INFO_FEATURES = ["rerun", "commit_since_flaky"]
+# ways to compute the SHAP values of the first model (see pred_xgboost)
+SHAP_MODES = ['shap', 'contribs', 'approx']
+# tree construction algorithms of XGBoost
+TREE_METHODS = ['exact', 'approx', 'hist', 'auto']
+# training configuration of the models (see xgb_config)
+XGB_CONFIG = {'tree_method': 'exact', 'nthread': None, 'max_depth': 100, 'eta': 1.,
+              'rounds': 50, 'early_stopping': 3}
+
+
+def xgb_config(P):
+    '''
+    Returns the training configuration of the XGBoost models of the 
+    Experiment object 'P' (its fields with the names of the XGB_CONFIG keys).
+    '''
+    return {'tree_method': P.tree_method, 'nthread': P.nthread, 'max_depth': P.max_depth,
+            'eta': P.eta, 'rounds': P.rounds, 'early_stopping': P.early_stopping}
+
+
+def tree_explainer(bst):
+    '''
+    Returns the shap.TreeExplainer of the xgboost model 'bst' (shap_mode='shap').
+    '''
+    if shap is None:
+        raise ImportError("shap_mode='shap' requires shap (pip install shap), "
+                          "use shap_mode='contribs' without it")
+    return shap.TreeExplainer(bst)
+
+
+def shap_values(bst, X, shap_mode, dmatrix=None, explainer=None):
+    '''
+    Computes the SHAP values of the xgboost model 'bst' on the matrix 'X' with 
+    'shap_mode' ('shap', 'contribs' or 'approx', see pred_xgboost).
+
+    Parameters:
+    - bst      : xgboost model.
+    - X        : matrix of the jobs (size: nbr_jobs x nbr_features).
+    - shap_mode: 'shap', 'contribs' or 'approx'.
+    - dmatrix  : xgb.DMatrix of 'X', built if None (default=None).
+    - explainer: shap.TreeExplainer of 'bst' for shap_mode='shap', built if 
+                 None (default=None).
+    Output:
+    - shap_val : array of the SHAP values (size: nbr_jobs x nbr_features).
+    '''
+    if shap_mode == 'shap':
+        if explainer is None:
+            explainer = tree_explainer(bst)
+        # the values do not sum to the predictions when a missing feature does
+        # not follow the same branch as a 0 value (not checked by the older shap)
+        return explainer.shap_values(X, check_additivity=False)
+
+    if dmatrix is None:
+        dmatrix = xgb.DMatrix(X)
+    # the last column is the bias
+    return bst.predict(dmatrix, pred_contribs=True,
+                       approx_contribs=shap_mode == 'approx')[:, :-1]
+
+
+def pred_xgboost(sets, shap_mode='shap', config=XGB_CONFIG):
     '''
     Trains a xgboost model on the sets (train/valid/test).
+    The jobs of an oversampled training set are weighted by their number of 
+    copies (optional key 'weight' of the training set).
+    The SHAP values of the model on the sets are computed with 'shap_mode':
+    - 'shap'    : shap.TreeExplainer (a missing feature is taken as a 0 value).
+    - 'contribs': XGBoost (pred_contribs), same algorithm but the missing 
+                  features follow the default branches, as in the predictions.
+    - 'approx'  : XGBoost approximation (approx_contribs), faster.
+    - None      : not computed.
 
     Parameters:
     - sets: list of dictionaries with keys=train/valid/test and values=subsets.
+    - shap_mode: 'shap', 'contribs', 'approx' or None (default='shap').
+    - config: dictionary with the keys of XGB_CONFIG:
+                - tree_method: see TREE_METHODS ('hist' for the histogram algorithm)
+                - nthread: number of threads (None for all the cores)
+                - max_depth, eta: maximum depth of the trees and learning rate
+                - rounds: maximum number of boosting rounds
+                - early_stopping: number of rounds without improvement on the 
+                  validation set before stopping (0 to disable)
     Outputs:
     - bst: xgboost model.
-    - shap_val: list of shap values for each prediction.
+    - shap_val: list of shap values for each prediction (None if shap_mode=None).
     - pred: list prediction rounded to integer (1 for flaky, 0 for safe).
     - pred: list prediction value between 0.0 and 1.0.
     '''
-    dtrain = xgb.DMatrix(sets['train']['X'], label=sets['train']['y'])
+    dtrain = xgb.DMatrix(sets['train']['X'], label=sets['train']['y'],
+                         weight=sets['train'].get('weight'))
     dvalid = xgb.DMatrix(sets['valid']['X'], label=sets['valid']['y'])
     dtest = xgb.DMatrix(sets['test']['X'])
+    dmatrix = {'train': dtrain, 'valid': dvalid, 'test': dtest}
 
     param = {
-        'max_depth': 100,
-        'eta': 1,
-        'silent': 1,
+        'max_depth': config['max_depth'],
+        'eta': config['eta'],
+        'tree_method': config['tree_method'],
+        'verbosity': 0,
         'objective': 'binary:logistic'}
+    if config['nthread'] is not None:
+        param['nthread'] = config['nthread']
     evallist = [(dtrain, 'train'), (dvalid, 'valid')]
 
     bst = xgb.train(
         param,
         dtrain,
-        50,
+        config['rounds'],
         evals=evallist,
         maximize=True,
-        early_stopping_rounds=3,
+        early_stopping_rounds=config['early_stopping'] or None,
         verbose_eval=0)
-    explainer = shap.TreeExplainer(bst)
-
-    shap_val = {}
-    shap_val['train'] = explainer.shap_values(sets['train']['X'])
-    shap_val['valid'] = explainer.shap_values(sets['valid']['X'])
-    shap_val['test'] = explainer.shap_values(sets['test']['X'])
+    shap_val = None
+    if shap_mode is not None:
+        explainer = tree_explainer(bst) if shap_mode == 'shap' else None
+        shap_val = {who: shap_values(bst, sets[who]['X'], shap_mode, dmatrix[who], explainer)
+                    for who in dmatrix}
 
     pred = bst.predict(dtest)
     pred_prob = pred
@@ -50,61 +132,90 @@ def pred_xgboost(sets):
     return bst, shap_val, pred, pred_prob
 
 
-def classify_XGBoost(P, sets):
+def grid_results(y, pred_prob, pred_prob_2, grid_step=10):
+    '''
+    Computes the predictions and the metrics of the two layer model for all 
+    the beta (weight of the second model, in 'grid_step'..100-'grid_step') and 
+    alpha (threshold, in 0..100) multiples of 'grid_step', on an array of 
+    size nbr_beta x nbr_alpha x nbr_jobs.
+
+    Parameters:
+    - y          : list of the labels of the jobs.
+    - pred_prob  : predictions of the first model (between 0.0 and 1.0).
+    - pred_prob_2: predictions of the second model (between 0.0 and 1.0).
+    - grid_step  : int, dividing 100 (default=10).
+    Output:
+    - BIG        : dictionary (see classify_XGBoost), the predictions being
+                   read-only arrays.
+    '''
+    alphas = np.arange(0, 100 + grid_step, grid_step)
+    betas = np.arange(grid_step, 100, grid_step)
+
+    # pred_prob_ranged[b, i] and pred_ranged[b, a, i]
+    pred_prob_ranged = (np.asarray(pred_prob, dtype=np.float64) * (100. - betas[:, None]) +
+                        np.asarray(pred_prob_2, dtype=np.float64) * betas[:, None]) / 100.0
+    pred_ranged = pred_prob_ranged[:, None, :] >= alphas[None, :, None] / 100.0
+    result_ranged = metrics.compute_metrics_grid(y, pred_ranged)
+    # the predictions of a beta are shared by all the alpha
+    pred_prob_ranged.flags.writeable = False
+
+    BIG = {}
+    for j, alpha in enumerate(alphas):
+        for i, beta in enumerate(betas):
+            id = '%.1fvar_%dtresh' % (float(beta), alpha)
+            BIG[id] = {"pred": pred_prob_ranged[i],
+                       "result": {k: float(v[i, j]) for k, v in result_ranged.items()}}
+    return BIG
+
+
+def classify_XGBoost(P, sets, return_models=False):
     '''
     Trains our two layer classification XGBoost model.
 
     Parameters:
-    - P   : Experiment object representing the current experiment set-up
-    - sets: list of dictionaries with keys=train/valid/test and values=subsets.
+    - P     : Experiment object representing the current experiment set-up
+    - sets  : list of dictionaries with keys=train/valid/test and values=subsets.
+    - return_models: if the trained models are returned (default=False).
     Outputs:
-    - BIG : dictionary containing the predictions for all the alpha and beta values 
-            considered in the paper.
-            Key=code including alpha and beta ('beta'var_'alpha'tresh)
-            Value=a dictionary containing the prediction and the result metrics.
+    - BIG   : dictionary containing the predictions for all the alpha and beta values 
+              considered in the paper (multiples of P.grid_step, see grid_results).
+              Key=code including alpha and beta ('beta'var_'alpha'tresh)
+              Value=a dictionary containing the prediction and the result metrics.
+    - MODELS: only if return_models=True, dictionary with keys:
+                - model1: first model (on the tfidf features)
+                - model2: second model (on the SHAP values of model1 and INFO_FEATURES)
+                - select_col: columns of the SHAP values used by model2
     '''
     ### FIRST MODEL ###
-    model1, shap_val, pred, pred_prob = pred_xgboost(sets)
+    config = xgb_config(P)
+    model1, shap_val, pred, pred_prob = pred_xgboost(sets, shap_mode=P.shap_mode, config=config)
 
     ### SECOND MODEL ###
-    list_add = ["rerun", "commit_since_flaky"]
+    list_add = INFO_FEATURES
 
     select_col = np.std(shap_val['train'], axis=0) != 0
     select_col = [i for i, e in enumerate(select_col) if e]
-    mat2 = np.concatenate((np.array(shap_val['train'][:, select_col]), np.array(
-        [[e[k] for k in list_add] for e in sets["train"]["info"]])), axis=1)
-    valid_X2 = np.concatenate((np.array(shap_val['valid'][:, select_col]), np.array(
-        [[e[k] for k in list_add] for e in sets["valid"]["info"]])), axis=1)
-    test_X2 = np.concatenate((np.array(shap_val['test'][:, select_col]), np.array(
-        [[e[k] for k in list_add] for e in sets["test"]["info"]])), axis=1)
+    mat2 = np.concatenate((np.array(shap_val['train'][:, select_col]),
+                           sets["train"]["info"][list_add].to_numpy()), axis=1)
+    valid_X2 = np.concatenate((np.array(shap_val['valid'][:, select_col]),
+                               sets["valid"]["info"][list_add].to_numpy()), axis=1)
+    test_X2 = np.concatenate((np.array(shap_val['test'][:, select_col]),
+                              sets["test"]["info"][list_add].to_numpy()), axis=1)
 
     second_sets = {}
-    second_sets['train'] = {'X': mat2, 'y': sets["train"]["y"]}
+    second_sets['train'] = {'X': mat2, 'y': sets["train"]["y"],
+                            'weight': sets["train"].get("weight")}
     second_sets['valid'] = {'X': valid_X2, 'y': sets["valid"]["y"]}
     second_sets['test'] = {'X': test_X2, 'y': sets["test"]["y"]}
     X_train = pd.DataFrame(mat2)  # , columns=new_columns)
     X_valid = pd.DataFrame(valid_X2)  # , columns=new_columns)
     X_test = pd.DataFrame(test_X2)  # , columns=new_columns)
 
-    model2, shap_val2, pred_2, pred_prob_2 = pred_xgboost(second_sets)
-
-    BIG = {}
-    for alpha in range(0, 110, 10):
-        for beta in range(10, 100, 10):
-            pred_prob_ranged = [(a * (100. - beta) + b * beta) /
-                                100.0 for a, b in zip(pred_prob, pred_prob_2)]
-            pred_ranged = [int(e >= float(alpha / 100.0))
-                           for e in pred_prob_ranged]
-
-            id = '%.1fvar_%dtresh' % (float(beta), alpha)
-            result_ranged = metrics.compute_metrics(sets["test"]["y"], pred_ranged)
-
-            BIG[id] = {"pred": pred_prob_ranged, "result": result_ranged}
-
-    pred_prob_FINAL = [(a + b) / 2. for a, b in zip(pred_prob, pred_prob_2)]
-    pred_FINAL = [int(round(e)) for e in pred_prob_FINAL]
+    # the SHAP values of the second model are not used
+    model2, _, pred_2, pred_prob_2 = pred_xgboost(second_sets, shap_mode=None, config=config)
 
-    explainer = shap.TreeExplainer(model1)
-    explainer2 = shap.TreeExplainer(model2)
+    BIG = grid_results(sets["test"]["y"], pred_prob, pred_prob_2, P.grid_step)
 
+    if return_models:
+        return BIG, {'model1': model1, 'model2': model2, 'select_col': select_col}
     return BIG
@@ -27,3 +27,48 @@ def compute_metrics(y, pred):
     result['specificity'] = sklearn.metrics.recall_score(
         [1 - e for e in y], [1 - e for e in pred_round])
     return result
+
+
+def compute_metrics_grid(y, pred):
+    '''
+    Computes the same performance metrics as compute_metrics for several 
+    predictions of the same jobs at once, from their confusion counts. As with
+    sklearn, a metric whose denominator is 0 is 0.
+
+    Parameters: 
+    - y     : list of true labels (1 for flaky, 0 for safe), size n.
+    - pred  : array of predictions (1/True for flaky, 0/False for safe), of 
+              size ... x n.
+    Output:
+    - result: dictionnary containing all the performance metrics. 
+              Keys= name of the metrics and value= array of the values of the 
+              metric (size: ..., the shape of 'pred' without its last axis).
+
+    Ex: y = [1, 0, 1]
+        pred = [[1, 0, 0],
+                [1, 1, 1]]
+
+        out = {'accuracy': [0.67, 0.67], 'precision': [1.0, 0.67], 
+               'recall': [0.5, 1.0], 'f1': [0.67, 0.8], 'specificity': [1.0, 0.0]}
+    '''
+    y = np.asarray(y, dtype=bool)
+    pred = np.asarray(pred) != 0
+    n = y.shape[0]
+    positive = np.count_nonzero(y)
+
+    tp = np.count_nonzero(pred & y, axis=-1)
+    predicted = np.count_nonzero(pred, axis=-1)
+    fp = predicted - tp
+    fn = positive - tp
+    tn = n - positive - fp
+
+    def ratio(a, b):
+        return np.divide(a, b, out=np.zeros(np.shape(a)), where=np.asarray(b) > 0)
+
+    result = {}
+    result['accuracy'] = ratio(tp + tn, n)
+    result['precision'] = ratio(tp, predicted)
+    result['recall'] = ratio(tp, positive)
+    result['f1'] = ratio(2 * tp, 2 * tp + fp + fn)
+    result['specificity'] = ratio(tn, n - positive)
+    return result
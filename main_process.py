@@ -1,22 +1,46 @@
 import preprocessing.get_data as get_data
 import preprocessing.sub_sets as sub_sets
 import preprocessing.vectorization as vectorization
+import preprocessing.word_counts as word_counts
+import preprocessing.shards as shards
 import classification.baseline as baseline
 import classification.classification_XGboost as classification_XGBoost
+import classification.bundle as bundle
 import classification.metrics as metrics
 
 import tools.pick_call as pick_call
+import tools.parallel as parallel
+import tools.profiling as profiling
+import copy
+import numpy as np
+from functools import partial
 import os
 import time
 import sys
 import getopt
 import ast
+from datetime import datetime
 
 # PATH_experiment is the name of the folder that will contain the pickles
 # of the experiments.
 PATH_experiment = 'experiments/'
 if not os.path.exists(PATH_experiment):
     os.mkdir(PATH_experiment)
+# PATH_cache is the folder containing the results of the stages of the runs,
+# shared by all the experiments (see run_stage).
+PATH_cache = PATH_experiment + 'cache/'
+if not os.path.exists(PATH_cache):
+    os.mkdir(PATH_cache)
+
+# Experiment fields on which the result of each stage depends.
+STAGE_FIELDS = {
+    'data': ['path_data', 'raw_logs', 'date_from', 'date_to', 'job_names'],
+    'sets': ['ngram', 'fail_mask', 'oversampling', 'seed', 'sparse_counts'],
+    'vectors': ['ngram', 'kbest_thresh', 'kbest_mode', 'kbest_chunk_size', 'hash_bits'],
+    'sets_10fold': [],
+    'vectors_10fold': ['ngram', 'fail_mask', 'oversampling', 'seed', 'kbest_thresh',
+                       'kbest_mode', 'kbest_chunk_size', 'hash_bits'],
+}
 
 
 class Experiment():
@@ -25,39 +49,132 @@ class Experiment():
 
     contains all the settings you want to define for you experiments:
     - path_data    : path to the build log dataset already processed (see go processor)
+    - raw_logs     : if path_data contains the raw .log files, whose vocabulary is
+                     extracted while loading them (see preprocessing/extract.py)
+    - date_from    : only the jobs started at or after this datetime are loaded
+                     (None for no filter)
+    - date_to      : only the jobs started before this datetime are loaded
+                     (None for no filter)
+    - job_names    : list of the jobNames of the jobs loaded (None for all)
     - setting_name : setting identifier (will be the name of you pickle folder)
     - ngram        : list of N considered for the ngram feature_extraction
     - oversampling : if the training set must be oversampled or not
+    - seed         : seed of the oversampling (None for not reproducible draws)
     - fail_mask    : mask to filter which subsets must only contain fails (Train/None/All)
     - kbest_thresh : number of features that need to be selected by kbest_t
+    - kbest_mode   : selection of the features from the kbest preselection of 
+                     the paper (chunks), or from the statistics of the training 
+                     set computed in one pass (stats, approximate)
+    - kbest_chunk_size: size of the sub training sets of the kbest preselection 
+                     (or of the pass)
+    - hash_bits    : if not None, the preselection is done on 2**hash_bits hashed 
+                     features, instead of the whole vocabulary
     - alpha        : weight of model 1 in prediction (and 100-alpha is weight of model 2)
-                     value in 0-100 (multiples of 10)
+                     value in 0-100 (multiples of grid_step)
     - beta         : threshold for prediction flaky.
-                     value in 10-90 (multiples of 10)
+                     value in 10-90 (multiples of grid_step)
+    - grid_step    : step of the alpha and beta values evaluated (divides 100)
+    - tree_method  : tree construction algorithm of XGBoost (exact/approx/hist/auto)
+    - nthread      : number of threads of XGBoost (None for all the cores)
+    - max_depth    : maximum depth of the trees of the models
+    - eta          : learning rate of the models
+    - rounds       : maximum number of boosting rounds of the models
+    - early_stopping: number of rounds without improvement on the validation 
+                     set before stopping the training (0 to disable)
+    - shap_mode    : how the SHAP values of model 1 (features of model 2) are
+                     computed (shap/contribs/approx), see classification_XGboost.py
+    - sparse_counts: if the word counts are kept in a sparse count store 
+                     (counts.npz) instead of dictionaries in the dataset
+    - workers      : number of processes used to load the dataset and for the
+                     kbest preselection
+    - jobs         : number of runs of the 10fold cross validation done in 
+                     parallel (each run then does its kbest preselection with 
+                     one process)
+    - cache_size   : maximum size (in GB) of the stage cache, the least recently
+                     used stages are removed above it (None for no limit)
+    - cache_format : format of the stage cache (pickle/feather/parquet), see 
+                     tools/serialization.py
+    - cache_compression: compression of the stage cache (None/lz4/zstd), 
+                     feather and parquet formats only
+    - cache_mmap   : if the uncompressed stage cache is memory-mapped at loading
+    - cprofile     : if a cProfile dump of each stage is saved in the folder 
+                     cprofile/ of the experiment (see tools/profiling.py)
     '''
 
     def __init__(self,
                  path_data,
+                 raw_logs=False,
+                 date_from=None,
+                 date_to=None,
+                 job_names=None,
                  setting_name='default',
                  ngram=[2],
                  oversampling=True,
+                 seed=None,
                  fail_mask='Train',
                  kbest_thresh=300,
+                 kbest_mode='chunks',
+                 kbest_chunk_size=1000,
+                 hash_bits=None,
                  alpha=70,
-                 beta=10.
+                 beta=10.,
+                 grid_step=10,
+                 tree_method='exact',
+                 nthread=None,
+                 max_depth=100,
+                 eta=1.,
+                 rounds=50,
+                 early_stopping=3,
+                 shap_mode='shap',
+                 sparse_counts=False,
+                 workers=1,
+                 jobs=1,
+                 cache_size=None,
+                 cache_format='pickle',
+                 cache_compression=None,
+                 cache_mmap=False,
+                 cprofile=False
                  ):
         self.path_data = path_data
+        self.raw_logs = raw_logs
+        self.date_from = date_from
+        self.date_to = date_to
+        self.job_names = job_names
         self.path_exp = PATH_experiment + setting_name + '/'
+        self.path_cache = PATH_cache
 
         if not os.path.exists(self.path_exp):
             os.mkdir(self.path_exp)
         # Hyperparam
         self.ngram = ngram
         self.oversampling = oversampling
+        self.seed = seed
         self.fail_mask = fail_mask
         self.kbest_thresh = kbest_thresh
+        self.kbest_mode = kbest_mode
+        self.kbest_chunk_size = kbest_chunk_size
+        self.hash_bits = hash_bits
         self.alpha = alpha
         self.beta = beta
+        self.grid_step = grid_step
+        # XGBoost training
+        self.tree_method = tree_method
+        self.nthread = nthread
+        self.max_depth = max_depth
+        self.eta = eta
+        self.rounds = rounds
+        self.early_stopping = early_stopping
+        self.shap_mode = shap_mode
+        # Data representation
+        self.sparse_counts = sparse_counts
+        # Execution
+        self.workers = workers
+        self.jobs = jobs
+        self.cache_size = cache_size
+        self.cache_format = cache_format
+        self.cache_compression = cache_compression
+        self.cache_mmap = cache_mmap
+        self.cprofile = cprofile
 
 
 def results_print(BASELINES, XGB):
@@ -75,116 +192,562 @@ def results_print(BASELINES, XGB):
     print('{:12s} | {:12s} {:12s} {:12s} {:12s} |'.format(*list))
 
 
-def run_cross_val(p, recompute=False):
+def max_cache_bytes(p):
     '''
-    Cross validation run with experiment p.
-    This function only trains one model with randomly selected Train(90%)/Valid(5%)/Test(5%) sets.
+    Returns the maximum size in bytes of the stage cache for experiment p.
+    '''
+    if p.cache_size is None:
+        return None
+    return int(p.cache_size * 2**30)
+
+
+def cache_filename(p, name, key):
+    '''
+    Returns the filename of the stage 'name' with cache key 'key' for 
+    experiment p (the extension depends on p.cache_format).
+    '''
+    return pick_call.cache_filename(p.path_cache, name, key,
+                                    pick_call.CACHE_EXT[p.cache_format])
+
+
+def stage_key(p, name, fun, upstream=[], extra={}):
+    '''
+    Returns the cache key of the stage 'name' computed by 'fun' for experiment p.
+    It depends on the fields STAGE_FIELDS[name] of p, on the 'extra' parameters 
+    and on the keys of the 'upstream' stages (see pick_call.stage_key).
+    '''
+    params = {f: getattr(p, f) for f in STAGE_FIELDS[name]}
+    params.update(extra)
+    return pick_call.stage_key(fun, params, upstream)
+
+
+def cprofile_filename(p, name, extra={}):
+    '''
+    Returns the filename of the cProfile dump of the stage 'name' (with the 
+    'extra' parameters of its key) for experiment p, None if p.cprofile = False.
+    '''
+    if not p.cprofile:
+        return None
+    suffix = ''.join('_%s%s' % (k, v) for k, v in sorted(extra.items()))
+    return p.path_exp + 'cprofile/' + name + suffix + '.prof'
+
+
+def save_profile(p, run, start_time, start_cpu, stages):
+    '''
+    Saves the profile of the run 'run' of experiment p and of its stages 
+    'stages' in experiments/<setting_name>/profile_<date>.json (see 
+    tools/profiling.py).
+    '''
+    filename = p.path_exp + 'profile_' + time.strftime('%Y%m%d_%H%M%S') + '.json'
+    run_info = {'run': run,
+                'experiment': vars(p),
+                'wall': round(time.time() - start_time, 4),
+                'cpu': round(profiling.cpu_time() - start_cpu, 4),
+                'peak_rss_mb': profiling.peak_rss()}
+    profiling.save(filename, run_info, stages)
+    print('Profile saved in', filename)
+
+
+def run_stage(p, name, fun, args, upstream=[], extra={}, recompute=False, do_print=True,
+              ext=None, dump=None, load=None):
+    '''
+    Runs the stage 'name' of experiment p, fun(**args), or loads its result from 
+    the stage cache if the stage was already computed with the same inputs 
+    (see stage_key).
+    The result is saved in the format p.cache_format, or with the functions 
+    'dump' and 'load' in a file with extension 'ext' (see pick_call.run_and_cache).
+    The stage is profiled (see tools/profiling.py).
+    Returns the result of the stage and its cache key.
+    '''
+    key = stage_key(p, name, fun, upstream, extra)
+    filename = cache_filename(p, name, key)
+    if ext is not None:
+        filename = pick_call.cache_filename(p.path_cache, name, key, ext)
+    cache = 'hit' if not recompute and os.path.exists(filename) else 'miss'
+    with profiling.stage(name, inputs=args, cprofile=cprofile_filename(p, name, extra),
+                         key=key, cache=cache, **extra) as profile:
+        COMPUTED = pick_call.run_and_cache(fun,
+                                           args,
+                                           filename,
+                                           recompute=recompute,
+                                           do_print=do_print,
+                                           max_size=max_cache_bytes(p),
+                                           compression=p.cache_compression,
+                                           mmap=p.cache_mmap,
+                                           dump=dump,
+                                           load=load)
+        profile['result'] = COMPUTED
+    return COMPUTED, key
+
+
+def data_function(p):
+    '''
+    Returns the function loading the dataset of experiment p: from the shards 
+    if p.path_data is a packed dataset (see preprocessing/shards.py), else 
+    from the log files.
+    '''
+    return shards.get_packed_data if shards.is_packed(p.path_data) else get_data.get_data
 
-    The different stages of the run are pickled to reduce second run computation time.
-    If you don't want to use the existing pickle, set recompute = True.
+
+def load_word_count_data(p, recompute=False, update=False):
+    '''
+    Loads the dataset of experiment p from the stage cache.
+    If update = True, the cached dataset is refreshed with the log files added 
+    or modified since it was computed, using the manifest data_manifest.p of 
+    the experiment, instead of being used as is. Its key then depends on the 
+    manifest, so the next stages are recomputed if the dataset changed.
+    Returns the dataset and its cache key.
     '''
+    if not update:
+        return run_stage(p, 'data', data_function(p), {'P': p}, recompute=recompute)
+
+    assert not shards.is_packed(p.path_data), 'a packed dataset can not be updated'
+    manifest_filename = p.path_exp + 'data_manifest.p'
+    DATA, manifest, key = None, {}, None
+    if not recompute and os.path.exists(manifest_filename):
+        manifest, key = pick_call.pickle_load(manifest_filename)
+        filename = cache_filename(p, 'data', key)
+        if os.path.exists(filename):
+            DATA = pick_call.stage_load(filename, mmap=p.cache_mmap)
+        else:  # removed from the cache: parse everything again
+            manifest, key = {}, None
+
     start_time = time.time()
+    print('Update', p.path_data, end=' ... ')
+    with profiling.stage('data', inputs=DATA, cprofile=cprofile_filename(p, 'data'),
+                         cache='update') as profile:
+        DATA, new_manifest = get_data.update_data(p, DATA, manifest)
+        if key is None or new_manifest != manifest:
+            key = stage_key(p, 'data', get_data.update_data,
+                            extra={'manifest': sorted(new_manifest.items())})
+            pick_call.stage_dump(DATA, cache_filename(p, 'data', key),
+                                 compression=p.cache_compression)
+            pick_call.pickle_dump((new_manifest, key), manifest_filename)
+        profile['result'] = DATA
+        profile['key'] = key
+    pick_call.touch(cache_filename(p, 'data', key))
+    pick_call.evict_lru(p.path_cache, max_cache_bytes(p))
+    print('Done in', round(time.time() - start_time, 2), 'sec')
+    return DATA, key
+
+
+def load_data(p, recompute=False, update=False):
+    '''
+    Loads the dataset of experiment p (see load_word_count_data).
+    If p.sparse_counts = True, the word counts are moved from the dataset to a 
+    sparse count store (see preprocessing/word_counts.py) saved in counts_*.npz, 
+    and the rest of the dataset is saved in jobs_*. If they are in the stage 
+    cache, those two files are loaded directly instead of the dataset.
+    Returns the dataset, the word counts for p.ngram (None if the word counts 
+    are in the dataset) and the cache key of the dataset.
+    '''
+    if not p.sparse_counts:
+        DATA, key = load_word_count_data(p, recompute=recompute, update=update)
+        return DATA, None, key
+
+    if update:
+        DATA, key = load_word_count_data(p, recompute=recompute, update=update)
+    else:
+        key = stage_key(p, 'data', data_function(p))
+    store_key = pick_call.stage_key(word_counts.split_counts, upstream=[key])
+    jobs_filename = cache_filename(p, 'jobs', store_key)
+    store_filename = pick_call.cache_filename(p.path_cache, 'counts', store_key, '.npz')
+    stored = os.path.exists(jobs_filename) and os.path.exists(store_filename)
+
+    if not update and (recompute or not stored):
+        DATA, key = load_word_count_data(p, recompute=recompute)
 
-    DATA = pick_call.run_and_pickle(get_data.get_data,
-                                    {'P': p},
-                                    p.path_exp + 'data.p',
-                                    recompute=recompute)
-    SETS = pick_call.run_and_pickle(sub_sets.sub_sets,
-                                    {'P': p, 'res': DATA},
-                                    p.path_exp + 'sets.p',
-                                    recompute=recompute)
-    VECTORS = pick_call.run_and_pickle(vectorization.vectorization,
-                                       {'P': p, 'sets': SETS},
-                                       p.path_exp + 'vectors.p',
-                                       recompute=recompute)
-
-    BASELINES = baseline.baseline(p, DATA)
-    BIG = classification_XGBoost.classify_XGBoost(p, VECTORS)
+    start_time = time.time()
+    cache = 'hit' if stored and not recompute else 'miss'
+    with profiling.stage('counts', inputs=None if cache == 'hit' else DATA,
+                         cprofile=cprofile_filename(p, 'counts'),
+                         key=store_key, cache=cache) as profile:
+        if cache == 'hit':
+            print('Load ', store_filename, end=' ... ')
+            DATA = pick_call.stage_load(jobs_filename, mmap=p.cache_mmap)
+            STORE = word_counts.load_store(store_filename)
+        else:
+            print('Store', store_filename, end=' ... ')
+            DATA, STORE = word_counts.split_counts(DATA)
+            pick_call.stage_dump(DATA, jobs_filename, compression=p.cache_compression)
+            word_counts.save_store(STORE, store_filename)
+        profile['result'] = (DATA, STORE)
+    pick_call.touch(jobs_filename)
+    pick_call.touch(store_filename)
+    pick_call.evict_lru(p.path_cache, max_cache_bytes(p))
+    print('Done in', round(time.time() - start_time, 2), 'sec')
+    return DATA, word_counts.select_ngrams(STORE, p.ngram), key
+
+
+def run_cross_val(p, recompute=False, update=False, save_model=False):
+    '''
+    Cross validation run with experiment p.
+    This function only trains one model with randomly selected Train(90%)/Valid(5%)/Test(5%) sets.
+    If save_model = True, the trained models are saved with their features in 
+    a model bundle (see classification/bundle.py) to classify new logs.
+
+    The different stages of the run are cached to reduce second run computation time.
+    A stage is only recomputed if its inputs changed (see run_stage).
+    If you don't want to use the existing cache, set recompute = True.
+    If you want to add the new logs to the existing dataset, set update = True.
+    The profile of the run is saved in the experiment folder (see save_profile).
+    '''
+    start_time = time.time()
+    start_cpu = profiling.cpu_time()
+
+    DATA, COUNTS, data_key = load_data(p, recompute=recompute, update=update)
+    SETS, sets_key = run_stage(p, 'sets', sub_sets.sub_sets,
+                               {'P': p, 'res': DATA},
+                               upstream=[data_key],
+                               recompute=recompute)
+    VECTORS, _ = run_stage(p, 'vectors', vectorization.vectorization,
+                           {'P': p, 'sets': SETS, 'counts': COUNTS},
+                           upstream=[sets_key],
+                           recompute=recompute)
+
+    with profiling.stage('baseline', inputs=DATA, cprofile=cprofile_filename(p, 'baseline')):
+        BASELINES = baseline.baseline(p, DATA)
+    with profiling.stage('classification', inputs=VECTORS,
+                         cprofile=cprofile_filename(p, 'classification')) as profile:
+        BIG, MODELS = classification_XGBoost.classify_XGBoost(p, VECTORS, return_models=True)
+        profile['result'] = BIG['%.1fvar_%dtresh' % (float(p.beta), p.alpha)]['pred']
     interest = BIG['%.1fvar_%dtresh' % (float(p.beta), p.alpha)]['result']
 
+    if save_model:
+        bundle.save_bundle(bundle.make_bundle(p, VECTORS, MODELS),
+                           p.path_exp + bundle.BUNDLE_NAME)
+        print('Model saved in', p.path_exp + bundle.BUNDLE_NAME)
+
     results_print(BASELINES, interest)
+    save_profile(p, 'cross_val', start_time, start_cpu, profiling.pop_stages())
     print('===== TOTAL TIME: ', round(time.time() - start_time, 2), 'sec =====')
 
 
-def run_10cross_val(p, recompute=False):
+# number of alpha/beta whose 10fold predictions are evaluated at once
+GRID_CHUNK = 100
+# word counts of the 10fold runs, shared by the processes (see set_fold_counts)
+FOLD_COUNTS = None
+
+
+def set_fold_counts(counts):
     '''
-    double 10fold cross validation run with experiment p.
-    This function does a 10fold cross validation with 2 runs at each fold (see paper).
+    Sets the word counts used by run_fold in the current process.
+    '''
+    global FOLD_COUNTS
+    FOLD_COUNTS = counts
 
-    The different stages of the run are pickled to reduce second run computation time.
-    If you don't want to use the existing pickle, set recompute = True.
+
+def run_fold(args):
+    '''
+    Vectorizes and classifies the subsets SETS of the 'fold' and 'turn' of the 
+    10fold cross validation with experiment p (see run_10cross_val).
+    Returns the labels of the test set, the predictions of the model and the 
+    profiles of the stages.
     '''
+    p, SETS, fold, turn, sets_key, recompute = args
     start_time = time.time()
 
-    DATA = pick_call.run_and_pickle(get_data.get_data,
-                                    {'P': p},
-                                    p.path_exp + 'data.p',
-                                    recompute=recompute)
+    VECTORS, key = run_stage(p, 'vectors_10fold', vectorization.vectorization,
+                             {'P': p, 'sets': SETS, 'counts': FOLD_COUNTS},
+                             upstream=[sets_key],
+                             extra={'fold': fold, 'turn': turn},
+                             recompute=recompute,
+                             do_print=p.jobs <= 1)
+
+    extra = {'fold': fold, 'turn': turn}
+    with profiling.stage('classification', inputs=VECTORS,
+                         cprofile=cprofile_filename(p, 'classification', extra),
+                         **extra) as profile:
+        BIG = classification_XGBoost.classify_XGBoost(p, VECTORS)
+        profile['result'] = BIG['%.1fvar_%dtresh' % (float(p.beta), p.alpha)]['pred']
 
-    sets_10fold = pick_call.run_and_pickle(sub_sets.tenfolds_half_sets,
-                                           {'res': DATA},
-                                           p.path_exp + 'sets_10fold.p',
-                                           recompute=recompute)
+    if p.jobs > 1:
+        print('Done run%d_turn%d (vectors_10fold_%s) and its classification in' % (fold+1, turn+1, key),
+              round(time.time() - start_time, 2), 'sec')
+    return VECTORS['test']['y'], BIG, profiling.pop_stages()
 
+
+def run_10cross_val(p, recompute=False, update=False):
+    '''
+    double 10fold cross validation run with experiment p.
+    This function does a 10fold cross validation with 2 runs at each fold (see paper).
+    The 20 runs are done by p.jobs processes. Their subsets are generated in 
+    order by the main process, and their predictions are merged in order, so 
+    the results do not depend on p.jobs.
+
+    The different stages of the run are cached to reduce second run computation time.
+    A stage is only recomputed if its inputs changed (see run_stage).
+    If you don't want to use the existing cache, set recompute = True.
+    If you want to add the new logs to the existing dataset, set update = True.
+    The profile of the run is saved in the experiment folder (see save_profile).
+    '''
+    start_time = time.time()
+    start_cpu = profiling.cpu_time()
+
+    DATA, COUNTS, data_key = load_data(p, recompute=recompute, update=update)
+    if COUNTS is None:
+        # the word counts are put in a count matrix once, and each of the 20
+        # runs only takes the rows of its subsets
+        with profiling.stage('counts', inputs=DATA, cprofile=cprofile_filename(p, 'counts'),
+                             cache='none') as profile:
+            DATA, STORE = word_counts.split_counts(DATA)
+            COUNTS = word_counts.select_ngrams(STORE, p.ngram)
+            profile['result'] = COUNTS
+
+    # the subsets are arrays of line ids of DATA
+    sets_10fold, sets_key = run_stage(p, 'sets_10fold', sub_sets.tenfolds_half_sets,
+                                      {'res': DATA},
+                                      upstream=[data_key],
+                                      recompute=recompute,
+                                      ext='.npz',
+                                      dump=sub_sets.save_splits,
+                                      load=sub_sets.load_splits)
+
+    p_run = p
+    if p.jobs > 1:  # no process pool inside of the runs, cores shared by the runs
+        p_run = copy.copy(p)
+        p_run.workers = 1
+        if p.nthread is None:
+            p_run.nthread = max(1, (os.cpu_count() or 1) // p.jobs)
+
+    def runs():
+        for fold in range(10):
+            for turn in range(2):
+                SETS = sub_sets.sub_sets_10fold(
+                    **{'P': p, 'res': DATA, 'sets': sets_10fold, 'fold': fold, 'turn': turn})
+                yield p_run, SETS, fold, turn, sets_key, recompute
+
+    # the runs send back the profiles of their stages
+    stages = profiling.pop_stages()
+    real = []
     all_PRED = {}
-    for fold in range(10):
-        for turn in range(2):
-            SETS = sub_sets.sub_sets_10fold(
-                **{'P': p, 'sets': sets_10fold, 'fold': fold, 'turn': turn})
-
-            VECTORS = pick_call.run_and_pickle(vectorization.vectorization,
-                                               {'P': p, 'sets': SETS},
-                                               p.path_exp +
-                                               'vectors_10fold_run%d_turn%d.p' % (fold+1, turn+1),
-                                               recompute=recompute)
-
-            BIG = classification_XGBoost.classify_XGBoost(p, VECTORS)
-
-            for i in BIG:
-                if i not in all_PRED:
-                    all_PRED[i] = {
-                        'real': list(
-                            VECTORS['test']['y']),
-                        'pred': BIG[i]['pred']}
-                else:
-                    all_PRED[i]['real'] += VECTORS['test']['y']
-                    all_PRED[i]['pred'] += BIG[i]['pred']
-
-    all_BIG = {
-        i: metrics.compute_metrics(
-            all_PRED[i]['real'],
-            all_PRED[i]['pred']) for i in all_PRED}
+    for y, BIG, run_stages in parallel.pool_imap(run_fold, runs(), workers=p.jobs,
+                                                 initializer=set_fold_counts,
+                                                 initargs=(COUNTS,)):
+        stages += run_stages
+        real += y
+        for i in BIG:
+            all_PRED.setdefault(i, []).append(BIG[i]['pred'])
+
+    # the predictions of the 20 runs are rounded (see metrics.compute_metrics)
+    # and evaluated for GRID_CHUNK alpha/beta at once
+    keys = list(all_PRED)
+    all_BIG = {}
+    for c in range(0, len(keys), GRID_CHUNK):
+        result = metrics.compute_metrics_grid(
+            real, np.round([np.concatenate(all_PRED[i]) for i in keys[c:c + GRID_CHUNK]]))
+        for j, i in enumerate(keys[c:c + GRID_CHUNK]):
+            all_BIG[i] = {k: float(v[j]) for k, v in result.items()}
     interest = all_BIG['%.1fvar_%dtresh' % (float(p.beta), p.alpha)]
-    BASELINES = baseline.baseline(p, DATA)
+    with profiling.stage('baseline', inputs=DATA, cprofile=cprofile_filename(p, 'baseline')):
+        BASELINES = baseline.baseline(p, DATA)
 
     results_print(BASELINES, interest)
+    save_profile(p, '10cross_val', start_time, start_cpu, stages + profiling.pop_stages())
 
     print('===== TOTAL TIME: ', round(time.time() - start_time, 2), 'sec =====')
 
 
+# model bundle of the scoring, shared by the processes (see set_score_bundle)
+SCORE_BUNDLE = None
+# columns of the predictions file of run_score
+SCORE_COLUMNS = ["filename", "date", "jobID", "commitID", "status", "jobName", "rerun",
+                 "commit_since_flaky", "model1", "model2", "probability", "brown"]
+
+
+def set_score_bundle(BUNDLE):
+    '''
+    Sets the model bundle used by score_batch in the current process.
+    '''
+    global SCORE_BUNDLE
+    SCORE_BUNDLE = BUNDLE
+
+
+def score_batch(jobs, raw_logs=False):
+    '''
+    Reads the logs of the batch of jobs 'jobs' (dataframe with the metadata 
+    and the INFO_COLUMNS of the jobs) and classifies them at once with 
+    SCORE_BUNDLE (see bundle.predict). If raw_logs = True, the logs are raw 
+    logs whose vocabulary is extracted (see preprocessing/extract.py).
+    Returns the predictions as a dataframe with SCORE_COLUMNS.
+    '''
+    counts = [get_data.get_text_count(f, raw_logs) for f in jobs["filename"].tolist()]
+    PRED = bundle.predict(SCORE_BUNDLE, counts,
+                          jobs[SCORE_BUNDLE['info_features']].to_numpy())
+
+    jobs = jobs.copy()
+    for k in ['model1', 'model2', 'probability', 'brown']:
+        jobs[k] = PRED[k]
+    return jobs[SCORE_COLUMNS]
+
+
+def run_score(model, path_data, output=None, batch_size=1000, workers=1, raw_logs=False):
+    '''
+    Classifies all the log files at the path 'path_data' (raw logs if 
+    raw_logs = True) with the model bundle saved in 'model' (see 
+    run_cross_val), without retraining, and writes the predictions in the 
+    CSV file 'output' (default: scores.csv next to 'model').
+    The logs are read and classified by batches of 'batch_size' jobs with 
+    'workers' processes, and the predictions are written as the batches are 
+    done, so the memory used does not depend on the number of logs.
+    The rerun and commit_since_flaky metrics of the jobs are computed from the 
+    filenames of all the logs at 'path_data' (see sub_sets.get_info_rerun).
+    '''
+    assert not shards.is_packed(path_data), 'the logs of a packed dataset can not be scored'
+    start_time = time.time()
+    if output is None:
+        output = os.path.join(os.path.dirname(model), 'scores.csv')
+    BUNDLE = bundle.load_bundle(model)
+    bundle.check_logs(BUNDLE, raw_logs)
+    jobs = sub_sets.get_info_rerun(get_data.get_metadata(path_data, raw_logs))
+    print('Scoring', jobs.shape[0], 'jobs of', path_data, 'with', model)
+
+    batches = (jobs.iloc[i:i + batch_size] for i in range(0, jobs.shape[0], batch_size))
+    nbr_brown = 0
+    with open(output, 'w', newline='') as f:
+        f.write(','.join(SCORE_COLUMNS) + '\n')
+        for PRED in parallel.pool_imap(partial(score_batch, raw_logs=raw_logs), batches,
+                                       workers=workers,
+                                       initializer=set_score_bundle, initargs=(BUNDLE,)):
+            PRED.to_csv(f, header=False, index=False)
+            nbr_brown += int(PRED['brown'].sum())
+
+    total_time = time.time() - start_time
+    print('Predictions saved in', output, '(%d brown builds)' % nbr_brown)
+    print('===== TOTAL TIME: ', round(total_time, 2), 'sec (%.1f jobs/s) =====' %
+          (jobs.shape[0] / max(total_time, 1e-9)))
+
+
 if __name__ == "__main__":
+    if sys.argv[1:2] == ['score']:
+        try:
+            opts, _ = getopt.getopt(sys.argv[2:], 'm:d:', ['model=',
+                                                           'path_data=',
+                                                           'output=',
+                                                           'batch_size=',
+                                                           'workers=',
+                                                           'raw_logs='])
+        except getopt.GetoptError:
+            print('main.py score -m <model_bundle> -d <data_path> [--output <str>] [--batch_size <int>] [--workers <int>] [--raw_logs <bool>]')
+            sys.exit(2)
+
+        params = {}
+        for arg, val in opts:
+            if arg in ['-m', '--model']:
+                params['model'] = val
+            elif arg in ['-d', '--path_data']:
+                params['path_data'] = val
+            elif arg == '--output':
+                params['output'] = val
+            elif arg == '--batch_size':
+                assert int(val) > 0
+                params['batch_size'] = int(val)
+            elif arg == '--workers':
+                assert int(val) > 0
+                params['workers'] = int(val)
+            elif arg == '--raw_logs':
+                assert val in ['True', 'False']
+                params['raw_logs'] = ast.literal_eval(val)
+
+        assert 'model' in params and 'path_data' in params, 'main.py score -m <model_bundle> -d <data_path>'
+        run_score(**params)
+        sys.exit(0)
+
+    if sys.argv[1:2] == ['pack']:
+        try:
+            opts, _ = getopt.getopt(sys.argv[2:], 'd:o:', ['path_data=',
+                                                           'output=',
+                                                           'raw_logs=',
+                                                           'shard_size=',
+                                                           'workers='])
+        except getopt.GetoptError:
+            print('main.py pack -d <data_path> -o <packed_path> [--raw_logs <bool>] [--shard_size <int>] [--workers <int>]')
+            sys.exit(2)
+
+        params = {}
+        for arg, val in opts:
+            if arg in ['-d', '--path_data']:
+                params['DATA_PATH'] = val
+            elif arg in ['-o', '--output']:
+                params['OUT_PATH'] = val
+            elif arg == '--raw_logs':
+                assert val in ['True', 'False']
+                params['raw'] = ast.literal_eval(val)
+            elif arg == '--shard_size':
+                assert int(val) > 0
+                params['shard_size'] = int(val)
+            elif arg == '--workers':
+                assert int(val) > 0
+                params['workers'] = int(val)
+
+        assert 'DATA_PATH' in params and 'OUT_PATH' in params, 'main.py pack -d <data_path> -o <packed_path>'
+        start_time = time.time()
+        index = shards.pack(**params)
+        print('Packed', index.shape[0], 'jobs in', index["shard"].nunique(), 'shards in',
+              params['OUT_PATH'])
+        print('===== TOTAL TIME: ', round(time.time() - start_time, 2), 'sec =====')
+        sys.exit(0)
+
     try:
         opts, _ = getopt.getopt(sys.argv[1:], 'd:', ['path_data=',
+                                                     'raw_logs=',
+                                                     'date_from=',
+                                                     'date_to=',
+                                                     'job_names=',
                                                      'setting_name=',
                                                      'ngram=',
                                                      'oversampling=',
+                                                     'seed=',
                                                      'fail_mask=',
                                                      'kbest_thresh=',
+                                                     'kbest_mode=',
+                                                     'kbest_chunk_size=',
+                                                     'hash_bits=',
                                                      'alpha=',
                                                      'beta=',
+                                                     'grid_step=',
+                                                     'tree_method=',
+                                                     'nthread=',
+                                                     'max_depth=',
+                                                     'eta=',
+                                                     'rounds=',
+                                                     'early_stopping=',
+                                                     'shap_mode=',
+                                                     'sparse_counts=',
+                                                     'workers=',
+                                                     'jobs=',
+                                                     'cache_size=',
+                                                     'cache_format=',
+                                                     'cache_compression=',
+                                                     'cache_mmap=',
+                                                     'cprofile=',
                                                      '10fold',
-                                                     'recompute'])
+                                                     'recompute',
+                                                     'update',
+                                                     'save_model'])
     except getopt.GetoptError:
-        print('main.py -d <data_path> [--setting_name <string>] [--ngram <list int>] [--oversampling <bool>] [--fail_mask <Train/Valid/All>] [--kbest_thresh] <int>] [--alpha <int>] [--beta <int]')
+        print('main.py -d <data_path> [--raw_logs <bool>] [--date_from <YYYY-MM-DD>] [--date_to <YYYY-MM-DD>] [--job_names <list str>] [--setting_name <string>] [--ngram <list int>] [--oversampling <bool>] [--seed <int>] [--fail_mask <Train/Valid/All>] [--kbest_thresh] <int>] [--kbest_mode <chunks/stats>] [--kbest_chunk_size <int>] [--hash_bits <int>] [--alpha <int>] [--beta <int>] [--grid_step <int>] [--tree_method <exact/approx/hist/auto>] [--nthread <int>] [--max_depth <int>] [--eta <float>] [--rounds <int>] [--early_stopping <int>] [--shap_mode <shap/contribs/approx>] [--sparse_counts <bool>] [--workers <int>] [--jobs <int>] [--cache_size <float>] [--cache_format <pickle/feather/parquet>] [--cache_compression <lz4/zstd>] [--cache_mmap <bool>] [--cprofile <bool>] [--10fold] [--recompute] [--update] [--save_model]')
         sys.exit(2)
 
     fun = run_cross_val
     recompute = False
+    update = False
+    save_model = False
 
     params = {}
     for arg, val in opts:
         if arg in ['-d', '--path_data']:
             params['path_data'] = val
+        elif arg == '--raw_logs':
+            assert val in ['True', 'False']
+            params['raw_logs'] = ast.literal_eval(val)
+        elif arg == '--date_from':
+            params['date_from'] = datetime.strptime(val, '%Y-%m-%d')
+        elif arg == '--date_to':
+            params['date_to'] = datetime.strptime(val, '%Y-%m-%d')
+        elif arg == '--job_names':
+            assert isinstance(ast.literal_eval(val), list)
+            params['job_names'] = ast.literal_eval(val)
         elif arg == '--setting_name':
             params['setting_name'] = val
         elif arg == '--ngram':
@@ -193,26 +756,101 @@ if __name__ == "__main__":
         elif arg == '--oversampling':
             assert val in ['True', 'False']
             params['oversampling'] = ast.literal_eval(val)
+        elif arg == '--seed':
+            params['seed'] = int(val)
         elif arg == '--fail_mask':
             assert val in ['Train', 'None', 'All']
             params['fail_mask'] = val
         elif arg == '--kbest_thresh':
             assert int(val) > 0
             params['kbest_thresh'] = int(val)
+        elif arg == '--kbest_mode':
+            assert val in ['chunks', 'stats']
+            params['kbest_mode'] = val
+        elif arg == '--kbest_chunk_size':
+            assert int(val) > 0
+            params['kbest_chunk_size'] = int(val)
+        elif arg == '--hash_bits':
+            assert 0 < int(val) <= 30
+            params['hash_bits'] = int(val)
         elif arg == '--alpha':
-            assert int(val) in [i*10 in range(,11)]
+            assert 0 <= int(val) <= 100
             params['alpha'] = int(val)
         elif arg == '--beta':
-            assert int(val) in [i*10 in range(1,10)]
+            assert 0 < int(val) < 100
             params['beta'] = int(val)
+        elif arg == '--grid_step':
+            assert int(val) > 0 and 100 % int(val) == 0
+            params['grid_step'] = int(val)
+        elif arg == '--tree_method':
+            assert val in classification_XGBoost.TREE_METHODS
+            params['tree_method'] = val
+        elif arg == '--nthread':
+            assert int(val) > 0
+            params['nthread'] = int(val)
+        elif arg == '--max_depth':
+            assert int(val) > 0
+            params['max_depth'] = int(val)
+        elif arg == '--eta':
+            assert float(val) > 0
+            params['eta'] = float(val)
+        elif arg == '--rounds':
+            assert int(val) > 0
+            params['rounds'] = int(val)
+        elif arg == '--early_stopping':
+            assert int(val) >= 0
+            params['early_stopping'] = int(val)
+        elif arg == '--shap_mode':
+            assert val in classification_XGBoost.SHAP_MODES
+            params['shap_mode'] = val
+        elif arg == '--sparse_counts':
+            assert val in ['True', 'False']
+            params['sparse_counts'] = ast.literal_eval(val)
+        elif arg == '--workers':
+            assert int(val) > 0
+            params['workers'] = int(val)
+        elif arg == '--jobs':
+            assert int(val) > 0
+            params['jobs'] = int(val)
+        elif arg == '--cache_size':
+            assert float(val) > 0
+            params['cache_size'] = float(val)
+        elif arg == '--cache_format':
+            assert val in pick_call.CACHE_EXT
+            params['cache_format'] = val
+        elif arg == '--cache_compression':
+            assert val in ['lz4', 'zstd']
+            params['cache_compression'] = val
+        elif arg == '--cache_mmap':
+            assert val in ['True', 'False']
+            params['cache_mmap'] = ast.literal_eval(val)
+        elif arg == '--cprofile':
+            assert val in ['True', 'False']
+            params['cprofile'] = ast.literal_eval(val)
         elif arg == '--10fold':
             fun = run_10cross_val
         elif arg == '--recompute':
             recompute = True
+        elif arg == '--update':
+            update = True
+        elif arg == '--save_model':
+            save_model = True
+
+    if save_model:
+        assert fun == run_cross_val, '--save_model is only available without --10fold'
+        fun = partial(run_cross_val, save_model=True)
+
+    grid_step = params.get('grid_step', 10)
+    assert params.get('alpha', 70) % grid_step == 0 and params.get('beta', 10) % grid_step == 0, \
+        'alpha and beta must be multiples of grid_step'
+
+    if params.get('shap_mode', 'shap') == 'shap' and classification_XGBoost.shap is None:
+        print("--shap_mode shap requires shap (pip install shap), use --shap_mode contribs without it")
+        sys.exit(2)
 
     print('Experiment:', params)
     p = Experiment(**params)
 
-    fun(p, recompute)
+    fun(p, recompute, update)
 
     # python .\main.py -p 'D:/DATA_pickle/DATA_graphviz_pickle/' --ngram [1] --oversampling=True
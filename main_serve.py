@@ -0,0 +1,150 @@
+import preprocessing.get_data as get_data
+import preprocessing.extract as extract
+import classification.bundle as bundle
+
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import json
+import time
+import sys
+import getopt
+
+# Fields of a job in the requests, with their default value (see make_handler)
+JOB_FIELDS = {'log': None, 'raw_log': None, 'rerun': 0, 'commit_since_flaky': 0}
+
+
+def parse_jobs(body):
+    '''
+    Reads the jobs of the JSON body 'body' of a request: one job or a list of
+    jobs, each one with the processed log (key 'log', see main_extract.go) or
+    the raw log (key 'raw_log', see preprocessing/extract.py) and optionally 
+    the metrics of the job (keys 'rerun' and 'commit_since_flaky', default=0).
+
+    Ex: body = '{"log": "#\\nerror,2\\nbuild,1\\n#\\n", "rerun": 1}'
+
+        out = [{'log': '#\\nerror,2\\nbuild,1\\n#\\n', 'raw_log': None, 'rerun': 1,
+                'commit_since_flaky': 0}]
+    '''
+    jobs = json.loads(body)
+    if isinstance(jobs, dict):
+        jobs = [jobs]
+    out = []
+    for job in jobs:
+        if not isinstance(job, dict) or \
+                [isinstance(job.get(k), str) for k in ['log', 'raw_log']].count(True) != 1:
+            raise ValueError('each job must be an object with a "log" or a "raw_log" string')
+        out.append({k: job.get(k, v) for k, v in JOB_FIELDS.items()})
+    return out
+
+
+def classify(BUNDLE, jobs):
+    '''
+    Classifies the jobs 'jobs' (see parse_jobs) with the model bundle 'BUNDLE'.
+    The jobs must have the log of the extraction of the bundle (see 
+    bundle.check_logs).
+    Returns a list with, for each job, a dictionary of its probability of
+    being a brown build, the decision (probability >= alpha) and the
+    probabilities of the two models (empty list if there is no job).
+    '''
+    if len(jobs) == 0:
+        return []
+    for job in jobs:
+        bundle.check_logs(BUNDLE, not isinstance(job['log'], str))
+    counts = [get_data.text_count(job['log']) if isinstance(job['log'], str) else
+              extract.log_count(job['raw_log'].split('\n'), get_data.MAX_NGRAM)
+              for job in jobs]
+    info = [[int(job[k]) for k in BUNDLE['info_features']] for job in jobs]
+    PRED = bundle.predict(BUNDLE, counts, info)
+    return [{'probability': float(PRED['probability'][i]),
+             'brown': bool(PRED['brown'][i]),
+             'model1': float(PRED['model1'][i]),
+             'model2': float(PRED['model2'][i])} for i in range(len(jobs))]
+
+
+def make_handler(BUNDLE):
+    '''
+    Returns the request handler of the service using the model bundle 'BUNDLE':
+    - POST /predict: classifies the jobs of the JSON body (see parse_jobs),
+      returns the result of one job (see classify) or the list of results
+      if the body is a list.
+    - GET /health: returns the features of the bundle.
+    The first prediction is done here, outside of the requests (initialisation
+    of xgboost), on an empty log of the kind of the bundle (see 
+    bundle.check_logs).
+    '''
+    empty_log = {('log', 'raw_log')[BUNDLE.get('raw_logs', False)]: ''}
+    classify(BUNDLE, [dict(JOB_FIELDS, **empty_log)])
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def send_json(self, code, data):
+            body = json.dumps(data).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path != '/health':
+                self.send_json(404, {'error': 'unknown path ' + self.path})
+                return
+            self.send_json(200, {'status': 'ok', 'ngram': BUNDLE['ngram'],
+                                 'features': len(BUNDLE['feat']),
+                                 'alpha': BUNDLE['alpha'], 'beta': BUNDLE['beta']})
+
+        def do_POST(self):
+            if self.path != '/predict':
+                self.send_json(404, {'error': 'unknown path ' + self.path})
+                return
+            body = b''
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                if length < 0:
+                    raise ValueError('negative Content-Length')
+                body = self.rfile.read(length)
+                jobs = parse_jobs(body)
+                res = classify(BUNDLE, jobs)
+            except (ValueError, TypeError) as e:
+                self.send_json(400, {'error': str(e)})
+                return
+            self.send_json(200, res if body.lstrip().startswith(b'[') else res[0])
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+if __name__ == "__main__":
+    try:
+        opts, _ = getopt.getopt(sys.argv[1:], 'm:', ['model=',
+                                                     'host=',
+                                                     'port='])
+    except getopt.GetoptError:
+        print('main_serve.py -m <model_bundle> [--host <str>] [--port <int>]')
+        sys.exit(2)
+
+    model = None
+    host = '127.0.0.1'
+    port = 8080
+    for arg, val in opts:
+        if arg in ['-m', '--model']:
+            model = val
+        elif arg == '--host':
+            host = val
+        elif arg == '--port':
+            assert int(val) > 0
+            port = int(val)
+    assert model is not None, 'main_serve.py -m <model_bundle>'
+
+    start_time = time.time()
+    BUNDLE = bundle.load_bundle(model)
+    Handler = make_handler(BUNDLE)
+    print('Model', model, 'loaded in', round(time.time() - start_time, 2), 'sec')
+
+    server = HTTPServer((host, port), Handler)
+    print('Serving on http://%s:%d/predict' % (host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
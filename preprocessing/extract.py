@@ -0,0 +1,248 @@
+import re
+from collections import Counter
+from functools import lru_cache
+from itertools import chain, islice
+
+# Substitutions of main_extract.go, applied in this order. As the '\s' of Go
+# (\t\n\f\r and space), the whitespace excludes '\v'.
+SPACE = '\t\n\f\r '
+SUBSTITUTIONS = [(re.compile(r'https?://[^%s]+' % SPACE), 'hypothesisurlforge'),
+                 (re.compile(r'[^%s]+[/\\][^%s]+' % (SPACE, SPACE)), 'hypothesispathforge'),
+                 (re.compile(r'[^%s]+\.[^%s]+' % (SPACE, SPACE)), 'hypothesispathforge'),
+                 (re.compile(r'[\d\w]*\w\d[\d\w]*', re.ASCII), 'hypothesisnumletforge'),
+                 (re.compile(r'[\d\w]+\d\w[\d\w]*', re.ASCII), 'hypothesisnumletforge'),
+                 (re.compile(r'[_\W]+', re.ASCII), ' '),
+                 (re.compile(r'([A-Z]+)'), r' \1')]
+CHUNK_REGEX = re.compile(r'[^%s]+' % SPACE)
+UPPER_REGEX = SUBSTITUTIONS[-1][0]
+# Source stop words: http://xpo6.com/list-of-english-stop-words/ (as main_extract.go)
+STOP_WORDS = frozenset([
+    "a", "about", "above", "across", "after", "afterwards", "again", "against", "all",
+    "almost", "alone", "along", "already", "also", "although", "always", "am", "among",
+    "amongst", "amoungst", "amount", "an", "and", "another", "any", "anyhow", "anyone",
+    "anything", "anyway", "anywhere", "are", "around", "as", "at", "back", "be", "became",
+    "because", "become", "becomes", "becoming", "been", "before", "beforehand", "behind",
+    "being", "below", "beside", "besides", "between", "beyond", "bill", "both", "bottom",
+    "but", "by", "call", "can", "cannot", "cant", "co", "con", "could", "couldnt", "cry",
+    "de", "describe", "detail", "do", "done", "down", "due", "during", "each", "eg",
+    "eight", "either", "eleven", "else", "elsewhere", "empty", "enough", "etc", "even",
+    "ever", "every", "everyone", "everything", "everywhere", "except", "few", "fifteen",
+    "fify", "fill", "find", "fire", "first", "five", "for", "former", "formerly", "forty",
+    "found", "four", "from", "front", "full", "further", "get", "give", "go", "had", "has",
+    "hasnt", "have", "he", "hence", "her", "here", "hereafter", "hereby", "herein",
+    "hereupon", "hers", "herself", "him", "himself", "his", "how", "however", "hundred",
+    "ie", "if", "in", "inc", "indeed", "interest", "into", "is", "it", "its", "itself",
+    "keep", "last", "latter", "latterly", "least", "less", "ltd", "made", "many", "may",
+    "me", "meanwhile", "might", "mill", "mine", "more", "moreover", "most", "mostly",
+    "move", "much", "must", "my", "myself", "name", "namely", "neither", "never",
+    "nevertheless", "next", "nine", "no", "nobody", "none", "noone", "nor", "not",
+    "nothing", "now", "nowhere", "of", "off", "often", "on", "once", "one", "only", "onto",
+    "or", "other", "others", "otherwise", "our", "ours", "ourselves", "out", "over", "own",
+    "part", "per", "perhaps", "please", "put", "rather", "re", "same", "see", "seem",
+    "seemed", "seeming", "seems", "serious", "several", "she", "should", "show", "side",
+    "since", "sincere", "six", "sixty", "so", "some", "somehow", "someone", "something",
+    "sometime", "sometimes", "somewhere", "still", "such", "system", "take", "ten", "than",
+    "that", "the", "their", "them", "themselves", "then", "thence", "there", "thereafter",
+    "thereby", "therefore", "therein", "thereupon", "these", "they", "thick", "thin",
+    "third", "this", "those", "though", "three", "through", "throughout", "thru", "thus",
+    "to", "together", "too", "top", "toward", "towards", "twelve", "twenty", "two", "un",
+    "under", "until", "up", "upon", "us", "very", "via", "was", "we", "well", "were",
+    "what", "whatever", "when", "whence", "whenever", "where", "whereafter", "whereas",
+    "whereby", "wherein", "whereupon", "wherever", "whether", "which", "while", "whither",
+    "who", "whoever", "whole", "whom", "whose", "why", "will", "with", "within", "without",
+    "would", "yet", "you", "your", "yours", "yourself", "yourselves"])
+# number of distinct chunks/words whose result is kept (see chunk_words and stem)
+CACHE_SIZE = 2**18
+# number of lines of a log tokenized at once (see log_count)
+BLOCK_LINES = 1000
+
+# Rules of the stemmer of main_extract.go (github.com/caneroj1/stemmer), a
+# Porter stemmer with its own quirks (see consonants and step1b, -izer always
+# cut, -zation kept if not -ization), as (suffix, replacement, minimum measure
+# of the stem). The first suffix of the word found is the only one tried.
+STEP2_RULES = [('ational', 'ate', 1), ('tional', 'tion', 1), ('enci', 'ence', 1),
+               ('anci', 'ance', 1), ('izer', 'ize', 0), ('abli', 'able', 1),
+               ('alli', 'al', 1), ('entli', 'ent', 1), ('eli', 'e', 1), ('ousli', 'ous', 1),
+               ('ization', 'ize', 1), ('zation', 'zation', 0), ('ation', 'ate', 1),
+               ('ator', 'ate', 1), ('alism', 'al', 1), ('iveness', 'ive', 1),
+               ('fulness', 'ful', 1), ('ousness', 'ous', 1), ('aliti', 'al', 1),
+               ('iviti', 'ive', 1), ('biliti', 'ble', 1)]
+STEP3_RULES = [('icate', 'ic', 1), ('ative', '', 1), ('alize', 'al', 1), ('iciti', 'ic', 1),
+               ('ical', 'ic', 1), ('ful', '', 1), ('ness', '', 1)]
+STEP4_RULES = [(suffix, '', 2) for suffix in
+               ['al', 'ance', 'ence', 'er', 'ic', 'able', 'ible', 'ant', 'ement', 'ment',
+                'ent', 'ion', 'ou', 'ism', 'ate', 'iti', 'ous', 'ive', 'ize']]
+
+
+def consonants(word):
+    '''
+    Returns the list of the booleans "is a consonant" of the letters of the
+    lower case word 'word', as main_extract.go: 'y' is a consonant after a
+    vowel only (so a leading 'y' is a vowel) and the digits are vowels.
+    '''
+    res = []
+    vowel = False  # previous letter
+    for c in word:
+        vowel = (not vowel) if c == 'y' else not ('a' <= c <= 'z' and c not in 'aeiou')
+        res.append(not vowel)
+    return res
+
+
+def measure(word):
+    '''
+    Returns the measure m of the word 'word' of the Porter algorithm, its
+    number of vowel-consonant sequences (see consonants).
+    '''
+    cons = consonants(word)
+    return sum(1 for i in range(1, len(cons)) if cons[i] and not cons[i - 1])
+
+
+def ends_cvc(word):
+    '''
+    Returns if the word 'word' ends with consonant-vowel-consonant, the last
+    consonant not being w, x or y.
+    '''
+    cons = consonants(word)
+    return len(word) >= 3 and cons[-3] and not cons[-2] and cons[-1] and word[-1] not in 'wxy'
+
+
+def apply_rules(word, rules):
+    '''
+    Applies to the word 'word' the first of the rules 'rules' (see
+    STEP2_RULES) whose suffix ends the word ('ion' only after s or t).
+    '''
+    for suffix, replacement, min_measure in rules:
+        if word.endswith(suffix) and (suffix != 'ion' or word[-4:-3] in ('s', 't')):
+            stem = word[:len(word) - len(suffix)]
+            return stem + replacement if measure(stem) >= min_measure else word
+    return word
+
+
+def step1b(word):
+    '''
+    Step 1b of the Porter algorithm (-eed, -ed, -ing), where main_extract.go
+    removes the last letter of any two ending consonants, not only of the
+    double letters (ex: 'existing' gives 'exis').
+    '''
+    if word.endswith('eed'):
+        return word[:-1] if measure(word[:-3]) > 0 else word
+    for suffix in ('ed', 'ing'):
+        if word.endswith(suffix):
+            stem = word[:-len(suffix)]
+            if all(consonants(stem)):  # no vowel
+                return word
+            if stem.endswith(('at', 'bl', 'iz')):
+                return stem + 'e'
+            cons = consonants(stem)
+            if len(stem) >= 2 and cons[-1] and cons[-2]:
+                return stem if stem[-1] in 'lsz' else stem[:-1]
+            if measure(stem) == 1 and ends_cvc(stem):
+                return stem + 'e'
+            return stem
+    return word
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def stem(word):
+    '''
+    Returns the stem of the lower case word 'word' with the stemmer of 
+    main_extract.go (github.com/caneroj1/stemmer, see STEP2_RULES), so that the
+    words of the raw logs are the words of the processed logs.
+
+    Ex: word = 'existing'
+
+        out = 'exis'
+    '''
+    if len(word) < 3:
+        return word
+    # step 1a
+    if word.endswith(('sses', 'ies')):
+        word = word[:-2]
+    elif word.endswith('s') and not word.endswith('ss'):
+        word = word[:-1]
+    word = step1b(word)
+    # step 1c
+    if word.endswith('y') and not all(consonants(word[:-1])):
+        word = word[:-1] + 'i'
+    word = apply_rules(apply_rules(apply_rules(word, STEP2_RULES), STEP3_RULES), STEP4_RULES)
+    # step 5a
+    if word.endswith('e'):
+        m = measure(word[:-1])
+        if m > 1 or (m == 1 and not ends_cvc(word[:-1])):
+            word = word[:-1]
+    # step 5b
+    cons = consonants(word)
+    if word.endswith('l') and len(word) >= 2 and cons[-2] and measure(word) > 1:
+        word = word[:-1]
+    return word
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def chunk_words(chunk):
+    '''
+    Returns the words of the chunk of characters without whitespace 'chunk' of
+    a log, as main_extract.go: the SUBSTITUTIONS (urls, paths and words mixing
+    numbers and letters replaced by placeholders, split on the other characters
+    and before the upper case letters), lower case, stemmed, without the
+    STOP_WORDS and the words of 2 letters or less.
+    None of the substitutions goes over a whitespace, so applying them to each
+    chunk gives the words of the whole log, and the chunks repeated in the logs
+    are only tokenized once.
+
+    Ex: chunk = 'FAILED:HttpServer(0x1f)'
+
+        out = ('fail', 'http', 'server', 'hypothesisnumletforg')
+    '''
+    if chunk.isascii() and chunk.isalpha():  # only the upper case split applies
+        txt = UPPER_REGEX.sub(r' \1', chunk)
+    else:
+        txt = chunk
+        for regex, replacement in SUBSTITUTIONS:
+            txt = regex.sub(replacement, txt)
+
+    words = [stem(w) for w in txt.lower().split()]
+    return tuple(w for w in words if len(w) > 2 and w not in STOP_WORDS)
+
+
+def text_words(txt):
+    '''
+    Returns the list of the words of the text 'txt' of a log (see chunk_words).
+    '''
+    return list(chain.from_iterable(map(chunk_words, CHUNK_REGEX.findall(txt))))
+
+
+def log_count(lines, max_ngram=2):
+    '''
+    Counts the words of the log given by its lines 'lines' (any iterable of
+    strings, ex: an open file), streamed by blocks of BLOCK_LINES lines. The 
+    N-grams are the N consecutive words joined by '_', as main_extract.go, and
+    go over the lines.
+
+    Parameters:
+    - lines    : lines of the raw log.
+    - max_ngram: maximum N of the N-grams counted (default=2).
+    Output:
+    - dic      : list of dictionary of word count for words generated with
+                 ngram where N in 1..max_ngram (see get_data.text_count).
+
+    Ex: lines = ['Build the doc\n', 'build failed\n']
+
+        out = [{'build': 2, 'doc': 1, 'fail': 1},
+               {'build_doc': 1, 'doc_build': 1, 'build_fail': 1}]
+    '''
+    dic = [Counter() for n in range(max_ngram)]
+    last = []  # last max_ngram-1 words of the previous blocks
+    lines = iter(lines)
+    while True:
+        block = list(islice(lines, BLOCK_LINES))
+        if len(block) == 0:
+            break
+        words = text_words('\n'.join(block))
+        dic[0].update(words)
+        seq = last + words
+        for n in range(2, max_ngram + 1):
+            # N-grams ending with a word of the block
+            start = max(len(last) - n + 1, 0)
+            dic[n - 1].update(map('_'.join, zip(*[seq[start + k:] for k in range(n)])))
+        last = seq[-(max_ngram - 1):] if max_ngram > 1 else []
+    return [dict(c) for c in dic]
@@ -1,74 +1,244 @@
-from os import listdir, path
+from os import getpid, path, scandir
+from functools import lru_cache, partial
 import numpy as np
+import math
 import re
+import io
+import gzip
+import zipfile
+import posixpath
 import pandas as pd
 from datetime import datetime
 
+import tools.parallel as parallel
+import preprocessing.extract as extract
+
 MAX_NGRAM = 2
+MAX_LOAD_CHUNK = 500  # max number of files parsed at once by a worker
 file_regex = r"((.*_.*_.*_.*_.*_.*)_(.*)_(.*)_([01])(_(.*))?)-processed\.csv"
+# raw log files, before the vocabulary extraction (see preprocessing/extract.py)
+raw_file_regex = r"((.*_.*_.*_.*_.*_.*)_(.*)_(.*)_([01])(_(.*))?)(-processed)?\.log"
 date_regex = "%Y_%m_%d_%H_%M_%S"
+colnames = ["date", "jobID", "commitID", "status", "jobName", "filename"] + \
+    ["word_count_ngram_" + str(i) for i in range(1, 1 + MAX_NGRAM)]
+# zip archives opened by the current process (see open_log)
+ARCHIVES = {}
+
+
+@lru_cache(maxsize=1024)
+def is_archive(filename):
+    '''
+    Returns if 'filename' is a zip archive of log files.
+    '''
+    return filename.endswith('.zip') and path.isfile(filename)
+
+
+def split_archive(filename):
+    '''
+    Splits the filename 'filename' of a log file in the zip archive containing 
+    it and its name in the archive (None if it is not in an archive).
+
+    Ex: filename = 'dataset/graphviz_part1.zip/graphviz/2019_01_01_00_00_00_1_a2_0_doc.log'
+
+        out = ('dataset/graphviz_part1.zip', 'graphviz/2019_01_01_00_00_00_1_a2_0_doc.log')
+    '''
+    i = filename.find('.zip/')
+    while i >= 0:
+        if is_archive(filename[:i + 4]):
+            return filename[:i + 4], filename[i + 5:]
+        i = filename.find('.zip/', i + 1)
+    return filename, None
 
 
-def get_text_count(file):
+def open_log(filename, errors='strict'):
     '''
-    Get the word count in the file with filename 'file'.
+    Opens the log file 'filename' in text mode (UTF-8): a file, or a member of 
+    a zip archive (see split_archive), gzip compressed if its name ends with 
+    '.gz'. The members are streamed from the archive, which is only opened 
+    once by each process.
+    '''
+    archive, member = split_archive(filename)
+    if member is None:
+        f = gzip.open(filename) if filename.endswith('.gz') else open(filename, 'rb')
+    else:
+        pid, zip_file = ARCHIVES.get(archive, (None, None))
+        if pid != getpid():  # a process can't share the file of its parent
+            zip_file = zipfile.ZipFile(archive)
+            ARCHIVES[archive] = (getpid(), zip_file)
+        f = zip_file.open(member)
+        if member.endswith('.gz'):
+            f = gzip.GzipFile(fileobj=f)
+    return io.TextIOWrapper(f, encoding='utf-8', errors=errors)
+
+
+def data_prefix(DATA_PATH):
+    '''
+    Returns the prefix of the filenames of the logs at the path 'DATA_PATH' 
+    (with a '/' after the name of a zip archive).
+    '''
+    return DATA_PATH + '/' if is_archive(DATA_PATH) else DATA_PATH
+
+
+def log_key(file):
+    '''
+    Sort key of the log files: by name (date first), wherever they are.
+    '''
+    return posixpath.basename(file), file
+
+
+def scan_logs(DATA_PATH, raw=False, stat=False):
+    '''
+    Lists the log files at the path 'DATA_PATH' whose name matches the regex of
+    the log files (see log_regex): the files of the folder, gzip compressed or
+    not, and the members of the zip archives of the folder. 'DATA_PATH' can 
+    also be a zip archive.
+
+    Parameters:
+    - DATA_PATH: path to the build log dataset already processed (or to the 
+                 raw logs if raw = True).
+    - raw      : if the logs are the raw logs (default=False).
+    - stat     : if the size and modification time of the files are read 
+                 (default=False).
+    Output:
+    - logs     : dictionary with keys=filename relative to 'DATA_PATH' and 
+                 values=(size, mtime) if stat = True (size and CRC for the 
+                 members of the archives), else None.
+
+    Ex: DATA_PATH = 'dataset/graphviz/' (with graphviz_part1.zip)
+
+        out = {'graphviz_part1.zip/graphviz/2019_01_01_00_00_00_1_a2_0_doc.log': None, ...}
+    '''
+    regex = log_regex(raw)
+    logs = {}
+
+    def scan_archive(filename, prefix):
+        with zipfile.ZipFile(filename) as zip_file:
+            for info in zip_file.infolist():
+                if not info.is_dir() and re.match(regex, posixpath.basename(info.filename)):
+                    logs[prefix + info.filename] = (info.file_size, info.CRC) if stat else None
+
+    if is_archive(DATA_PATH):
+        scan_archive(DATA_PATH, '')
+        return logs
+    with scandir(DATA_PATH) as entries:
+        for entry in entries:
+            if is_archive(entry.path):
+                scan_archive(entry.path, entry.name + '/')
+            elif re.match(regex, entry.name):
+                if stat:
+                    st = entry.stat()
+                    logs[entry.name] = (st.st_size, st.st_mtime_ns)
+                else:
+                    logs[entry.name] = None
+    return logs
+
+
+def text_count(txt):
+    '''
+    Get the word count in the text 'txt' of a processed log file (see 
+    main_extract.go: the lines 'word,count' of each N separated by '#').
     The function returns a list of dictionary of word count for words generated
     with ngram where N in 1..MAX_NGRAM.
     '''
-    with open(file) as f:
-        txt = f.read()
-        sep_txt = [e for e in txt.split('#') if e != ""]
-        sep_txt = sep_txt[:MAX_NGRAM]
-
-        dic = [{} for e in range(MAX_NGRAM)]
-        count = 0
-        for e in sep_txt:
-            loc = {}
-            for line in e.split('\n'):
-                row = line.split(',')
-                if len(row) == 2 and len(row[0]) > 2:
-                    loc[row[0]] = int(row[1])
-            dic[count] = loc
-            count += 1
+    sep_txt = [e for e in txt.split('#') if e != ""]
+    sep_txt = sep_txt[:MAX_NGRAM]
+
+    dic = [{} for e in range(MAX_NGRAM)]
+    count = 0
+    for e in sep_txt:
+        loc = {}
+        for line in e.split('\n'):
+            row = line.split(',')
+            if len(row) == 2 and len(row[0]) > 2:
+                loc[row[0]] = int(row[1])
+        dic[count] = loc
+        count += 1
     return dic
 
 
-def get_log_data(file, DATA_PATH):
+def get_text_count(file, raw=False):
     '''
-    Returns a list representation of the job given in the file with filename 
-    'file' at the path 'DATA_PATH'.
+    Get the word count in the file with filename 'file' (see text_count and 
+    open_log). If raw = True, 'file' is a raw log whose words are extracted 
+    while it is read (see extract.log_count).
+    '''
+    if raw:
+        with open_log(file, errors='replace') as f:  # invalid bytes as Go
+            return extract.log_count(f, MAX_NGRAM)
+    with open_log(file) as f:
+        return text_count(f.read())
+
+
+def log_regex(raw=False):
     '''
-    m = re.match(file_regex, file)
+    Returns the regex of the filenames of the log files: raw_file_regex if 
+    raw = True, else file_regex.
+    '''
+    return raw_file_regex if raw else file_regex
+
+
+def get_log_metadata(file, DATA_PATH, raw=False):
+    '''
+    Returns the metadata of the job given in the file with filename 'file' at 
+    the path 'DATA_PATH' (read in the filename): [date, jobID, commitID, 
+    status, jobName, filename], or None if the name of 'file' does not match 
+    the regex of the log files (see log_regex).
+    '''
+    m = re.match(log_regex(raw), posixpath.basename(file))
     if(m):
         date = datetime.strptime(m.group(2), date_regex)
         jobID = m.group(3)
         commitID = m.group(4)
         status = int(m.group(5))
         jobName = m.group(7)
-        filename = DATA_PATH + file
-        word_count = get_text_count(filename)
-        loc = [date, jobID, commitID, status, jobName, filename] + word_count
+        filename = data_prefix(DATA_PATH) + file
+        return [date, jobID, commitID, status, jobName, filename]
+    return None
 
-        return loc
-    else:
+
+def get_log_data(file, DATA_PATH, raw=False):
+    '''
+    Returns a list representation of the job given in the file with filename 
+    'file' at the path 'DATA_PATH' (a raw log if raw = True).
+    '''
+    loc = get_log_metadata(file, DATA_PATH, raw)
+    if loc is None:
         return "ERROR"
+    return loc + get_text_count(loc[-1], raw)
+
+
+def get_log_chunk(files, DATA_PATH, raw=False):
+    '''
+    Returns the list representations of the jobs given in the list of 
+    filenames 'files' at the path 'DATA_PATH' (see get_log_data).
+    '''
+    return [get_log_data(f, DATA_PATH, raw) for f in files]
 
 
 def flaky_state(mean):
     '''
-    Returns if a job is flaky or safe.
+    Returns if jobs are flaky or safe.
 
     Parameters:
-    - mean: float. Mean result of the jobs run.
+    - mean: array of floats. Mean result of the jobs run.
+    Output:
+    - state: array of "flaky" or "safe".
+
+    Ex: mean = [0., 0.5, 1.]
+
+        out = ["safe", "flaky", "safe"]
     '''
-    if 0 < mean < 1:  # unsteady results => flaky
-        return "flaky"
-    return "safe"
+    mean = np.asarray(mean, dtype=np.float64)
+    # unsteady results => flaky
+    return np.where((mean > 0) & (mean < 1), "flaky", "safe")
 
 
 def flaky_state_all(res):
     '''
     Computes the flaky column.
+    A job is flaky if the jobs with the same (commitID, jobName) have unsteady 
+    results (see flaky_state), a missing commitID or jobName being a value of
+    its own.
 
     Parameters:
     - res   : dataset in a pandas dataframe format.
@@ -77,42 +247,174 @@ def flaky_state_all(res):
               'flaky' column.
     '''
     list_aggr = ["commitID", "jobName"]
-    COMJOB_mean_status = res.groupby(list_aggr)["status"].mean()
-    COMJOB_flaky_state = [flaky_state(a) for a in COMJOB_mean_status.tolist()]
+    COMJOB_mean_status = res.groupby(list_aggr, dropna=False)["status"].transform("mean")
 
-    indexes = [a for a in COMJOB_mean_status.index]
+    res["flaky"] = flaky_state(COMJOB_mean_status.to_numpy())
+    return res
 
-    all_flaky_state_res = [COMJOB_flaky_state[indexes.index((a, b))] for a, b in zip(
-        res["commitID"].tolist(), res["jobName"].tolist())]
 
-    all_flaky_state = pd.DataFrame(all_flaky_state_res, columns=["flaky"])
-    all_flaky_state["flaky"] = all_flaky_state_res
+def parse_logs(P, list_log):
+    '''
+    Parses the log files with filename in 'list_log' for Experiment object 'P'.
+    The log files are parsed by chunks with P.workers processes, and the rows
+    are streamed in the columns of the dataframe as the chunks are done.
+    If P.raw_logs = True, the words of the raw logs are extracted by the 
+    processes (see preprocessing/extract.py).
 
-    res["flaky"] = all_flaky_state["flaky"]
+    Parameters:
+    - P       : Experiment object representing the current experiment set-up
+    - list_log: list of filenames relative to P.path_data (see scan_logs).
+    Output:
+    - res     : jobs of 'list_log' in a pandas dataframe format (without the
+                'flaky' column).
+    '''
+    # several chunks per worker, to balance the load between the processes
+    chunk_size = max(1, min(MAX_LOAD_CHUNK,
+                            math.ceil(len(list_log) / (8 * max(1, P.workers)))))
+    chunks = [list_log[i:i + chunk_size]
+              for i in range(0, len(list_log), chunk_size)]
+
+    columns = {c: [] for c in colnames}
+    for rows in parallel.pool_imap(partial(get_log_chunk, DATA_PATH=P.path_data,
+                                           raw=P.raw_logs),
+                                   chunks, workers=P.workers):
+        for row in rows:
+            for c, e in zip(colnames, row):
+                columns[c].append(e)
+
+    res = pd.DataFrame(columns, columns=colnames)
+    res["status"] = res["status"].astype('int')
     return res
 
 
+def job_mask(P, jobs):
+    '''
+    Returns the mask of the jobs 'jobs' (dataframe with the date and jobName 
+    columns) kept by the filters of Experiment object 'P': 
+    P.date_from <= date < P.date_to and jobName in P.job_names (no filter if 
+    None).
+    '''
+    mask = np.ones(jobs.shape[0], dtype=bool)
+    if P.date_from is not None:
+        mask &= (jobs["date"] >= P.date_from).to_numpy()
+    if P.date_to is not None:
+        mask &= (jobs["date"] < P.date_to).to_numpy()
+    if P.job_names is not None:
+        mask &= jobs["jobName"].isin(P.job_names).to_numpy()
+    return mask
+
+
+def select_logs(P, list_log):
+    '''
+    Returns the log files of 'list_log' (filenames relative to P.path_data) 
+    kept by the filters of Experiment object 'P' (see job_mask), read in 
+    their names, so the other logs are never opened.
+    '''
+    if P.date_from is None and P.date_to is None and P.job_names is None:
+        return list_log
+    jobs = pd.DataFrame([get_log_metadata(f, P.path_data, P.raw_logs) for f in list_log],
+                        columns=colnames[:6])
+    return [f for f, keep in zip(list_log, job_mask(P, jobs)) if keep]
+
+
 def get_data(P):
     '''
-    Gets data for Experiment object 'P'.
+    Gets data for Experiment object 'P', with the jobs kept by its filters 
+    (see job_mask).
 
     Parameters:
     - P  : Experiment object representing the current experiment set-up
     Output:
     - res: dataset in a pandas dataframe format.
     '''
-    res = []
+    list_log = sorted(scan_logs(P.path_data, P.raw_logs), key=log_key)
+    list_log = select_logs(P, list_log)
 
-    list_log = sorted(listdir(P.path_data))
+    res = parse_logs(P, list_log)
+    res = flaky_state_all(res)
 
-    res = np.array([get_log_data(f, P.path_data)
-                   for f in list_log if re.match(file_regex, f)])
-    colnames = ["date", "jobID", "commitID", "status", "jobName", "filename"] + \
-        ["word_count_ngram_" + str(i) for i in range(1, 1 + MAX_NGRAM)]
+    return res.reset_index(drop=True)
 
-    res = pd.DataFrame(res, columns=colnames)
-    res["status"] = res["status"].astype('int')
 
+def get_metadata(DATA_PATH, raw=False):
+    '''
+    Gets the metadata of the log files at the path 'DATA_PATH' without reading 
+    them (see get_log_metadata).
+
+    Parameters:
+    - DATA_PATH: path to the build log dataset already processed (or to the 
+                 raw logs if raw = True).
+    Output:
+    - res      : dataset in a pandas dataframe format, without the 
+                 word_count_ngram_N columns.
+    '''
+    list_log = sorted(scan_logs(DATA_PATH, raw), key=log_key)
+    res = pd.DataFrame([get_log_metadata(f, DATA_PATH, raw) for f in list_log],
+                       columns=colnames[:6])
+    res["status"] = res["status"].astype('int')
     res = flaky_state_all(res)
+    return res
 
-    return res.reset_index(drop=True)
+
+def file_manifest(DATA_PATH, raw=False):
+    '''
+    Lists the log files at the path 'DATA_PATH' with their size and 
+    modification time (see scan_logs).
+
+    Parameters:
+    - DATA_PATH: path to the build log dataset already processed (or to the 
+                 raw logs if raw = True).
+    Output:
+    - manifest : dictionary with keys=filename and values=(size, mtime).
+    '''
+    return scan_logs(DATA_PATH, raw, stat=True)
+
+
+def update_data(P, res, manifest):
+    '''
+    Updates the dataset 'res' of Experiment object 'P' with the log files that 
+    are new or changed since 'manifest' was taken (kept by the filters of 'P',
+    see job_mask). Only those files are parsed, 
+    and the 'flaky' column is only recomputed for their (commitID, jobName).
+    Rows of the deleted log files are removed.
+
+    Parameters:
+    - P       : Experiment object representing the current experiment set-up
+    - res     : dataset in a pandas dataframe format, or None if nothing was 
+                loaded yet.
+    - manifest: dictionary with keys=filename and values=(size, mtime), 
+                describing the log files in 'res' (see file_manifest).
+    Output:
+    - res     : updated dataset in a pandas dataframe format.
+    - manifest: manifest of the log files in the updated dataset.
+    '''
+    current = file_manifest(P.path_data, P.raw_logs)
+    current = {f: current[f] for f in select_logs(P, sorted(current, key=log_key))}
+    new_logs = sorted((f for f in current if manifest.get(f) != current[f]), key=log_key)
+    old_logs = [f for f in manifest if current.get(f) != manifest[f]]
+
+    if res is None:
+        res = flaky_state_all(parse_logs(P, new_logs))
+        return res.reset_index(drop=True), current
+    if len(new_logs) == 0 and len(old_logs) == 0:
+        return res, current
+
+    list_aggr = ["commitID", "jobName"]
+    removed = res["filename"].isin([data_prefix(P.path_data) + f for f in old_logs])
+    new_res = parse_logs(P, new_logs)
+
+    affected = pd.concat([res.loc[removed, list_aggr], new_res[list_aggr]])
+    affected = pd.MultiIndex.from_frame(affected.drop_duplicates())
+
+    res = pd.concat([res[~removed], new_res], ignore_index=True)
+    filenames = res["filename"].tolist()
+    order = sorted(range(len(filenames)), key=lambda i: log_key(filenames[i]))
+    res = res.iloc[order].reset_index(drop=True)
+    res["status"] = res["status"].astype('int')
+
+    # flaky state of the (commitID, jobName) that got new or removed jobs
+    mask = pd.MultiIndex.from_frame(res[list_aggr]).isin(affected)
+    sub_res = flaky_state_all(res[mask].reset_index(drop=True))
+    res.loc[mask, "flaky"] = sub_res["flaky"].values
+
+    return res, current
@@ -0,0 +1,162 @@
+import os
+import math
+import pickle
+from functools import partial
+import numpy as np
+import pandas as pd
+
+import preprocessing.get_data as get_data
+import tools.parallel as parallel
+import tools.pick_call as pick_call
+
+INDEX_NAME = 'index.p'
+SHARD_NAME = 'shard_%05d.bin'
+SHARD_SIZE = 20000  # default number of jobs per shard
+INDEX_COLUMNS = get_data.colnames[:6] + ["shard", "offset", "length"]
+MAX_READ = 2**26  # max number of bytes read at once in a shard (see read_shard)
+
+
+def is_packed(DATA_PATH):
+    '''
+    Returns if the path 'DATA_PATH' is a dataset packed in shards (see pack).
+    '''
+    return os.path.isfile(os.path.join(DATA_PATH, INDEX_NAME))
+
+
+def pack(DATA_PATH, OUT_PATH, raw=False, shard_size=SHARD_SIZE, workers=1):
+    '''
+    Packs the log files at the path 'DATA_PATH' (see get_data.scan_logs) in a
+    few shard files in the folder 'OUT_PATH', with an index of the jobs.
+    The shards split the jobs by date, and the jobs of a shard are ordered by
+    jobName, so the jobs of a date range or of some jobNames are read from a
+    few contiguous parts of a few shards (see read_index and get_packed_data).
+
+    The index (OUT_PATH/index.p) gives for each job, in the order of
+    get_data.get_data, its metadata (date, jobID, commitID, status, jobName,
+    filename) and the shard, offset and length of its word counts. The word
+    counts of each job are pickled in the shard file shard_<i>.bin.
+
+    Parameters:
+    - DATA_PATH : path to the build log dataset already processed (or to the
+                  raw logs if raw = True, extracted while packing).
+    - OUT_PATH  : folder of the packed dataset (created if needed).
+    - raw       : if the logs are the raw logs (default=False).
+    - shard_size: number of jobs per shard (default=SHARD_SIZE).
+    - workers   : number of processes reading the logs (default=1).
+    Output:
+    - index     : index of the jobs in a pandas dataframe format.
+    '''
+    os.makedirs(OUT_PATH, exist_ok=True)
+    list_log = sorted(get_data.scan_logs(DATA_PATH, raw), key=get_data.log_key)
+
+    index = []
+    for shard, start in enumerate(range(0, len(list_log), shard_size)):
+        files = list_log[start:start + shard_size]
+        chunk_size = max(1, min(get_data.MAX_LOAD_CHUNK,
+                                math.ceil(len(files) / (8 * max(1, workers)))))
+        chunks = [files[i:i + chunk_size] for i in range(0, len(files), chunk_size)]
+        rows = []
+        for chunk_rows in parallel.pool_imap(partial(get_data.get_log_chunk, DATA_PATH=DATA_PATH,
+                                                     raw=raw),
+                                             chunks, workers=workers):
+            rows.extend(chunk_rows)
+
+        # position of the jobs in the shard: by jobName, then date
+        order = sorted(range(len(rows)), key=lambda i: (rows[i][4] or '', rows[i][0]))
+        pos = [None] * len(rows)
+        offset = 0
+        with open(os.path.join(OUT_PATH, SHARD_NAME % shard), 'wb') as f:
+            for i in order:
+                record = pickle.dumps(rows[i][6:], protocol=pickle.HIGHEST_PROTOCOL)
+                f.write(record)
+                pos[i] = (offset, len(record))
+                offset += len(record)
+        index.extend(row[:6] + [shard, o, n] for row, (o, n) in zip(rows, pos))
+
+    index = pd.DataFrame(index, columns=INDEX_COLUMNS)
+    index["status"] = index["status"].astype('int')
+    pick_call.pickle_dump({'max_ngram': get_data.MAX_NGRAM, 'raw': raw, 'jobs': index},
+                          os.path.join(OUT_PATH, INDEX_NAME))
+    return index
+
+
+def read_index(DATA_PATH, raw=False):
+    '''
+    Reads the index of the jobs of the packed dataset at the path 'DATA_PATH'
+    (see pack), checking that it was packed from raw logs if raw = True, else
+    from processed logs (see bundle.check_logs).
+    '''
+    INDEX = pick_call.pickle_load(os.path.join(DATA_PATH, INDEX_NAME))
+    assert INDEX['max_ngram'] == get_data.MAX_NGRAM, \
+        'dataset packed with MAX_NGRAM=%d' % INDEX['max_ngram']
+    packed_raw = INDEX.get('raw', False)  # (indexes packed without it: processed logs)
+    assert packed_raw == raw, 'dataset packed from %s logs, use --raw_logs %s' % \
+        (('processed', 'raw')[packed_raw], packed_raw)
+    return INDEX['jobs']
+
+
+def read_shard(args):
+    '''
+    Reads the word counts of the jobs at the offsets 'offsets' (sorted) with
+    lengths 'lengths' in the shard file 'filename'. The contiguous jobs are
+    read at once (at most MAX_READ bytes).
+    Returns the list of the word counts of the jobs.
+    '''
+    filename, offsets, lengths = args
+    counts = []
+    with open(filename, 'rb') as f:
+        i = 0
+        while i < len(offsets):
+            j = i + 1
+            while j < len(offsets) and offsets[j] == offsets[j - 1] + lengths[j - 1] and \
+                    offsets[j] + lengths[j] - offsets[i] <= MAX_READ:
+                j += 1
+            f.seek(offsets[i])
+            buf = memoryview(f.read(offsets[j - 1] + lengths[j - 1] - offsets[i]))
+            for k in range(i, j):
+                start = offsets[k] - offsets[i]
+                counts.append(pickle.loads(buf[start:start + lengths[k]]))
+            i = j
+    return counts
+
+
+def get_packed_data(P):
+    '''
+    Gets data for Experiment object 'P' from the packed dataset at the path
+    P.path_data (see pack), packed from raw logs if P.raw_logs = True. The
+    filters of 'P' (see get_data.job_mask) are applied on the index, so only
+    the shards and the parts of the shards with the selected jobs are read,
+    with P.workers processes.
+
+    Parameters:
+    - P  : Experiment object representing the current experiment set-up
+    Output:
+    - res: dataset in a pandas dataframe format (as get_data.get_data).
+    '''
+    index = read_index(P.path_data, P.raw_logs)
+    index = index[get_data.job_mask(P, index)].reset_index(drop=True)
+
+    tasks = []
+    rows = []
+    for shard, jobs in index.groupby("shard", sort=True):
+        jobs = jobs.sort_values(by="offset")
+        tasks.append((os.path.join(P.path_data, SHARD_NAME % shard),
+                      jobs["offset"].tolist(), jobs["length"].tolist()))
+        rows.append(jobs.index.to_numpy())
+    rows = np.concatenate(rows) if len(rows) > 0 else np.array([], dtype=int)
+
+    counts = [None] * index.shape[0]
+    k = 0
+    for shard_counts in parallel.pool_imap(read_shard, tasks, workers=P.workers):
+        for c in shard_counts:
+            counts[rows[k]] = c
+            k += 1
+
+    columns = {c: index[c].tolist() for c in get_data.colnames[:6]}
+    for n in range(get_data.MAX_NGRAM):
+        columns["word_count_ngram_" + str(n + 1)] = [c[n] for c in counts]
+    res = pd.DataFrame(columns, columns=get_data.colnames)
+    res["status"] = res["status"].astype('int')
+    res = get_data.flaky_state_all(res)
+
+    return res.reset_index(drop=True)
@@ -1,24 +1,57 @@
-import math
 from random import shuffle
+import numpy as np
 import pandas as pd
 
+import preprocessing.word_counts as word_counts
 
-def shuffle_df(df):
+# columns of the other metrics of the jobs (see get_info_rerun)
+INFO_COLUMNS = ["rerun", "fail", "success", "commit_since_flaky"]
+
+
+def shuffle_ids(ids):
     ''' 
-    Shuffles lines in a pandas dataframe.
+    Shuffles an array of line ids.
 
     Parameter:
-    - df : a pandas dataframe.
+    - ids     : array of line ids.
     Output:
-    - shuffled: a shuffled pandas dataframe.
+    - shuffled: shuffled array of line ids.
     '''
-    index = [e for e in range(df.shape[0])]
+    index = [e for e in range(len(ids))]
     shuffle(index)
 
-    shuffled = df.iloc[index]
+    shuffled = ids[index]
     return shuffled
 
 
+def commits_ids(res):
+    '''
+    Groups the lines of the dataset 'res' by commitID.
+
+    Parameters:
+    - res  : full dataset in a pandas dataframe format.
+    Outputs:
+    - ids  : list of arrays of line ids (positions in 'res'), one by commitID.
+    - flaky: list of boolean, indicating if the commitID (related to the 'ids') 
+             contains a flaky job or not.
+    '''
+    commits = pd.Series((res["flaky"] == "flaky").to_numpy(), index=res["commitID"].to_numpy())
+    groups = commits.groupby(level=0)
+
+    flaky = groups.any()
+    indices = groups.indices
+    ids = [indices[c] for c in flaky.index]
+    return ids, flaky.tolist()
+
+
+def take_rows(res, ids):
+    '''
+    Materializes the lines 'ids' (positions) of the dataset 'res' as a subset 
+    with a new index.
+    '''
+    return res.iloc[ids].reset_index(drop=True)
+
+
 def get_word_count(res, ngrams):
     '''
     Computes the word_count column depending on the ngram considered.
@@ -36,8 +69,8 @@ def get_word_count(res, ngrams):
 
     loc = [{} for i in range(res.shape[0])]
     for i in ngrams:
-        loc = [a.update(b) for a, b in zip(
-            loc, res["word_count_ngram_" + str(i)].tolist())]
+        for a, b in zip(loc, res["word_count_ngram_" + str(i)].tolist()):
+            a.update(b)
 
     res["word_count"] = loc
     return res
@@ -45,75 +78,74 @@ def get_word_count(res, ngrams):
 
 def get_since_flaky(res):
     '''
-    Computes the commit_since_flaky metric.
+    Computes the commit_since_flaky metric: the number of commits since the 
+    last commit with a flaky job, the commits being ordered by the date of 
+    their first job (the commits with the same date by commitID).
 
     Parameters:
     - res: dataset in a pandas dataframe format.
     Output:
     - l  : vector of size res_nbr_row containing the commit_since_flaky metric.
-    '''
-    commit_since_flaky = res.groupby(["commitID"]).agg({'flaky': lambda x: sum(
-        x == "flaky") > 0, 'date': lambda x: min(x), 'commitID': lambda x: list(x.index)})
-    commit_since_flaky.sort_values(by='date')
-
-    l = []
-    count = 0
-    for e in commit_since_flaky["flaky"].tolist():
-        l += [count]
-        count += 1
-        if e:
-            count = 0
-    commit_since_flaky["since_flaky"] = l
-
-    l = [0] * (res.shape[0])
-    for i in range(commit_since_flaky.shape[0]):
-        for e in commit_since_flaky["commitID"].tolist()[i]:
-            l[e] = commit_since_flaky["since_flaky"].tolist()[i]
 
+    Ex: commitID first date has a flaky job        commit_since_flaky
+        A        d1         False                  0
+        B        d2         True             =>    1
+        C        d3         False                  0
+        D        d4         False                  1
+        E        d5         True                   2
+        F        d6         False                  0
+    '''
+    commits = pd.DataFrame({"commitID": res["commitID"].to_numpy(),
+                            "flaky": (res["flaky"] == "flaky").to_numpy(),
+                            "date": res["date"].to_numpy()})
+    commits = commits.groupby("commitID").agg(flaky=("flaky", "any"), date=("date", "min"))
+    commits = commits.sort_values(by="date", kind="stable")
+
+    # position of the last flaky commit strictly before each commit (-1 if none)
+    i = np.arange(commits.shape[0])
+    last_flaky = np.maximum.accumulate(np.where(commits["flaky"].to_numpy(), i, -1))
+    last_flaky = np.concatenate(([-1], last_flaky[:-1]))
+    since_flaky = pd.Series(i - last_flaky - 1, index=commits.index)
+
+    l = since_flaky.reindex(res["commitID"].to_numpy()).to_numpy(dtype=np.int64)
     return l
 
 
 def get_info_rerun(res):
     '''
-    Computes the 'info' column depending, which contains the other metrics 
-    (#rerun, #fail, #success, commit_since_flaky). See paper.
+    Computes the columns of the other metrics (#rerun, #fail, #success, 
+    commit_since_flaky). See paper.
+    The counters of a job are the number of runs, fails and successes of the 
+    previous jobs with the same (commitID, jobName), in the order of the dates
+    (a missing commitID or jobName being a value of its own).
 
     Parameters:
     - res   : dataset in a pandas dataframe format.
     Output:
     - res   : modified dataset in a pandas dataframe format, with added 
-              'info' column.
-    '''
-    info = [{} for e in range(res.shape[0])]
-
-    curr_commitXjob = ""
-    curr_dic = {}
-    list = []
-    max = 0
-
-    since_flaky = get_since_flaky(res)
-    for i, row in res.sort_values(
-            by=["commitID", "jobName", "date"]).iterrows():
-
-        if curr_commitXjob != row["commitID"] + row["jobName"]:
-            curr_commitXjob = row["commitID"] + row["jobName"]
-
-            curr_dic = {
-                "rerun": 0,
-                "fail": 0,
-                "success": 0,
-                "commit_since_flaky": 0}
+              INFO_COLUMNS columns (int).
 
-        curr_dic["commit_since_flaky"] = since_flaky[i]
-        info[i] = curr_dic.copy()
-
-        curr_dic["rerun"] += 1
-        curr_dic["fail"] += row["status"]
-        curr_dic["success"] += 1 - row["status"]
-
-    res["info"] = info
-
-    res["commit_since_flaky"] = since_flaky
+    Ex: commitID jobName date status          rerun fail success
+        c1       build   d1   1        =>     0     0    0
+        c1       build   d2   0               1     1    0
+        c1       build   d3   1               2     1    1
+    '''
+    order = res[["commitID", "jobName", "date", "status"]].reset_index(drop=True)
+    order = order.sort_values(by=["commitID", "jobName", "date"])
+    group = order.groupby(["commitID", "jobName"], sort=False, dropna=False)
+
+    # counters in the sorted order, put back at the positions of the jobs
+    rows = order.index.to_numpy()
+    rerun = np.empty(res.shape[0], dtype=np.int64)
+    fail = np.empty(res.shape[0], dtype=np.int64)
+    rerun[rows] = group.cumcount().to_numpy()
+    fail[rows] = group["status"].cumsum().to_numpy() - order["status"].to_numpy()
+
+    res["rerun"] = rerun
+    res["fail"] = fail
+    res["success"] = rerun - fail
+
+    res["commit_since_flaky"] = get_since_flaky(res)
     return res
 
 
@@ -156,34 +188,51 @@ def mask_failure(sets, cond):
     return sets
 
 
-def oversampling(sets):
+def oversampling(sets, seed=None):
     '''
     Oversamples the sets to have the same ratio of failuresXflakiness in the sets.
+    The rows are not duplicated: the 'weight' column gives the number of copies 
+    of each row in the oversampled set, and the rows are weighted by it in the 
+    vectorization and the training (see vectorization.train_weight and 
+    classification_XGBoost.pred_xgboost).
+    In a (status, flaky) group of n rows, each row gets max_len // n copies and 
+    max_len % n rows drawn at random get one more, max_len being the size of 
+    the biggest group.
 
     Parameters:
     - sets    : subset of dataframe format.
+    - seed    : seed of the random draws (default=None, not reproducible).
     Output:
-    - new_sets: oversampled subset.
+    - new_sets: subset with added 'weight' column (int).
+
+    Ex: status flaky                 weight
+        1      flaky                 2 (or 1)
+        1      safe           =>     1
+        1      safe                  1
+        1      safe                  1
+        1      flaky                 1 (or 2)
     '''
-    sets = sets.reset_index(drop=True)
-    ids_stat_flak = [sets[[a == stat and b == flak for a, b in zip(sets['status'], sets['flaky'])]].index.tolist(
-    ) for stat in set(sets['status']) for flak in set(sets['flaky'])]
-    max_len = max([len(e) for e in ids_stat_flak])
-
-    new_ids = []
-    for ids in ids_stat_flak:
-        shuffle(ids)
-        ids = ids * math.ceil(max_len / len(ids))
-        new_ids += ids[:max_len]
-    new_ids = sorted(new_ids)
-
-    new_sets = sets.iloc[new_ids].reset_index(drop=True)
+    new_sets = sets.reset_index(drop=True)
+    weight = np.ones(new_sets.shape[0], dtype=np.int64)
+    if new_sets.shape[0] > 0:
+        rng = np.random.default_rng(seed)
+        group = new_sets.groupby(["status", "flaky"]).ngroup().to_numpy()
+        sizes = np.bincount(group)
+        max_len = sizes.max()
+
+        weight = (max_len // sizes)[group]
+        for g, n in enumerate(sizes):
+            if max_len % n > 0:
+                extra = rng.choice(np.flatnonzero(group == g), max_len % n, replace=False)
+                weight[extra] += 1
+
+    new_sets["weight"] = weight
     return new_sets
 
 
 ### For random cross validation with train(90%)/valid(5%)/test(5%) ###
 
-def random_sets_by_type(res, ids, flaky, want):
+def random_sets_by_type(ids, flaky, want):
     '''
     Generates subsets for train(90%)/valid(5%)/test(5%). The subsets selected 
     jobs by commitID (all the jobs of a commitID will be in the same set). 
@@ -192,8 +241,7 @@ def random_sets_by_type(res, ids, flaky, want):
     contain jobs from commitID that only has safe builds.
 
     Parameters:
-    - res  : full dataset in a pandas dataframe format.
-    - ids  : list of list of ids, each sublist lists the line ids of jobs by 
+    - ids  : list of arrays of ids, each array lists the line ids of jobs by 
              commitID. (size: nbr_commitID).
     - flaky: list of boolean, indicating if the commitID (related to the 'ids') 
              contains a flaky job or not.
@@ -201,23 +249,26 @@ def random_sets_by_type(res, ids, flaky, want):
              flaky job. If False, will only select commitIDs that contain only safe
              builds.
     Output: 
-    - sets : list of dictionaries with keys=train/valid/test and values=subsets.
+    - sets : dictionary with keys=train/valid/test and values=array of line ids.
     '''
     id_wanted = [i for i, e in zip(ids, flaky) if e == want]
     shuffle(id_wanted)
     perc10_lim = round(len(id_wanted) * 0.05)
 
-    test = [e for l in id_wanted[:perc10_lim] for e in l]
-    valid = [e for l in id_wanted[perc10_lim:(2 * perc10_lim)] for e in l]
-    train = [e for l in id_wanted[(2 * perc10_lim):] for e in l]
-
     sets = {
-        'train': res.iloc[train],
-        'valid': res.iloc[valid],
-        'test': res.iloc[test]}
+        'train': concat_ids(id_wanted[(2 * perc10_lim):]),
+        'valid': concat_ids(id_wanted[perc10_lim:(2 * perc10_lim)]),
+        'test': concat_ids(id_wanted[:perc10_lim])}
     return sets
 
 
+def concat_ids(ids):
+    '''
+    Concatenates a list of arrays of line ids.
+    '''
+    return np.concatenate([np.zeros(0, dtype=np.int64)] + list(ids)).astype(np.int64)
+
+
 def random_sets(res):
     '''
     Generates subsets for train(90%)/valid(5%)/test(5%). The subsets selected 
@@ -226,23 +277,17 @@ def random_sets(res):
     Parameters:
     - res  : full dataset in a pandas dataframe format.
     Output: 
-    - sets : list of dictionaries with keys=train/valid/test and values=subsets.
+    - sets : dictionary with keys=train/valid/test and values=array of line ids 
+             (positions in 'res').
     '''
-    res = res.reset_index()
-    commit_ids = res.groupby(
-        ["commitID"]).apply(
-        lambda x: list(
-            x.index)).tolist()
-    commit_flaky = res.groupby(
-        ["commitID"])["flaky"].apply(
-        lambda x: "flaky" in list(x)).tolist()
+    commit_ids, commit_flaky = commits_ids(res)
 
-    flakys = random_sets_by_type(res, commit_ids, commit_flaky, True)
-    safes = random_sets_by_type(res, commit_ids, commit_flaky, False)
+    flakys = random_sets_by_type(commit_ids, commit_flaky, True)
+    safes = random_sets_by_type(commit_ids, commit_flaky, False)
 
     data = {}
     for who in flakys:
-        data[who] = shuffle_df(flakys[who].append(safes[who])).reset_index()
+        data[who] = shuffle_ids(concat_ids([flakys[who], safes[who]]))
 
     return data
 
@@ -250,7 +295,7 @@ def random_sets(res):
 def sub_sets(P, res):
     '''
     Generates subsets for train(90%)/valid(5%)/test(5%), adds the necessary 
-    columns (word_count and info), applies the mask failure and oversampling 
+    columns (word_count and INFO_COLUMNS), applies the mask failure and oversampling 
     as indicated in the Experiment object 'P'. 
 
     Parameters:
@@ -259,22 +304,23 @@ def sub_sets(P, res):
     Output: 
     - SETS: list of dictionaries with keys=train/valid/test and values=subsets.
     '''
-    SETS = random_sets(res)
+    SETS = {who: take_rows(res, ids) for who, ids in random_sets(res).items()}
 
     for who in SETS:
-        SETS[who] = get_word_count(SETS[who], P.ngram)
+        if word_counts.ROW_COLUMN not in SETS[who]:  # else, counts in a count store
+            SETS[who] = get_word_count(SETS[who], P.ngram)
         SETS[who] = get_info_rerun(SETS[who])
     SETS = mask_failure(SETS, P.fail_mask)
 
     if P.oversampling:
-        SETS['train'] = oversampling(SETS['train'])
+        SETS['train'] = oversampling(SETS['train'], P.seed)
 
     return SETS
 
 ### For random 10fold cross validation with train(90%)/valid(5%)/test(5%) ###
 
 
-def tenfolds_half_by_type(res, ids, flaky, want):
+def tenfolds_half_by_type(ids, flaky, want):
     '''
     Generates 20 subsets of size 5%. The subsets selected 
     jobs by commitID (all the jobs of a commitID will be in the same subset). 
@@ -284,8 +330,7 @@ def tenfolds_half_by_type(res, ids, flaky, want):
     See the paper for the 10fold with two runs approach.
 
     Parameters:
-    - res  : full dataset in a pandas dataframe format.
-    - ids  : list of list of ids, each sublist lists the line ids of jobs by 
+    - ids  : list of arrays of ids, each array lists the line ids of jobs by 
              commitID. (size: nbr_commitID).
     - flaky: list of boolean, indicating if the commitID (related to the 'ids') 
              contains a flaky job or not.
@@ -293,8 +338,8 @@ def tenfolds_half_by_type(res, ids, flaky, want):
              flaky job. If False, will only select commitIDs that contain only safe
              builds.
     Output: 
-    - sets : list of 10 lists, where each sublist is composed of two subsets of 
-             size 5%.
+    - sets : list of 10 lists, where each sublist is composed of two arrays of 
+             line ids of size 5%.
     '''
     id_wanted = [i for i, e in zip(ids, flaky) if e == want]
     shuffle(id_wanted)
@@ -303,8 +348,8 @@ def tenfolds_half_by_type(res, ids, flaky, want):
     sets = []
 
     for i in range(10):
-        sets.append([res.iloc[[e for l in id_wanted[perc10_lim * (2 * i):perc10_lim * (2 * i + 1)] for e in l]],
-                     res.iloc[[e for l in id_wanted[perc10_lim * (2 * i + 1):perc10_lim * (2 * i + 2)] for e in l]]])
+        sets.append([concat_ids(id_wanted[perc10_lim * (2 * i):perc10_lim * (2 * i + 1)]),
+                     concat_ids(id_wanted[perc10_lim * (2 * i + 1):perc10_lim * (2 * i + 2)])])
 
     return sets
 
@@ -314,46 +359,59 @@ def tenfolds_half_sets(res):
     Generates 20 subsets of size 5%. The subsets selected jobs by commitID 
     (all the jobs of a commitID will be in the same set). The ratio 
     of commitID with flakiness and without is respected in the subsets.
+    The subsets are arrays of line ids of 'res', see save_splits.
     Parameters:
     - res  : full dataset in a pandas dataframe format.
     Output: 
-    - sets : list of dictionaries with keys=0-9 and values=list of two subsets.
+    - sets : list of dictionaries with keys=0-9 and values=list of two arrays 
+             of line ids (positions in 'res').
     '''
-    res = res.reset_index()
-
-    commit_ids = res.groupby(
-        ["commitID"]).apply(
-        lambda x: list(
-            x.index)).tolist()
-    commit_flaky = res.groupby(
-        ["commitID"])["flaky"].apply(
-        lambda x: "flaky" in list(x)).tolist()
+    commit_ids, commit_flaky = commits_ids(res)
 
-    flakys = tenfolds_half_by_type(res, commit_ids, commit_flaky, True)
-    safes = tenfolds_half_by_type(res, commit_ids, commit_flaky, False)
+    flakys = tenfolds_half_by_type(commit_ids, commit_flaky, True)
+    safes = tenfolds_half_by_type(commit_ids, commit_flaky, False)
 
     data = {}
     for i, _ in enumerate(flakys):
         for j in range(2):
-            data[i] = [
-                shuffle_df(
-                    flakys[i][0].append(
-                        safes[i][0])).reset_index()]
-            data[i] += [shuffle_df(flakys[i]
-                                   [1].append(safes[i][1])).reset_index()]
+            data[i] = [shuffle_ids(concat_ids([flakys[i][0], safes[i][0]]))]
+            data[i] += [shuffle_ids(concat_ids([flakys[i][1], safes[i][1]]))]
     return data
 
 
-def sub_sets_10fold(P, sets, fold=0, turn=0):
+def save_splits(sets, filename):
+    '''
+    Saves the subsets of tenfolds_half_sets in the .npz file 'filename', one 
+    .npy array of line ids per subset.
+    '''
+    np.savez(filename, **{'%d_%d' % (i, j): ids for i in sets for j, ids in enumerate(sets[i])})
+
+
+def load_splits(filename):
+    '''
+    Loads the subsets saved by save_splits in the .npz file 'filename'.
+    '''
+    sets = {}
+    with np.load(filename) as arrays:
+        for name in sorted(arrays.files, key=lambda e: [int(k) for k in e.split('_')]):
+            i, j = [int(k) for k in name.split('_')]
+            sets.setdefault(i, []).append(arrays[name])
+    return sets
+
+
+def sub_sets_10fold(P, res, sets, fold=0, turn=0):
     '''
     Generates subsets for train(90%)/valid(5%)/test(5%), adds the necessary 
-    columns (word_count and info), applies the mask failure and oversampling 
+    columns (word_count and INFO_COLUMNS), applies the mask failure and oversampling 
     as indicated in the Experiment object 'P', for the appropriate 'fold' and 'turn' 
     in 10fold cross validation. 
+    Only the lines of the subsets are taken from the dataset 'res'.
 
     Parameters:
     - P       : Experiment object representing the current experiment set-up
-    - sets    : list of dictionaries with keys=0-9 and values=list of two subsets.
+    - res     : full dataset in a pandas dataframe format.
+    - sets    : list of dictionaries with keys=0-9 and values=list of two arrays of 
+                line ids (see tenfolds_half_sets).
     - fold    : int. Value between 0-9 defining the fold we are currently running.
                 For fold=X, the X element in sets is used for valid/test sets and 
                 all the other are used for the training set.
@@ -364,20 +422,20 @@ def sub_sets_10fold(P, sets, fold=0, turn=0):
     Output: 
     - new_sets: list of dictionaries with keys=train/valid/test and values=subsets.
     '''
-    new_sets = {}
-    new_sets['train'] = pd.concat(
-        [f for i in sets if i != fold for f in sets[i]], ignore_index=True)
-    new_sets['valid'] = pd.concat([sets[i][turn]
-                                  for i in sets if i == fold], ignore_index=True)
-    new_sets['test'] = pd.concat([sets[i][1 - turn]
-                                 for i in sets if i == fold], ignore_index=True)
+    ids = {}
+    ids['train'] = concat_ids([f for i in sets if i != fold for f in sets[i]])
+    ids['valid'] = sets[fold][turn]
+    ids['test'] = sets[fold][1 - turn]
+
+    new_sets = {who: take_rows(res, ids[who]) for who in ids}
 
     for who in new_sets:
-        new_sets[who] = get_word_count(new_sets[who], P.ngram)
+        if word_counts.ROW_COLUMN not in new_sets[who]:  # else, counts in a count store
+            new_sets[who] = get_word_count(new_sets[who], P.ngram)
         new_sets[who] = get_info_rerun(new_sets[who])
     new_sets = mask_failure(new_sets, P.fail_mask)
 
     if P.oversampling:
-        new_sets['train'] = oversampling(new_sets['train'])
+        new_sets['train'] = oversampling(new_sets['train'], P.seed)
 
     return new_sets
@@ -1,41 +1,122 @@
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction import FeatureHasher
+from sklearn.feature_extraction.text import TfidfTransformer
 from sklearn.feature_selection import SelectKBest, chi2
 
-import math
+from functools import partial
+import numpy as np
 from scipy.sparse import csr_matrix
+from scipy.special import chdtrc
 
+import preprocessing.sub_sets as sub_sets
+import preprocessing.word_counts as word_counts
+import tools.parallel as parallel
 
-def set_to_corpus(sets, target=None):
+HASH_BATCH = 2**16  # number of words of a word count store hashed at once (see bucket_words)
+
+
+def set_to_counts(sets, vocabulary):
     '''
-    From the wordcount sets 'sets', generates a corpus of phrases only containing 
-    words from 'target'.
-    If target==None, then creates a corpus with all the words in the sets.
+    From the wordcount sets 'sets', generates the count matrix of the words in 
+    'vocabulary' (the other words are masked).
 
     Parameters: 
-    - sets  : dictionary with keys=word and values=subsets.
-    - target: list of words or None (default=None).
+    - sets      : dictionary with keys=word and values=subsets.
+    - vocabulary: dictionary with keys=word and values=column index.
     Output:
-    - corpus: string of words, respecting the word count in sets.
+    - C         : count matrix (csr format, size: set_size x len(vocabulary)).
 
-    The corpus is created by concatenating all the words in the wordcount set the 
-    number of times given in wordcount.
     Ex: sets = [{'a':3, 'b':1}, {'a':2, 'c':2}]
-        target = ['a', 'b']
+        vocabulary = {'a':0, 'b':1}
+
+        out = [[3, 1],
+               [2, 0]]
+    '''
+    indptr = [0]
+    indices = []
+    data = []
+    for dic in sets['word_count'].tolist():
+        for w, c in dic.items():
+            j = vocabulary.get(w)
+            if j is not None:
+                indices.append(j)
+                data.append(c)
+        indptr.append(len(indices))
+
+    C = csr_matrix((np.array(data, dtype=np.int64), np.array(indices, dtype=np.int32),
+                    np.array(indptr, dtype=np.int64)),
+                   shape=(len(indptr) - 1, len(vocabulary)))
+    C.sort_indices()
+    return C
+
+
+def train_weight(sets):
+    '''
+    Returns the weights of the jobs of the training set (number of copies of 
+    each job, see sub_sets.oversampling), or None if it is not oversampled.
+    '''
+    if 'weight' not in sets['train']:
+        return None
+    return sets['train']['weight'].to_numpy()
+
+
+def weighted_idf(X, weight):
+    '''
+    Computes the idf of the columns of the count matrix 'X' (csr format) as 
+    TfidfTransformer (smooth_idf=True) fitted on a matrix where the row i is 
+    repeated weight[i] times.
+    '''
+    df = np.bincount(X.indices, weights=np.repeat(weight, np.diff(X.indptr)),
+                     minlength=X.shape[1])
+    return np.log((1 + weight.sum()) / (1 + df)) + 1
+
 
-        out = ['a a a b', 'a a']
+def counts_tf_idf(C, vocab, target=None, only_train=False, weight=None):
     '''
-    here_sets = sets['word_count'].tolist()
+    Computes the tfidf metric from count matrices. This is the same as a 
+    TfidfVectorizer fitted on the words of the training set, as the words of 
+    the extraction are already its tokens (lowercase, alphanumeric and '_').
+    With 'weight', the idf is the one of the training set with the row i 
+    repeated weight[i] times (the rows themselves are not repeated).
 
+    Parameters: 
+    - C         : dictionary with keys=train/valid/test and values=count matrix 
+                  (columns: 'vocab').
+    - vocab     : array of words, sorted (names of the columns of the matrices).
+    - target    : list of words or None (default=None).
+    - only_train: boolean (default=False)
+    - weight    : array of the weights of the training rows or None 
+                  (default=None).
+    Outputs:
+    - M         : dictionary of keys=train/valid/test (or just train) and values=tfidf 
+                  matrix 
+    - features  : list of words/features of the tfidf matrices (names of the columns)
+    - idf       : array of the idf of the features (fitted on the training set)
+    '''
+    # vocabulary of the training set, in alphabetic order
+    cols = np.unique(C['train'].indices)
     if target is not None:
-        corpus = [' '.join(
-            [w for w in target if w in dic for i in range(dic[w])]) for dic in here_sets]
-    else:
-        corpus = [' '.join([w for w in dic for i in range(dic[w])])
-                  for dic in here_sets]
-    return corpus
+        target = np.array(target, dtype=object)
+        pos = np.searchsorted(vocab, target)
+        found = pos < len(vocab)
+        found[found] = vocab[pos[found]] == target[found]
+        cols = np.intersect1d(cols, pos[found])
+
+    M = {}
+    transformer = TfidfTransformer()
+
+    transformer.fit(C['train'][:, cols])
+    if weight is not None:
+        transformer.idf_ = weighted_idf(C['train'][:, cols].tocsr(), weight)
+    M['train'] = transformer.transform(C['train'][:, cols])
+    if not only_train:
+        M['valid'] = transformer.transform(C['valid'][:, cols])
+        M['test'] = transformer.transform(C['test'][:, cols])
+
+    features = vocab[cols].tolist()
+    return M, features, np.asarray(transformer.idf_)
 
 
-def tf_idf(sets, target=None, only_train=False):
+def tf_idf(sets, target=None, only_train=False, counts=None):
     '''
     Computes the tfidf metric for a dictionary of sets 'sets' where each value is a 
     wordcount set, and the keys are the subsets names ('train', 'valid', 'test'). 
@@ -43,91 +124,423 @@ def tf_idf(sets, target=None, only_train=False):
     the computation (mask the other words).  
     If 'only_train' is set to True, only consider the key='train' in the set. If 
     not, consider all keys.
+    If 'counts' is given, the word counts of the jobs are read in this word 
+    count store instead of the 'word_count' column of the subsets.
+    If the training set is oversampled, the idf takes the weights of its jobs 
+    into account (see train_weight).
 
     Parameters: 
     - sets      : list of dictionaries with keys=train/valid/test and 
                   values=subsets.
     - target    : list of words or None (default=None).
     - only_train: boolean (default=False)
+    - counts    : word counts (see word_counts.select_ngrams) or None 
+                  (default=None).
     Outputs:
     - M         : dictionary of keys=train/valid/test (or just train) and values=tfidf 
                   matrix 
     - features  : list of words/features of the tfidf matrices (names of the columns)
+    - idf       : array of the idf of the features (fitted on the training set)
 
     Returns the tfidf matrices for all the considered keys in the 'sets' as a 
-    dictionary 'M' and a list of the feature names of the tfidf matrices.
+    dictionary 'M', a list of the feature names of the tfidf matrices and 
+    their idf.
     '''
-    corpus = {}
+    weight = train_weight(sets)
+    if counts is not None:
+        C = {who: word_counts.store_rows(counts, sets[who]) for who in sets}
+        return counts_tf_idf(C, counts['vocab'], target=target, only_train=only_train,
+                             weight=weight)
+
+    # vocabulary of the training set (restricted to 'target'), in alphabetic order
+    if target is None:
+        words = {w for dic in sets['train']['word_count'].tolist() for w in dic}
+    else:
+        target = set(target)
+        words = {w for dic in sets['train']['word_count'].tolist() for w in dic if w in target}
+    vocab = np.array(sorted(words), dtype=object)
+    vocabulary = {w: i for i, w in enumerate(vocab)}
+
+    C = {}
     for who in sets:
-        corpus[who] = set_to_corpus(sets[who], target=target)
+        if who == 'train' or not only_train:
+            C[who] = set_to_counts(sets[who], vocabulary)
+    return counts_tf_idf(C, vocab, only_train=only_train, weight=weight)
 
-    M = {}
-    vectorizer = TfidfVectorizer()
 
-    M['train'] = vectorizer.fit_transform(corpus['train'])
-    if not only_train:
-        M['valid'] = vectorizer.transform(corpus['valid'])
-        M['test'] = vectorizer.transform(corpus['test'])
+def word_buckets(words, hash_bits):
+    '''
+    Returns the array of the buckets of the words 'words' in the hashed 
+    feature space of 2**hash_bits buckets (see hashed_counts).
+    '''
+    if len(words) == 0:
+        return np.array([], dtype=np.int32)
+    hasher = FeatureHasher(2**hash_bits, input_type='string', alternate_sign=False)
+    return hasher.transform([[w] for w in words]).indices
+
+
+def hashed_counts(sets, hash_bits, counts=None):
+    '''
+    Computes the count matrix of the training set of 'sets' in a hashed 
+    feature space of 2**hash_bits buckets: the count of a bucket is the sum of 
+    the counts of the words hashed into it (as FeatureHasher, without 
+    alternate signs), so its size does not depend on the vocabulary.
+
+    Parameters: 
+    - sets     : dictionary with key=train and value=subset.
+    - hash_bits: number of bits of the buckets.
+    - counts   : word counts (see word_counts.select_ngrams) or None 
+                 (default=None).
+    Output:
+    - C        : count matrix (csr format, size: set_size x 2**hash_bits).
+    '''
+    if counts is None:
+        hasher = FeatureHasher(2**hash_bits, input_type='dict', alternate_sign=False)
+        return hasher.transform(sets['train']['word_count'].tolist())
 
-    features = vectorizer.get_feature_names()
-    return M, features
+    X = word_counts.store_rows(counts, sets['train'])
+    C = csr_matrix((X.data.astype(np.float64), word_buckets(counts['vocab'], hash_bits)[X.indices],
+                    X.indptr), shape=(X.shape[0], 2**hash_bits))
+    C.sum_duplicates()
+    return C
 
 
-def kbest(P, M, W, Y):
+def bucket_words(P, sets, buckets, counts=None):
+    '''
+    Gets the words of the training set of 'sets' hashed into the buckets 
+    'buckets' (see hashed_counts), so that the features selected in the hashed 
+    feature space can be named. The words are hashed by sub training sets of 
+    P.kbest_chunk_size jobs (by HASH_BATCH words of the word count store with 
+    'counts'), and only the words of 'buckets' are kept.
+
+    Parameters: 
+    - P      : Experiment object representing the current experiment set-up
+    - sets   : dictionary with key=train and value=subset.
+    - buckets: list of buckets.
+    - counts : word counts (see word_counts.select_ngrams) or None 
+               (default=None).
+    Output:
+    - words  : sorted list of words.
+    '''
+    buckets = np.unique(np.asarray(buckets, dtype=np.int64))
+    if counts is not None:
+        vocab = counts['vocab']
+        cols = [np.zeros(0, dtype=np.int64)]
+        for i in range(0, len(vocab), HASH_BATCH):
+            keep = np.isin(word_buckets(vocab[i:i + HASH_BATCH], P.hash_bits), buckets)
+            cols.append(i + np.flatnonzero(keep))
+        cols = np.concatenate(cols)
+        # only the words of the training set
+        X = word_counts.store_rows(counts, sets['train'])[:, cols].tocsc()
+        return vocab[cols[np.diff(X.indptr) > 0]].tolist()
+
+    size = P.kbest_chunk_size
+    dics = sets['train']['word_count'].tolist()
+    batches = (list({w for dic in dics[i:i + size] for w in dic})
+               for i in range(0, len(dics), size))
+    words = set()
+    for batch in batches:
+        keep = np.isin(word_buckets(batch, P.hash_bits), buckets)
+        words.update(w for w, k in zip(batch, keep) if k)
+    return sorted(words)
+
+
+def chi2_stats(observed, class_count):
+    '''
+    Computes the chi2 statistics of the features as 
+    sklearn.feature_selection.chi2 (without the p-values), from the sums of 
+    the features in each class 'observed' (size: 2 x nbr_features) and the 
+    number of rows of each class 'class_count' (size: 2).
+    '''
+    class_count = np.asarray(class_count, dtype=np.float64).reshape(1, -1)
+    feature_count = observed.sum(axis=0, keepdims=True)
+    class_prob = class_count / class_count.sum()
+    expected = class_prob.T @ feature_count
+
+    chisq = (observed - expected) ** 2
+    with np.errstate(invalid="ignore"):
+        chisq /= expected
+    return chisq.sum(axis=0)
+
+
+def weighted_chi2(X, y, weight):
+    '''
+    Same as sklearn.feature_selection.chi2 for binary labels 'y', on the 
+    matrix 'X' where the row i is repeated weight[i] times.
+    '''
+    Y = np.asarray(y, dtype=np.float64).reshape(-1, 1)
+    Y = np.hstack([1 - Y, Y]) * np.asarray(weight, dtype=np.float64).reshape(-1, 1)
+
+    observed = np.asarray(X.T @ Y).T  # (2 x nbr_features)
+    chisq = chi2_stats(observed, Y.sum(axis=0))
+    return chisq, chdtrc(1, chisq)
+
+
+def kbest(P, M, W, Y, weight=None):
     '''
     Select the Kbest features for a given matrices 'M', with feature names 'W' and 
     labels 'Y'. The K number of features to select is given in the Experiment
     object 'P'.
+    With 'weight', the row i of 'M' counts as weight[i] rows (see weighted_chi2).
 
     Parameters:
     - P: Experiment object representing the current experiment set-up
     - M: A matrix (size: set_size x nbr_features)
     - W: A list of features/words (size: nbr_features)
     - Y: A list of labels (size: set_size)
+    - weight: array of the weights of the rows or None (default=None)
     Output:
     - k_selected: list of features selected (size: P.kbest_thresh)
     '''
-    model = SelectKBest(chi2, k=P.kbest_thresh)
+    score_func = chi2
+    if weight is not None:
+        score_func = partial(weighted_chi2, weight=weight)
+    model = SelectKBest(score_func, k=P.kbest_thresh)
     X_new = model.fit_transform(M, Y)
 
     k_selected = [W[i] for i in model.get_support(True)]
     return k_selected
 
 
-def X_values(P, sets):
+def train_chunks(P, sets, counts=None):
+    '''
+    Generates the sub training sets of size P.kbest_chunk_size used for the 
+    preselection of features in X_values. For an oversampled training set, the 
+    size of a sub training set is the sum of the weights of its jobs (a job 
+    is in the sub training set of its first copy).
+    Only the columns needed for the preselection are kept in the sub training 
+    sets, and with a word count store, the word counts are restricted to their 
+    jobs, so that they are cheap to send to another process.
+
+    Parameters: 
+    - P     : Experiment object representing the current experiment set-up
+    - sets  : list of dictionaries with keys=train/valid/test and 
+              values=subsets.
+    - counts: word counts (see word_counts.select_ngrams) or None (default=None).
+    Output:
+    - generator of tuples (P, sub_set, sub_counts), the arguments of chunk_kbest.
+    '''
+    iter_size = P.kbest_chunk_size
+    columns = ['flaky', 'word_count' if counts is None else word_counts.ROW_COLUMN]
+    weight = train_weight(sets)
+    if weight is None:
+        weight = np.ones(sets['train'].shape[0], dtype=np.int64)
+    else:
+        columns.append('weight')
+
+    # chunk of each job, from the position of its first copy
+    chunk = (np.cumsum(weight) - weight) // iter_size
+    bounds = np.searchsorted(chunk, np.unique(chunk)).tolist() + [len(chunk)]
+    for a, b in zip(bounds[:-1], bounds[1:]):
+        sub_set = {'train': sets['train'][columns].iloc[a:b]}
+        sub_counts = None
+        if counts is not None:
+            sub_set['train'], sub_counts = word_counts.sub_counts(counts, sub_set['train'])
+        yield P, sub_set, sub_counts
+
+
+def chunk_kbest(args):
+    '''
+    Generates the tfidf matrix of a sub training set and selects its Kbest 
+    features.
+    If P.hash_bits is not None, the features are the buckets of the hashed 
+    feature space of 2**P.hash_bits buckets (see hashed_counts).
+
+    Parameters: 
+    - args: tuple (P, sub_set, sub_counts) (see train_chunks).
+    Output:
+    - k_selected: list of features selected (size: P.kbest_thresh)
+    '''
+    P, sub_set, sub_counts = args
+    if P.hash_bits is None:
+        M_tfidf, target, _ = tf_idf(sub_set, only_train=True, counts=sub_counts)
+    else:
+        C = hashed_counts(sub_set, P.hash_bits, sub_counts)
+        cols = np.unique(C.indices)  # buckets of the sub training set
+        M_tfidf, target, _ = counts_tf_idf({'train': C[:, cols]}, cols, only_train=True,
+                                           weight=train_weight(sub_set))
+    Y_tfidf = y_values(P, sub_set)
+    return kbest(P, M_tfidf['train'], target, Y_tfidf['train'], train_weight(sub_set))
+
+
+def chunk_stats(args):
+    '''
+    Computes the statistics of a sub training set needed by the chi2 selection 
+    of stats_kbest: for each feature, its (weighted) number of jobs and the 
+    sums in each class of its term frequencies (counts divided by the L2 norm 
+    of the counts of the job), and the (weighted) number of jobs of each class.
+    The statistics of several sub training sets are merged with merge_stats.
+    If P.hash_bits is not None, the features are the buckets of the hashed 
+    feature space of 2**P.hash_bits buckets (see hashed_counts).
+
+    Parameters: 
+    - args : tuple (P, sub_set, sub_counts) (see train_chunks).
+    Output:
+    - stats: dictionary with keys:
+                - feat : array of the features (size: nbr_features)
+                - df   : array of the number of jobs of the features
+                - tf   : array of the sums of the term frequencies of the 
+                         features in each class (size: 2 x nbr_features)
+                - total: array of the number of jobs of each class (size: 2)
+    '''
+    P, sub_set, sub_counts = args
+    if P.hash_bits is not None:
+        C = hashed_counts(sub_set, P.hash_bits, sub_counts)
+        vocab = None
+    elif sub_counts is not None:
+        C = word_counts.store_rows(sub_counts, sub_set['train'])
+        vocab = sub_counts['vocab']
+    else:
+        # vocabulary in the order of appearance, built while counting
+        vocabulary = {}
+        indptr = [0]
+        indices = []
+        data = []
+        for dic in sub_set['train']['word_count'].tolist():
+            indices.extend([vocabulary.setdefault(w, len(vocabulary)) for w in dic])
+            data.extend(dic.values())
+            indptr.append(len(indices))
+        vocab = np.array(list(vocabulary), dtype=object)
+        C = csr_matrix((np.array(data, dtype=np.float64), np.array(indices, dtype=np.int32),
+                        np.array(indptr, dtype=np.int64)), shape=(len(indptr) - 1, len(vocab)))
+    cols = np.unique(C.indices)
+    C = csr_matrix(C[:, cols], dtype=np.float64)
+    feat = cols if vocab is None else vocab[cols]
+
+    weight = train_weight(sub_set)
+    if weight is None:
+        weight = np.ones(C.shape[0])
+    Y = np.asarray(y_values(P, sub_set)['train'], dtype=np.float64).reshape(-1, 1)
+    Y = np.hstack([1 - Y, Y]) * np.asarray(weight, dtype=np.float64).reshape(-1, 1)
+
+    norm = np.sqrt(np.asarray(C.multiply(C).sum(axis=1)).ravel())
+    norm[norm == 0] = 1
+    C.data /= np.repeat(norm, np.diff(C.indptr))
+    return {'feat': feat,
+            'df': np.bincount(C.indices, weights=np.repeat(weight, np.diff(C.indptr)),
+                              minlength=C.shape[1]),
+            'tf': np.asarray(C.T @ Y).T,
+            'total': Y.sum(axis=0)}
+
+
+def merge_stats(STATS, stats):
+    '''
+    Adds the statistics 'stats' of a sub training set (see chunk_stats) to 
+    the statistics 'STATS' of the previous ones (None for the first one), 
+    and returns them. 'STATS' has the keys of 'stats', with 'feat' as a list 
+    and 'index' the dictionary of the column of each feature, or for the 
+    buckets of a hashed feature space, with the column of a bucket being its 
+    number ('feat' and 'index' are None).
     '''
-    Computes the TF-IDF matrices, following the paper's iterative vectorization 
-    approach.
+    buckets = np.issubdtype(stats['feat'].dtype, np.integer)
+    if STATS is None:
+        STATS = {'index': None if buckets else {}, 'feat': None if buckets else [],
+                 'df': np.zeros(0), 'tf': np.zeros((2, 0)), 'total': np.zeros(2)}
+    size = len(STATS['df'])
+    if buckets:
+        pos = stats['feat']
+        new = max(size, int(pos.max(initial=-1)) + 1) - size
+    else:
+        index = STATS['index']
+        pos = np.array([index.setdefault(f, len(index)) for f in stats['feat'].tolist()],
+                       dtype=np.int64)
+        new = len(index) - size
+        STATS['feat'].extend(stats['feat'][pos >= size].tolist())
+    if new > 0:
+        STATS['df'] = np.concatenate([STATS['df'], np.zeros(new)])
+        STATS['tf'] = np.hstack([STATS['tf'], np.zeros((2, new))])
+    STATS['df'][pos] += stats['df']
+    STATS['tf'][:, pos] += stats['tf']
+    STATS['total'] += stats['total']
+    return STATS
+
+
+def stats_kbest(P, STATS):
+    '''
+    Selects the Kbest features with the chi2 scores of their tfidf computed 
+    from the statistics of the training set 'STATS' (see merge_stats). The 
+    idf of the features is the one of TfidfTransformer (see weighted_idf), but 
+    as the idf is only known once all the training set is seen, the jobs are 
+    normalized on their counts instead of their tfidf.
+
+    Parameters:
+    - P         : Experiment object representing the current experiment set-up
+    - STATS     : statistics of the training set (see merge_stats).
+    Output:
+    - k_selected: list of features selected (size: P.kbest_thresh)
+    '''
+    cols = np.flatnonzero(STATS['df'])  # (all the buckets are not in the training set)
+    idf = np.log((1 + STATS['total'].sum()) / (1 + STATS['df'][cols])) + 1
+    chisq = chi2_stats(STATS['tf'][:, cols] * idf, STATS['total'])
+    chisq[np.isnan(chisq)] = -np.inf  # as SelectKBest
+
+    k = min(P.kbest_thresh, len(chisq))
+    cols = np.sort(cols[np.argsort(chisq, kind='mergesort')[len(chisq) - k:]])
+    if STATS['feat'] is None:
+        return cols.tolist()
+    return [STATS['feat'][i] for i in cols.tolist()]
+
+
+def X_values(P, sets, counts=None):
+    '''
+    Computes the TF-IDF matrices.
+    If P.kbest_mode = 'chunks', the features are selected following the 
+    paper's iterative vectorization approach: the Kbest features of the tfidf 
+    matrix of each sub training set (see train_chunks) are preselected, then 
+    the Kbest features of the tfidf matrix of the training set restricted to 
+    them are selected.
+    If P.kbest_mode = 'stats', the statistics of the chi2 selection are 
+    computed in one pass over the sub training sets, and the Kbest features 
+    are selected from them (see stats_kbest).
+    The sub training sets are independent, they are processed with P.workers 
+    processes. If P.hash_bits is not None, the features are first selected 
+    among the buckets of a hashed feature space (see hashed_counts), then 
+    the Kbest features are selected among the words of the selected buckets.
 
     Parameters: 
     - P         : Experiment object representing the current experiment set-up
     - sets      : list of dictionaries with keys=train/valid/test and 
                   values=subsets.
+    - counts    : word counts (see word_counts.select_ngrams) or None 
+                  (default=None, the 'word_count' column of the subsets is used).
     Outputs:
     - M_tfidf   : dictionary with keys=train/valid/test and values=tfidf matrix 
     - features  : list of words/features of the tfidf matrices (names of the columns)
+    - idf       : array of the idf of the features
     '''
-    iter_size = 1000  # size of the sub training sets
-    N = math.ceil(sets['train'].shape[0] / iter_size)
-    k_selected = []
-    for i in range(N):
+    hash_bits = P.hash_bits
+    if P.kbest_mode == 'chunks':
         # generate tfidf matrices + kbest selecting for each sub training set
-        sub_set = {'train': sets['train'].iloc[i * iter_size:(i + 1) * iter_size]}
-        M_tfidf, target = tf_idf(sub_set, only_train=True)
-        Y_tfidf = y_values(P, sub_set)
-        k_selected += kbest(P, M_tfidf['train'], target, Y_tfidf['train'])
+        k_selected = []
+        for selected in parallel.pool_imap(chunk_kbest, train_chunks(P, sets, counts),
+                                           workers=P.workers):
+            k_selected += selected
+        k_selected = list(set(k_selected))
+    else:
+        # kbest selection from the statistics of the training set
+        STATS = None
+        for stats in parallel.pool_imap(chunk_stats, train_chunks(P, sets, counts),
+                                        workers=P.workers):
+            STATS = merge_stats(STATS, stats)
+        k_selected = stats_kbest(P, STATS)
+        del STATS
 
-    # final kbest selection on the union of the preselected features
-    k_selected = list(set(k_selected))
-    sub_set = {'train': sets['train']}
-    M_tfidf, target = tf_idf(sub_set, target=k_selected, only_train=True)
-    Y_tfidf = y_values(P, sub_set)
-    final_k_selected = kbest(P, M_tfidf['train'], target, Y_tfidf['train'])
+    final_k_selected = k_selected
+    if P.kbest_mode == 'chunks' or hash_bits is not None:
+        # final kbest selection on the union of the preselected features
+        if hash_bits is not None:
+            k_selected = bucket_words(P, sets, k_selected, counts)
+        sub_set = {'train': sets['train']}
+        M_tfidf, target, _ = tf_idf(sub_set, target=k_selected, only_train=True,
+                                    counts=counts)
+        Y_tfidf = y_values(P, sub_set)
+        final_k_selected = kbest(P, M_tfidf['train'], target, Y_tfidf['train'],
+                                 train_weight(sub_set))
 
     # final tfidf matrices
-    M_tfidf, target = tf_idf(sets, target=final_k_selected)
+    M_tfidf, target, idf = tf_idf(sets, target=final_k_selected, counts=counts)
 
-    return M_tfidf, target
+    return M_tfidf, target, idf
 
 
 def y_values(P, sets):
@@ -147,7 +560,7 @@ def y_values(P, sets):
     return Y
 
 
-def vectorization(P, sets):
+def vectorization(P, sets, counts=None):
     ''' 
     Vectorizes the subsets in 'sets' using the tfidf and kbest selection.
 
@@ -155,15 +568,21 @@ def vectorization(P, sets):
     - P      : Experiment object representing the current experiment set-up
     - sets   : list of dictionaries with keys=train/valid/test and 
                values=subsets.
+    - counts : word counts (see word_counts.select_ngrams) or None 
+               (default=None, the 'word_count' column of the subsets is used).
     Outputs:
     - VECTORS: dictionary with keys=train/valid/test and values=info_dictionary.
                info_dictionary are dictionary with keys:
                     - X: the tfidf matrix
                     - y: the label vector
-                    - info: list of dictionary with additional metrics (see paper)
+                    - info: dataframe of the additional metrics (see paper and 
+                      sub_sets.get_info_rerun)
+                    - weight: weights of the jobs for an oversampled set (see 
+                      sub_sets.oversampling), else None
                     - feat: list of features (the column names of the tfidf matrix)
+                    - idf: idf of the features (fitted on the training set)
     '''
-    M, target = X_values(P, sets)
+    M, target, idf = X_values(P, sets, counts=counts)
     Y = y_values(P, sets)
 
     VECTORS = {}
@@ -171,6 +590,8 @@ def vectorization(P, sets):
         VECTORS[who] = {
             'X': M[who],
             'y': Y[who],
-            'info': sets[who]['info'],
-            'feat': target}
+            'info': sets[who][sub_sets.INFO_COLUMNS],
+            'weight': sets[who]['weight'].tolist() if 'weight' in sets[who] else None,
+            'feat': target,
+            'idf': idf}
     return VECTORS
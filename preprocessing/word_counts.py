@@ -0,0 +1,170 @@
+import numpy as np
+from scipy.sparse import csr_matrix, hstack
+
+import preprocessing.get_data as get_data
+import tools.serialization as serialization
+
+ROW_COLUMN = "counts_row"  # column of the dataset giving the row in the store
+
+
+def build_store(res):
+    '''
+    Builds the word count store of the dataset 'res': for each N in
+    1..MAX_NGRAM, the vocabulary of the ngrams (sorted) and a sparse matrix of
+    the counts (size: nbr_jobs x size_vocabulary), where the row i is the job
+    of the line i of 'res'.
+
+    Parameters:
+    - res  : dataset in a pandas dataframe format (see get_data).
+    Output:
+    - STORE: dictionary with keys=N and values=dictionary with keys:
+                - vocab: array of words (names of the columns)
+                - X: the count matrix (csr format)
+    '''
+    STORE = {}
+    for n in range(1, 1 + get_data.MAX_NGRAM):
+        vocabulary = {}
+        indptr = [0]
+        indices = []
+        data = []
+        for dic in res["word_count_ngram_" + str(n)].tolist():
+            for w, c in dic.items():
+                indices.append(vocabulary.setdefault(w, len(vocabulary)))
+                data.append(c)
+            indptr.append(len(indices))
+
+        # columns in alphabetic order, as the features of the tfidf matrices
+        vocab = np.array(sorted(vocabulary), dtype=object)
+        new_col = np.empty(len(vocab), dtype=np.int32)
+        new_col[[vocabulary[w] for w in vocab]] = np.arange(len(vocab), dtype=np.int32)
+
+        X = csr_matrix((np.array(data, dtype=np.int32),
+                        new_col[np.array(indices, dtype=np.int64)],
+                        np.array(indptr, dtype=np.int64)),
+                       shape=(res.shape[0], len(vocab)))
+        X.sort_indices()
+        STORE[n] = {'vocab': vocab, 'X': X}
+    return STORE
+
+
+def split_counts(res):
+    '''
+    Moves the word counts of the dataset 'res' into a word count store.
+
+    Parameters:
+    - res  : dataset in a pandas dataframe format (see get_data).
+    Outputs:
+    - jobs : dataset without the word_count_ngram_N columns, with added
+             'counts_row' column (row of the job in the store).
+    - STORE: word count store (see build_store).
+    '''
+    STORE = build_store(res)
+
+    jobs = res.drop(columns=["word_count_ngram_" + str(n)
+                             for n in range(1, 1 + get_data.MAX_NGRAM)])
+    jobs[ROW_COLUMN] = np.arange(res.shape[0])
+    return jobs, STORE
+
+
+def save_store(STORE, filename):
+    '''
+    Saves the word count store 'STORE' in the .npz file 'filename'.
+    The arrays are not compressed so that they can be memory-mapped at loading.
+    '''
+    arrays = {}
+    for n in STORE:
+        X = STORE[n]['X']
+        arrays['vocab_%d' % n] = np.frombuffer(
+            '\n'.join(STORE[n]['vocab']).encode('utf-8'), dtype=np.uint8)
+        arrays['shape_%d' % n] = np.array(X.shape, dtype=np.int64)
+        arrays['indptr_%d' % n] = X.indptr
+        arrays['indices_%d' % n] = X.indices
+        arrays['data_%d' % n] = X.data
+    np.savez(filename, **arrays)
+
+
+def load_store(filename, mmap=True):
+    '''
+    Loads the word count store saved in the .npz file 'filename'.
+    If mmap=True, the count matrices are memory-mapped instead of being read.
+    '''
+    if mmap:
+        arrays = serialization.npz_memmap(filename)
+    else:
+        arrays = dict(np.load(filename))
+
+    STORE = {}
+    for n in range(1, 1 + get_data.MAX_NGRAM):
+        if 'shape_%d' % n not in arrays:
+            continue
+        vocab = bytes(arrays['vocab_%d' % n]).decode('utf-8')
+        shape = tuple(int(e) for e in arrays['shape_%d' % n])
+        X = csr_matrix((arrays['data_%d' % n],
+                        arrays['indices_%d' % n],
+                        arrays['indptr_%d' % n]), shape=shape, copy=False)
+        STORE[n] = {'vocab': np.array(vocab.split('\n') if vocab else [], dtype=object),
+                    'X': X}
+    return STORE
+
+
+def select_ngrams(STORE, ngrams):
+    '''
+    Gets the word counts of the store 'STORE' for the list of N 'ngrams',
+    merged as in sub_sets.get_word_count (if a word is in several ngram
+    vocabularies, the count of the last N is kept).
+
+    Parameters:
+    - STORE : word count store (see build_store).
+    - ngrams: list of the N values considered.
+    Output:
+    - COUNTS: dictionary with keys:
+                - vocab: array of words (names of the columns), sorted.
+                - X: the count matrix (csr format)
+    '''
+    if len(ngrams) == 1:
+        return STORE[ngrams[0]]
+
+    words = np.array([w for n in ngrams for w in STORE[n]['vocab']], dtype=object)
+    order = np.argsort(words, kind='stable')
+    X = hstack([STORE[n]['X'] for n in ngrams], format='csr')[:, order]
+    vocab, col = np.unique(words[order], return_inverse=True)
+
+    if len(vocab) < len(words):
+        # duplicated words: keep the count of the last N for each job
+        X = X.tocoo()
+        last = np.lexsort((X.col, col[X.col], X.row))
+        new_col = col[X.col[last]]
+        keep = np.ones(len(last), dtype=bool)
+        keep[:-1] = (X.row[last][1:] != X.row[last][:-1]) | (new_col[1:] != new_col[:-1])
+        X = csr_matrix((X.data[last][keep], (X.row[last][keep], new_col[keep])),
+                       shape=(X.shape[0], len(vocab)))
+
+    return {'vocab': vocab, 'X': X.tocsr()}
+
+
+def store_rows(COUNTS, sets):
+    '''
+    Gets the count matrix of the jobs of the subset 'sets' from the word counts
+    'COUNTS' (see select_ngrams).
+    '''
+    return COUNTS['X'][sets[ROW_COLUMN].to_numpy()]
+
+
+def sub_counts(COUNTS, sets):
+    '''
+    Gets the word counts of the jobs of the subset 'sets' only, with the 
+    vocabulary restricted to the words they contain.
+
+    Parameters:
+    - COUNTS  : word counts (see select_ngrams).
+    - sets    : subset in a pandas dataframe format, with a 'counts_row' column.
+    Outputs:
+    - sets    : subset with 'counts_row' giving the rows in the new word counts.
+    - COUNTS  : word counts of the jobs in 'sets'.
+    '''
+    X = store_rows(COUNTS, sets)
+    cols = np.unique(X.indices)
+
+    sets = sets.copy()
+    sets[ROW_COLUMN] = np.arange(sets.shape[0])
+    return sets, {'vocab': COUNTS['vocab'][cols], 'X': X[:, cols]}
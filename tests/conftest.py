@@ -0,0 +1,15 @@
+import os
+from functools import partial
+
+import pytest
+
+
+@pytest.fixture
+def experiment(tmp_path, monkeypatch):
+    '''
+    Returns main_process.Experiment, its folders being created in tmp_path.
+    '''
+    monkeypatch.chdir(tmp_path)
+    import main_process
+    os.makedirs(main_process.PATH_experiment, exist_ok=True)
+    return partial(main_process.Experiment, str(tmp_path))
@@ -0,0 +1,45 @@
+import random
+import numpy as np
+import pytest
+
+import preprocessing.get_data as get_data
+import preprocessing.sub_sets as sub_sets
+import preprocessing.vectorization as vectorization
+import classification.classification_XGboost as classification_XGBoost
+import classification.bundle as bundle
+from benchmarks.synthetic import synthetic_data
+
+
+@pytest.mark.parametrize('shap_mode', classification_XGBoost.SHAP_MODES)
+def test_predict(shap_mode, experiment, tmp_path):
+    # the saved bundle of a run gives the probabilities of the run on its test set
+    if shap_mode == 'shap':
+        pytest.importorskip('shap')
+    random.seed(0)
+    P = experiment(ngram=[1, 2], seed=0, kbest_thresh=100, kbest_chunk_size=500,
+                   shap_mode=shap_mode)
+    sets = sub_sets.sub_sets(P, synthetic_data(2000, 30))
+    VECTORS = vectorization.vectorization(P, sets)
+    BIG, MODELS = classification_XGBoost.classify_XGBoost(P, VECTORS, return_models=True)
+    bundle.save_bundle(bundle.make_bundle(P, VECTORS, MODELS), tmp_path / bundle.BUNDLE_NAME)
+    BUNDLE = bundle.load_bundle(tmp_path / bundle.BUNDLE_NAME)
+    assert ('explainer' in BUNDLE) == (shap_mode == 'shap')
+
+    test = sets['test']
+    counts = [[test["word_count_ngram_" + str(n + 1)].iloc[i] for n in range(get_data.MAX_NGRAM)]
+              for i in range(test.shape[0])]
+    PRED = bundle.predict(BUNDLE, counts, test[BUNDLE['info_features']].to_numpy())
+
+    expected = BIG['%.1fvar_%dtresh' % (float(P.beta), P.alpha)]['pred']
+    np.testing.assert_allclose(PRED['probability'], expected, rtol=1e-6, atol=1e-6)
+    assert PRED['brown'].tolist() == (np.asarray(expected) >= P.alpha / 100.0).tolist()
+
+
+def test_check_logs():
+    # the bundles trained on processed logs (or saved without raw_logs) refuse the raw logs
+    bundle.check_logs({'raw_logs': True}, True)
+    bundle.check_logs({}, False)
+    with pytest.raises(ValueError):
+        bundle.check_logs({'raw_logs': True}, False)
+    with pytest.raises(ValueError):
+        bundle.check_logs({}, True)
@@ -0,0 +1,33 @@
+import os
+import glob
+
+import pytest
+
+import preprocessing.extract as extract
+import preprocessing.get_data as get_data
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), 'data')
+
+
+# stems of the stemmer of main_extract.go (exis, chec, buil: see feature_extracted.txt)
+@pytest.mark.parametrize('word, stem', [('existing', 'exis'), ('checking', 'chec'),
+                                        ('building', 'buil'), ('case', 'case'),
+                                        ('unexpected', 'unexpec'), ('failed', 'fail'),
+                                        ('relational', 'relat'), ('hopefulness', 'hope'),
+                                        ('yellowing', 'yellow'), ('quininiazation', 'quininiazat'),
+                                        ('hypothesisnumletforge', 'hypothesisnumletforg')])
+def test_stem(word, stem):
+    assert extract.stem(word) == stem
+
+
+def test_log_count():
+    lines = ['Build the doc\n', 'build failed\n']
+    assert extract.log_count(lines) == [{'build': 2, 'doc': 1, 'fail': 1},
+                                        {'build_doc': 1, 'doc_build': 1, 'build_fail': 1}]
+
+
+# the -processed.csv files of tests/data were written by main_extract.go
+@pytest.mark.parametrize('log', sorted(glob.glob(os.path.join(DATA_PATH, '*.log'))))
+def test_processed_logs(log):
+    processed = log[:-len('.log')] + '-processed.csv'
+    assert get_data.get_text_count(log, raw=True) == get_data.get_text_count(processed)
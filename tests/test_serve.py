@@ -0,0 +1,42 @@
+import json
+import random
+import threading
+from http.client import HTTPConnection
+from http.server import HTTPServer
+
+import preprocessing.sub_sets as sub_sets
+import preprocessing.vectorization as vectorization
+import classification.classification_XGboost as classification_XGBoost
+import classification.bundle as bundle
+import main_serve
+from benchmarks.synthetic import synthetic_data
+
+
+def post(server, jobs):
+    conn = HTTPConnection('127.0.0.1', server.server_address[1])
+    conn.request('POST', '/predict', json.dumps(jobs))
+    res = conn.getresponse()
+    return res.status, json.loads(res.read())
+
+
+def test_raw_logs_service(experiment):
+    # the service of a bundle trained on raw logs starts and only takes raw logs
+    random.seed(0)
+    P = experiment(raw_logs=True, ngram=[1, 2], seed=0, kbest_thresh=100, kbest_chunk_size=500,
+                   shap_mode='contribs')
+    sets = sub_sets.sub_sets(P, synthetic_data(500, 30))
+    VECTORS = vectorization.vectorization(P, sets)
+    _, MODELS = classification_XGBoost.classify_XGBoost(P, VECTORS, return_models=True)
+    BUNDLE = bundle.make_bundle(P, VECTORS, MODELS)
+
+    server = HTTPServer(('127.0.0.1', 0), main_serve.make_handler(BUNDLE))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        status, res = post(server, [{'raw_log': 'Build failed\nConnection timed out\n'}])
+        assert status == 200 and len(res) == 1 and 0 <= res[0]['probability'] <= 1
+        assert post(server, []) == (200, [])
+        status, res = post(server, {'log': '#\nbuild,1\n#\n'})
+        assert status == 400
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+import preprocessing.sub_sets as sub_sets
+
+
+def test_get_since_flaky():
+    # commits by date of their first job: A, B (flaky), C and D (same date,
+    # by commitID), E (flaky), F; the rows are not in this order
+    res = pd.DataFrame([("F", "2019-01-06", "safe"),
+                        ("D", "2019-01-04", "safe"),
+                        ("B", "2019-01-03", "flaky"),
+                        ("E", "2019-01-05", "flaky"),
+                        ("A", "2019-01-01", "safe"),
+                        ("C", "2019-01-04", "safe"),
+                        ("B", "2019-01-02", "safe"),
+                        ("E", "2019-01-05", "safe")],
+                       columns=["commitID", "date", "flaky"])
+    res["date"] = pd.to_datetime(res["date"])
+
+    since_flaky = sub_sets.get_since_flaky(res)
+    assert since_flaky.tolist() == [0, 1, 1, 2, 0, 0, 1, 2]
+    assert since_flaky.dtype == np.int64
+
+
+def test_get_info_rerun_missing_job_name():
+    # the jobs without jobName are counted together, as the other jobs
+    res = pd.DataFrame([("A", None, "2019-01-02", 0),
+                        ("A", "build", "2019-01-01", 1),
+                        ("A", None, "2019-01-01", 1),
+                        ("A", "build", "2019-01-02", 0),
+                        ("A", None, "2019-01-03", 1)],
+                       columns=["commitID", "jobName", "date", "status"])
+    res["date"] = pd.to_datetime(res["date"])
+    res["flaky"] = "safe"
+
+    res = sub_sets.get_info_rerun(res)
+    assert res["rerun"].tolist() == [1, 0, 0, 1, 2]
+    assert res["fail"].tolist() == [1, 0, 0, 1, 1]
+    assert res["success"].tolist() == [0, 0, 0, 0, 1]
@@ -0,0 +1,28 @@
+from multiprocessing import Pool
+
+
+def pool_imap(fun, iterable, workers=1, chunksize=1, initializer=None, initargs=()):
+    '''
+    Lazily applies 'fun' to every element of 'iterable' using a pool of 
+    'workers' processes. The results are yielded in the order of 'iterable'.
+    If workers <= 1, everything runs in the current process.
+
+    Parameters:
+    - fun        : picklable function with one argument.
+    - iterable   : iterable of arguments for 'fun'.
+    - workers    : int. Number of processes (default=1).
+    - chunksize  : int. Number of elements sent at once to a process (default=1).
+    - initializer: function called with 'initargs' by each process before 
+                   'fun', to set data shared by all the calls (default=None).
+    - initargs   : tuple of arguments for 'initializer' (default=()).
+    Output:
+    - generator of the results of 'fun'.
+    '''
+    if workers is None or workers <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        yield from map(fun, iterable)
+        return
+
+    with Pool(workers, initializer, initargs) as pool:
+        yield from pool.imap(fun, iterable, chunksize)
@@ -1,11 +1,24 @@
 import pickle
 import time
 import os
+import shutil
+import hashlib
+import inspect
+
+import tools.serialization as serialization
+
+# Bump to invalidate all the stage caches (ex: change in a helper module that
+# is not part of the keys, see stage_key).
+CACHE_VERSION = 1
+# Cache entries used after this time (start of the run) are never evicted.
+RUN_START = time.time()
+# Extension of the cache entries for each cache format (see stage_dump).
+CACHE_EXT = {'pickle': '.p', 'feather': '.feather', 'parquet': '.parquet'}
 
 
 def pickle_dump(data, pick_file):
     with open(pick_file, "wb") as f:
-        pickle.dump(data, f)
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
 
 
 def pickle_load(pick_file):
@@ -16,12 +29,154 @@ def pickle_load(pick_file):
 
 def run_and_pickle(fun, args, filename, recompute=False, do_print=True):
     start_time = time.time()
-    print('Load ', filename, end=' ... ')
+    if do_print:
+        print('Load ', filename, end=' ... ')
     if not recompute and os.path.exists(filename):
         COMPUTED = pickle_load(filename)
     else:
-        print('(computing)', end=' ...')
+        if do_print:
+            print('(computing)', end=' ...')
         COMPUTED = fun(**args)
         pickle_dump(COMPUTED, filename)
-    print('Done in', round(time.time() - start_time, 2), 'sec')
+    if do_print:
+        print('Done in', round(time.time() - start_time, 2), 'sec')
+    return COMPUTED
+
+
+def stage_key(fun, params={}, upstream=[]):
+    '''
+    Computes the cache key of a pipeline stage computed by the function 'fun'.
+    The key is a hash of the source code of the module of 'fun', of the
+    parameters the stage depends on and of the keys of the upstream stages
+    whose results are its inputs. So the key changes as soon as one of its
+    inputs changes.
+
+    Parameters:
+    - fun     : function computing the stage.
+    - params  : dictionary with keys=parameter names and values=their values
+                (must have a stable repr).
+    - upstream: list of the keys of the upstream stages.
+    Output:
+    - key     : string of 16 hexadecimal characters.
+    '''
+    h = hashlib.sha1()
+    h.update(('%d %s.%s\n' % (CACHE_VERSION, fun.__module__, fun.__qualname__)).encode())
+    h.update(inspect.getsource(inspect.getmodule(fun)).encode())
+    h.update(repr(sorted(params.items())).encode())
+    for key in upstream:
+        h.update(key.encode())
+    return h.hexdigest()[:16]
+
+
+def cache_filename(path, name, key, ext='.p'):
+    '''
+    Returns the filename of the stage 'name' with cache key 'key' in the cache
+    directory 'path'.
+    '''
+    return path + name + '_' + key + ext
+
+
+def touch(filename):
+    '''
+    Marks the cache entry 'filename' as used now (for the LRU eviction).
+    '''
+    if os.path.exists(filename):
+        os.utime(filename)
+
+
+def cache_size(path):
+    '''
+    Returns the size in bytes of the cache entry 'path' (a file or a directory).
+    '''
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, f))
+               for root, _, files in os.walk(path) for f in files)
+
+
+def evict_lru(path, max_size):
+    '''
+    Removes the least recently used entries of the cache directory 'path'
+    until its size is at most 'max_size' bytes. The entries used during the
+    current run are kept, even if the cache stays bigger than 'max_size'.
+
+    Parameters:
+    - path    : cache directory.
+    - max_size: maximum size in bytes, or None for no limit.
+    Output:
+    - removed : list of the removed entries.
+    '''
+    removed = []
+    if max_size is None or not os.path.exists(path):
+        return removed
+
+    entries = [os.path.join(path, e) for e in os.listdir(path)]
+    entries = sorted((os.path.getmtime(e), cache_size(e), e) for e in entries)
+    total = sum(size for _, size, _ in entries)
+    for last_use, size, entry in entries:
+        if total <= max_size or last_use >= RUN_START:
+            break
+        if os.path.isdir(entry):
+            shutil.rmtree(entry)
+        else:
+            os.remove(entry)
+        total -= size
+        removed.append(entry)
+    return removed
+
+
+def stage_dump(data, filename, compression=None):
+    '''
+    Saves the result 'data' of a stage in the cache entry 'filename', in the 
+    format given by its extension (see CACHE_EXT): a pickle for '.p', a 
+    directory of Feather/Parquet tables, .npz and .npy files otherwise (see 
+    serialization.dump, 'compression' is None, 'lz4' or 'zstd').
+    '''
+    if filename.endswith(CACHE_EXT['pickle']):
+        pickle_dump(data, filename)
+    else:
+        serialization.dump(data, filename, table_format=filename.split('.')[-1],
+                           compression=compression)
+
+
+def stage_load(filename, mmap=False):
+    '''
+    Loads the result of a stage saved by stage_dump in the cache entry 
+    'filename'. If mmap=True, its uncompressed tables and arrays are 
+    memory-mapped (see serialization.load).
+    '''
+    if filename.endswith(CACHE_EXT['pickle']):
+        return pickle_load(filename)
+    return serialization.load(filename, table_format=filename.split('.')[-1], mmap=mmap)
+
+
+def run_and_cache(fun, args, filename, recompute=False, do_print=True, max_size=None,
+                  compression=None, mmap=False, dump=None, load=None):
+    '''
+    Same as run_and_pickle, for an entry 'filename' of a cache directory
+    (see cache_filename) saved in the format given by its extension (see 
+    stage_dump), or with the functions dump(data, filename) and load(filename) 
+    if given. The entry is marked as used, and the least recently used 
+    entries of the cache are removed if it is bigger than 'max_size' bytes.
+    '''
+    start_time = time.time()
+    if do_print:
+        print('Load ', filename, end=' ... ')
+    if not recompute and os.path.exists(filename):
+        if load is None:
+            COMPUTED = stage_load(filename, mmap=mmap)
+        else:
+            COMPUTED = load(filename)
+    else:
+        if do_print:
+            print('(computing)', end=' ...')
+        COMPUTED = fun(**args)
+        if dump is None:
+            stage_dump(COMPUTED, filename, compression=compression)
+        else:
+            dump(COMPUTED, filename)
+    if do_print:
+        print('Done in', round(time.time() - start_time, 2), 'sec')
+    touch(filename)
+    evict_lru(os.path.dirname(filename), max_size)
     return COMPUTED
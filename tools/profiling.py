@@ -0,0 +1,147 @@
+import os
+import json
+import time
+import cProfile
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+try:  # Unix only, without it the peak RSS is not measured
+    import resource
+except ImportError:
+    resource = None
+
+# profiles of the stages run in the current process (see stage)
+STAGES = []
+
+
+def cpu_time():
+    '''
+    Returns the CPU time (user + system) in seconds of the current process and
+    of its terminated child processes (ex: the pools of tools/parallel.py).
+    '''
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def peak_rss():
+    '''
+    Returns the peak resident set size in MB of the current process (or of
+    its biggest terminated child process) since it started, None if unknown.
+    '''
+    if resource is None:
+        return None
+    rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+              resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return round(rss / 1024, 1)  # KB on Linux
+
+
+def describe(obj):
+    '''
+    Returns the sizes of the data 'obj' (inputs or result of a stage),
+    searched in its dictionaries, lists and tuples:
+    - rows : number of rows of its dataframes, or else of its sparse matrices,
+             or else of its arrays (ex: line ids of the subsets).
+    - nnz  : number of non zero values of its sparse matrices.
+    - vocab: size of its biggest vocabulary (values of the keys 'feat' and
+             'vocab').
+
+    Ex: obj = {'train': {'X': <5x3 sparse matrix, 7 nnz>, 'feat': ['a', 'b', 'c'],
+                         'info': <dataframe of 5 rows>}}
+
+        out = {'rows': 5, 'nnz': 7, 'vocab': 3}
+    '''
+    sizes = {'frames': 0, 'matrices': 0, 'arrays': 0, 'nnz': 0, 'vocab': 0}
+
+    def walk(obj):
+        if isinstance(obj, dict):
+            for k, v in obj.items():
+                if k in ['feat', 'vocab'] and hasattr(v, '__len__'):
+                    sizes['vocab'] = max(sizes['vocab'], len(v))
+                else:
+                    walk(v)
+        elif type(obj) in [list, tuple]:
+            for v in obj:
+                walk(v)
+        elif isinstance(obj, pd.DataFrame):
+            sizes['frames'] += obj.shape[0]
+        elif sparse.issparse(obj):
+            sizes['matrices'] += obj.shape[0]
+            sizes['nnz'] += obj.nnz
+        elif isinstance(obj, np.ndarray) and obj.ndim > 0:
+            sizes['arrays'] += obj.shape[0]
+
+    walk(obj)
+    rows = sizes['frames'] or sizes['matrices'] or sizes['arrays']
+    return {'rows': int(rows), 'nnz': int(sizes['nnz']), 'vocab': int(sizes['vocab'])}
+
+
+@contextmanager
+def stage(name, inputs=None, cprofile=None, **info):
+    '''
+    Profiles the code run in the 'with' block as the stage 'name', and adds
+    its profile to STAGES: wall and CPU time, peak RSS (see peak_rss) and the
+    sizes of 'inputs' and of the result (see describe). The block can set the
+    result with profile['result'] = result, and other information in
+    'profile'.
+
+    Parameters:
+    - name    : name of the stage.
+    - inputs  : inputs of the stage (default=None).
+    - cprofile: filename of a cProfile dump of the stage, None for no dump
+                (default=None).
+    - info    : other information on the stage (ex: cache='hit').
+    Output:
+    - profile : dictionary of the profile of the stage.
+
+    Ex: with profiling.stage('sets', inputs=DATA, cache='miss') as profile:
+            profile['result'] = sub_sets.sub_sets(P, DATA)
+    '''
+    profile = {'stage': name}
+    profile.update(info)
+    sizes_in = describe(inputs)
+
+    profiler = None
+    if cprofile is not None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    start_time = time.time()
+    start_cpu = cpu_time()
+    try:
+        yield profile
+    finally:
+        profile['wall'] = round(time.time() - start_time, 4)
+        profile['cpu'] = round(cpu_time() - start_cpu, 4)
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(os.path.dirname(cprofile) or '.', exist_ok=True)
+            profiler.dump_stats(cprofile)
+            profile['cprofile'] = cprofile
+        profile['peak_rss_mb'] = peak_rss()
+        sizes_out = describe(profile.pop('result', None))
+        profile['rows_in'] = sizes_in['rows']
+        profile['rows_out'] = sizes_out['rows']
+        profile['vocab'] = sizes_out['vocab'] or sizes_in['vocab']
+        profile['nnz'] = sizes_out['nnz'] or sizes_in['nnz']
+        STAGES.append(profile)
+
+
+def pop_stages():
+    '''
+    Returns the profiles of the stages run in the current process since the
+    last call, and forgets them (ex: to send them from a worker process).
+    '''
+    stages = STAGES[:]
+    del STAGES[:]
+    return stages
+
+
+def save(filename, run_info, stages):
+    '''
+    Saves the profile of a run in the JSON file 'filename': the information
+    'run_info' (dictionary, ex: parameters of the experiment and total time)
+    and the profiles 'stages' of its stages (see stage).
+    '''
+    with open(filename, 'w') as f:
+        json.dump(dict(run_info, stages=stages), f, indent=1, default=str)
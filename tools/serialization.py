@@ -0,0 +1,310 @@
+import os
+import shutil
+import pickle
+import zipfile
+from itertools import chain
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+try:  # optional, without it the dataframes are pickled
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as parquet
+except ImportError:
+    pa = None
+
+TABLE_FORMATS = ['feather', 'parquet']
+REMAINDER = 'remainder.p'
+
+
+class Stored():
+    '''
+    Placeholder of an object of the remainder pickle saved in its own file
+    'name' of kind 'kind' (frame/series/sparse/array).
+    '''
+
+    def __init__(self, kind, name, info=None):
+        self.kind = kind
+        self.name = name
+        self.info = info
+
+
+def npz_memmap(filename):
+    '''
+    Opens the arrays of an uncompressed .npz file 'filename' as read-only
+    memory-mapped arrays (the empty and 0-d arrays are read).
+
+    Output:
+    - arrays: dictionary with keys=array name and values=memory-mapped array.
+    '''
+    arrays = {}
+    with zipfile.ZipFile(filename) as archive, open(filename, 'rb') as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(filename + ' is compressed, it cannot be memory-mapped')
+            # the member data starts after its local header
+            f.seek(info.header_offset + 26)
+            name_len, extra_len = np.frombuffer(f.read(4), dtype='<u2')
+            f.seek(info.header_offset + 30 + int(name_len) + int(extra_len))
+
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+            name = info.filename[:-len('.npy')]
+            count = int(np.prod(shape))
+            if len(shape) == 0 or count == 0:
+                arrays[name] = np.frombuffer(f.read(count * dtype.itemsize),
+                                             dtype=dtype).reshape(shape)
+            else:
+                arrays[name] = np.memmap(filename, dtype=dtype, mode='r', offset=f.tell(),
+                                         shape=shape, order='F' if fortran else 'C')
+    return arrays
+
+
+def dict_column_to_arrays(values):
+    '''
+    Encodes a column of dictionaries with keys=str and values=int as a sparse
+    matrix: a vocabulary of the keys and the arrays indptr/indices/data.
+    The order of the keys in each dictionary is kept.
+    Returns None if the column contains other values.
+
+    Ex: values = [{'a':3, 'b':1}, {'b':2}]
+
+        out = {'vocab': 'a\nb', 'indptr': [0, 2, 3], 'indices': [0, 1, 1],
+               'data': [3, 1, 2]}
+    '''
+    if not all(type(dic) is dict for dic in values):
+        return None
+    keys = list(chain.from_iterable(values))
+    data = list(chain.from_iterable(dic.values() for dic in values))
+    vocabulary = {}
+    indices = [vocabulary.setdefault(w, len(vocabulary)) for w in keys]
+    if not all(type(w) is str and '\n' not in w for w in vocabulary) or \
+            not all(type(c) is int for c in data):
+        return None
+
+    data = np.array(data, dtype=np.int64)
+    if len(data) == 0 or (data.min() >= -2**31 and data.max() < 2**31):
+        data = data.astype(np.int32)
+    return {'vocab': np.frombuffer('\n'.join(vocabulary).encode('utf-8'), dtype=np.uint8),
+            'indptr': np.cumsum([0] + [len(dic) for dic in values], dtype=np.int64),
+            'indices': np.array(indices, dtype=np.int32),
+            'data': data}
+
+
+def arrays_to_dict_column(arrays):
+    '''
+    Decodes a column of dictionaries encoded by dict_column_to_arrays.
+    The dictionaries share the key strings of the vocabulary.
+    '''
+    indices = np.asarray(arrays['indices'])
+    vocab = bytes(arrays['vocab']).decode('utf-8')
+    vocab = np.array(vocab.split('\n') if indices.shape[0] > 0 else [], dtype=object)
+    indptr = np.asarray(arrays['indptr']).tolist()
+    keys = vocab[indices].tolist()
+    data = np.asarray(arrays['data']).tolist()
+    return [dict(zip(keys[a:b], data[a:b])) for a, b in zip(indptr[:-1], indptr[1:])]
+
+
+def is_arrow_column(values):
+    '''
+    Returns if the column 'values' (pandas series) can be converted to an
+    arrow array.
+    '''
+    if values.dtype != object:
+        return True
+    try:
+        pa.array(values, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        return False
+    return True
+
+
+def dump_frame(df, path, name, table_format, compression):
+    '''
+    Saves the dataframe 'df' in the directory 'path': the columns supported by
+    arrow in the table 'name'.feather/.parquet, the columns of word count
+    dictionaries in 'name'_<column>.npz (see dict_column_to_arrays).
+    Returns the description of the other columns, left in the remainder pickle.
+    '''
+    info = {'columns': list(df.columns), 'dicts': [], 'aliases': {}, 'pickled': {}}
+    table_columns = []
+    for i, c in enumerate(df.columns):
+        values = df[c]
+        if values.dtype == object:
+            # same objects as a previous column (ex: word_count column of sub_sets)
+            same = [d for d in df.columns[:i] if df[d].dtype == object and
+                    all(a is b for a, b in zip(values.tolist(), df[d].tolist()))]
+            if same:
+                info['aliases'][c] = same[0]
+                continue
+            arrays = dict_column_to_arrays(values.tolist())
+            if arrays is not None:
+                save = np.savez_compressed if compression else np.savez
+                save(os.path.join(path, '%s_%d.npz' % (name, len(info['dicts']))), **arrays)
+                info['dicts'].append(c)
+                continue
+        if is_arrow_column(values):
+            table_columns.append(c)
+        else:
+            info['pickled'][c] = values.tolist()
+
+    # the index is kept as a column if there is no other, to keep the number of rows
+    table = pa.Table.from_pandas(df[table_columns],
+                                 preserve_index=True if not table_columns else None)
+    filename = os.path.join(path, name + '.' + table_format)
+    if table_format == 'feather':
+        feather.write_feather(table, filename, compression=compression or 'uncompressed')
+    else:
+        parquet.write_table(table, filename, compression=compression or 'NONE')
+    return info
+
+
+def load_frame(path, name, table_format, info, mmap):
+    '''
+    Loads the dataframe 'name' saved by dump_frame in the directory 'path'.
+    '''
+    filename = os.path.join(path, name + '.' + table_format)
+    if table_format == 'feather':
+        df = feather.read_table(filename, memory_map=mmap).to_pandas()
+    else:
+        df = parquet.read_table(filename, memory_map=mmap).to_pandas()
+
+    for i, c in enumerate(info['dicts']):
+        npz = os.path.join(path, '%s_%d.npz' % (name, i))
+        arrays = npz_memmap(npz) if mmap else np.load(npz)
+        df[c] = arrays_to_dict_column(arrays)
+    for c, values in info['pickled'].items():
+        df[c] = pd.Series(values, index=df.index, dtype=object)
+    for c, d in info['aliases'].items():
+        df[c] = df[d]
+    return df[info['columns']]
+
+
+def dump_sparse(M, path, name, compression):
+    '''
+    Saves the sparse matrix 'M' in the directory 'path' as 'name'.npz.
+    '''
+    sparse.save_npz(os.path.join(path, name + '.npz'), M, compressed=compression is not None)
+
+
+def load_sparse(path, name, mmap):
+    '''
+    Loads the sparse matrix saved by dump_sparse in the directory 'path'.
+    If mmap=True, its arrays are memory-mapped (uncompressed csr/csc only).
+    '''
+    filename = os.path.join(path, name + '.npz')
+    if not mmap:
+        return sparse.load_npz(filename)
+    arrays = npz_memmap(filename)
+    fmt = bytes(arrays['format']).decode('ascii')
+    if fmt not in ['csr', 'csc']:
+        return sparse.load_npz(filename)
+    matrix = sparse.csr_matrix if fmt == 'csr' else sparse.csc_matrix
+    return matrix((arrays['data'], arrays['indices'], arrays['indptr']),
+                  shape=tuple(int(e) for e in arrays['shape']), copy=False)
+
+
+def split_object(obj, path, table_format, compression, files):
+    '''
+    Saves the dataframes, series, sparse matrices and arrays contained in 'obj'
+    (recursively in its dictionaries, lists and tuples) in the directory 'path',
+    and replaces them by Stored placeholders.
+    Returns the remainder of 'obj' to pickle.
+    '''
+    name = 'part_%d' % len(files)
+    if isinstance(obj, dict):
+        return {k: split_object(v, path, table_format, compression, files)
+                for k, v in obj.items()}
+    if type(obj) in [list, tuple]:
+        return type(obj)(split_object(v, path, table_format, compression, files)
+                         for v in obj)
+    if isinstance(obj, pd.DataFrame) and pa is not None and \
+            all(type(c) is str for c in obj.columns):
+        files.append(name)
+        return Stored('frame', name, dump_frame(obj, path, name, table_format, compression))
+    if isinstance(obj, pd.Series) and pa is not None and \
+            (obj.name is None or type(obj.name) is str):
+        files.append(name)
+        frame = obj.to_frame('series' if obj.name is None else obj.name)
+        return Stored('series', name, (obj.name, dump_frame(frame, path, name, table_format,
+                                                            compression)))
+    if sparse.issparse(obj):
+        files.append(name)
+        dump_sparse(obj, path, name, compression)
+        return Stored('sparse', name)
+    if isinstance(obj, np.ndarray) and obj.dtype != object:
+        files.append(name)
+        np.save(os.path.join(path, name + '.npy'), obj)
+        return Stored('array', name)
+    return obj
+
+
+def join_object(obj, path, table_format, mmap):
+    '''
+    Inverse of split_object: loads the objects of the Stored placeholders of
+    'obj'.
+    '''
+    if isinstance(obj, dict):
+        return {k: join_object(v, path, table_format, mmap) for k, v in obj.items()}
+    if type(obj) in [list, tuple]:
+        return type(obj)(join_object(v, path, table_format, mmap) for v in obj)
+    if not isinstance(obj, Stored):
+        return obj
+    if obj.kind == 'frame':
+        return load_frame(path, obj.name, table_format, obj.info, mmap)
+    if obj.kind == 'series':
+        series_name, info = obj.info
+        series = load_frame(path, obj.name, table_format, info, mmap).iloc[:, 0]
+        return series.rename(series_name)
+    if obj.kind == 'sparse':
+        return load_sparse(path, obj.name, mmap)
+    return np.load(os.path.join(path, obj.name + '.npy'), mmap_mode='r' if mmap else None)
+
+
+def dump(obj, path, table_format='feather', compression=None):
+    '''
+    Saves 'obj' in the directory 'path' in a columnar/binary form: the
+    dataframes in Feather or Parquet tables (the columns of word count
+    dictionaries as sparse count arrays), the sparse matrices with
+    scipy.sparse.save_npz, the numpy arrays in .npy files, and the rest in a
+    pickle with the highest protocol.
+    The directory is written next to 'path' and then renamed, so that 'path'
+    is never left half-written.
+
+    Parameters:
+    - obj         : object to save (ex: result of a stage of the pipeline).
+    - path        : directory (replaced if it exists).
+    - table_format: 'feather' or 'parquet' (default='feather').
+    - compression : None, 'lz4' or 'zstd' (default=None). The .npz files are
+                    zip compressed if not None.
+    '''
+    assert table_format in TABLE_FORMATS
+    path = path.rstrip('/')
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.mkdir(tmp_path)
+
+    remainder = split_object(obj, tmp_path, table_format, compression, [])
+    with open(os.path.join(tmp_path, REMAINDER), 'wb') as f:
+        pickle.dump((compression, remainder), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.rename(tmp_path, path)
+
+
+def load(path, table_format='feather', mmap=False):
+    '''
+    Loads the object saved by dump in the directory 'path'.
+    If mmap=True, the tables, sparse matrices and arrays are memory-mapped
+    instead of being read (only for the uncompressed files, the
+    memory-mapped arrays are read-only).
+    '''
+    with open(os.path.join(path, REMAINDER), 'rb') as f:
+        compression, remainder = pickle.load(f)
+    return join_object(remainder, path, table_format, mmap and compression is None)